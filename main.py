@@ -1,13 +1,32 @@
-from pwd_gen_tool.controller.password_controller import PasswordController
-from pwd_gen_tool.model.data_storage import create_backups
+import sys
 
 def main():
     """
     コントローラーを初期化し、アプリケーションを実行する。
+    引数でサブコマンドが指定された場合は、メニューを使わずにその操作だけを行う。
     """
+    from pwd_gen_tool.utils import profiling
+
+    try:
+        # --profileまたは環境変数が指定されていれば、終了時に処理時間の内訳を表示する
+        argv = profiling.enable_from_args(sys.argv[1:])
+    except ValueError as e:
+        print(f"エラー: {e}", file=sys.stderr)
+        sys.exit(2)
+
+    if argv:
+        # 起動時間を短くするため、コマンドラインの操作では必要なモジュールだけを読み込む
+        from pwd_gen_tool.controller.cli_controller import run_cli
+        sys.exit(run_cli(argv))
+
+    from pwd_gen_tool.controller.password_controller import PasswordController
+    from pwd_gen_tool.model.data_storage import create_backups
+    from pwd_gen_tool.model.key_cache import session_key_cache
+
     controller = PasswordController()
     controller.run_application()
     create_backups()
+    session_key_cache.clear() # 終了時にセッション中の派生キーを破棄する
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -0,0 +1,81 @@
+import argparse
+import getpass
+import os
+import sys
+
+from pwd_gen_tool.config import AGENT_IDLE_TIMEOUT, AGENT_SOCKET_ENV
+from pwd_gen_tool.agent.protocol import get_socket_path
+from pwd_gen_tool.agent.server import AgentServer
+from pwd_gen_tool.model.manager_model import PasswordManagerModel
+from pwd_gen_tool.utils import profiling
+
+def main():
+    """
+    マスターパスワードで保管庫のロックを一度だけ解除し、エージェントを起動する。
+    起動後は環境変数で示したソケット経由で、キー派生なしにパスワードを参照・変更できる。
+    """
+    parser = argparse.ArgumentParser(prog="python -m pwd_gen_tool.agent",
+                                     description="保管庫のロックを解除したまま保持するエージェントを起動します。")
+    parser.add_argument("--socket", help="ソケットのパス（省略時は環境変数またはカレントディレクトリのagent.sock）")
+    parser.add_argument("--timeout", type=int, default=AGENT_IDLE_TIMEOUT,
+                        help=f"リクエストが無い場合に終了するまでの秒数（既定: {AGENT_IDLE_TIMEOUT}）")
+    parser.add_argument("--foreground", action="store_true", help="バックグラウンドに移らずに実行する")
+    args = parser.parse_args()
+    try:
+        # 計測はフォアグラウンドで実行した場合のみ、終了時に標準エラー出力に表示される
+        profiling.enable_from_args([])
+    except ValueError as e:
+        parser.error(str(e))
+
+    socket_path = os.path.abspath(args.socket) if args.socket else get_socket_path()
+    master_password = getpass.getpass("マスターパスワードを入力してください: ")
+    server = AgentServer(None, socket_path, args.timeout)
+    try:
+        server.bind()
+    except (RuntimeError, OSError) as e:
+        print(f"エラー: {e}", file=sys.stderr)
+        sys.exit(1)
+
+    ready_fd = None
+    if not args.foreground and hasattr(os, "fork"):
+        # ssh-agentと同様に、バックグラウンドに移ってシェルに制御を戻す。
+        # fork()では呼び出したスレッドしか引き継がれないため、キーのキャッシュの消去のタイマーや
+        # 保存のスレッドが動き出す前、ロックを解除する前にforkし、ロックの解除は子プロセスで行う
+        read_fd, ready_fd = os.pipe()
+        pid = os.fork()
+        if pid > 0:
+            os.close(ready_fd)
+            with os.fdopen(read_fd, 'rb') as reader:
+                error = reader.read().decode('utf-8')
+            if error:
+                print(f"エラー: {error}", file=sys.stderr)
+                sys.exit(1)
+            print(f"{AGENT_SOCKET_ENV}={socket_path}; export {AGENT_SOCKET_ENV};")
+            print(f"echo エージェントを起動しました（pid {pid}）;")
+            os._exit(0)
+        os.close(read_fd)
+        os.setsid()
+        devnull = os.open(os.devnull, os.O_RDWR)
+        for fd in (0, 1, 2):
+            os.dup2(devnull, fd)
+
+    try:
+        server.password_model = PasswordManagerModel(master_password)
+    except (ValueError, RuntimeError, OSError) as e:
+        server.shutdown()
+        _notify_ready(ready_fd, str(e))
+        print(f"エラー: {e}", file=sys.stderr)
+        sys.exit(1)
+    del master_password
+    _notify_ready(ready_fd)
+    server.serve_forever()
+
+def _notify_ready(ready_fd, error=""):
+    """バックグラウンドに移った場合は、ロックの解除の結果（失敗した場合はエラーメッセージ）を親プロセスに伝える。"""
+    if ready_fd is None:
+        return
+    with os.fdopen(ready_fd, 'wb') as writer:
+        writer.write(error.encode('utf-8'))
+
+if __name__ == "__main__":
+    main()
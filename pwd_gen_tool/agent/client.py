@@ -0,0 +1,59 @@
+import socket
+
+from pwd_gen_tool.agent.protocol import encode_message, read_message, get_socket_path
+
+class AgentClient:
+    """エージェントにリクエストを送り、レスポンスを受け取るクライアント。"""
+    def __init__(self, socket_path=None):
+        self.socket_path = socket_path or get_socket_path()
+        self._sock = None
+        self._reader = None
+
+    def __enter__(self):
+        self.connect()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def connect(self):
+        """エージェントに接続する。起動していない場合はConnectionErrorになる。"""
+        self._sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            self._sock.connect(self.socket_path)
+        except OSError as e:
+            self._sock.close()
+            self._sock = None
+            raise ConnectionError(f"エージェントに接続できませんでした: {e}")
+        self._reader = self._sock.makefile('rb')
+
+    def close(self):
+        if self._reader is not None:
+            self._reader.close()
+            self._reader = None
+        if self._sock is not None:
+            self._sock.close()
+            self._sock = None
+
+    def request(self, op, **params):
+        """
+        リクエストを送ってレスポンスの結果を返す。
+        エージェント側でエラーになった場合はValueErrorを送出する。
+        """
+        if self._sock is None:
+            self.connect()
+        self._sock.sendall(encode_message({'op': op, **params}))
+        response = read_message(self._reader)
+        if response is None:
+            raise ConnectionError("エージェントとの接続が切断されました。")
+        if not response.get('ok'):
+            raise ValueError(response.get('error', "エージェントでエラーが発生しました。"))
+        return response.get('result')
+
+def is_agent_running(socket_path=None):
+    """エージェントが起動していて応答するかを確認する。"""
+    try:
+        with AgentClient(socket_path) as client:
+            return client.request('ping') == "pong"
+    except (ConnectionError, OSError, ValueError):
+        return False
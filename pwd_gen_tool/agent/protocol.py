@@ -0,0 +1,31 @@
+import json
+import os
+
+from pwd_gen_tool.config import AGENT_SOCKET_FILE, AGENT_SOCKET_ENV
+
+# 1件のリクエスト・レスポンスの最大サイズ（バイト）
+MAX_MESSAGE_SIZE = 16 * 1024 * 1024
+
+def get_socket_path():
+    """エージェントのソケットのパスを返す。環境変数で指定されていればそれを優先する。"""
+    return os.environ.get(AGENT_SOCKET_ENV) or os.path.abspath(AGENT_SOCKET_FILE)
+
+def encode_message(message: dict) -> bytes:
+    """メッセージを改行区切りのJSONに変換する。"""
+    return json.dumps(message, ensure_ascii=False).encode('utf-8') + b"\n"
+
+def decode_message(line: bytes) -> dict:
+    """改行区切りのJSONをメッセージに変換する。"""
+    message = json.loads(line.decode('utf-8'))
+    if not isinstance(message, dict):
+        raise ValueError("メッセージの形式が正しくありません。")
+    return message
+
+def read_message(stream):
+    """ストリームからメッセージを1件読み込む。接続が閉じられた場合はNoneを返す。"""
+    line = stream.readline(MAX_MESSAGE_SIZE + 1)
+    if not line:
+        return None
+    if len(line) > MAX_MESSAGE_SIZE or not line.endswith(b"\n"):
+        raise ValueError("メッセージが大きすぎるか、途中で切れています。")
+    return decode_message(line)
@@ -0,0 +1,192 @@
+import os
+import socket
+import struct
+import time
+
+from pwd_gen_tool.config import AGENT_IDLE_TIMEOUT, AGENT_REQUEST_TIMEOUT, SEARCH_RESULT_LIMIT
+from pwd_gen_tool.agent.protocol import encode_message, read_message
+from pwd_gen_tool.model.key_cache import session_key_cache
+
+# 他のセッションでの変更を取り込んでから応える、読み取りの操作
+_READ_OPS = frozenset({'get', 'search', 'breaches', 'audit', 'list'})
+
+class AgentServer:
+    """
+    ロック解除済みのPasswordManagerModelをメモリに保持し、
+    Unixドメインソケット経由で検索・取得・変更のリクエストに応える常駐サーバー。
+    ソケットは所有者だけが接続できる権限で作成し、接続元のユーザーも確認する。
+    """
+    def __init__(self, password_model, socket_path, idle_timeout=AGENT_IDLE_TIMEOUT,
+                 request_timeout=AGENT_REQUEST_TIMEOUT):
+        self.password_model = password_model
+        self.socket_path = socket_path
+        self.idle_timeout = idle_timeout
+        self.request_timeout = request_timeout
+        self._running = False
+        self._handlers = {
+            'ping': self._handle_ping,
+            'get': self._handle_get,
+            'search': self._handle_search,
+            'breaches': self._handle_breaches,
+            'audit': self._handle_audit,
+            'list': self._handle_list,
+            'add': self._handle_add,
+            'update': self._handle_update,
+            'delete': self._handle_delete,
+            'stop': self._handle_stop,
+        }
+
+    def bind(self):
+        """ソケットを作成して待ち受けを開始する。"""
+        if os.path.exists(self.socket_path):
+            if _is_socket_alive(self.socket_path):
+                raise RuntimeError(f"エージェントは既に起動しています: {self.socket_path}")
+            os.remove(self.socket_path) # 前回異常終了したときのソケットを削除する
+
+        self._server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        # 作成と同時に所有者以外が読み書きできない権限にする
+        old_umask = os.umask(0o177)
+        try:
+            self._server.bind(self.socket_path)
+        finally:
+            os.umask(old_umask)
+        self._server.listen()
+
+    def serve_forever(self):
+        """リクエストを処理する。一定時間リクエストが無いか、停止を要求されたら終了する。"""
+        self._running = True
+        last_activity = time.monotonic()
+        try:
+            while self._running:
+                remaining = self.idle_timeout - (time.monotonic() - last_activity)
+                if remaining <= 0:
+                    break
+                self._server.settimeout(remaining)
+                try:
+                    conn, _ = self._server.accept()
+                except socket.timeout:
+                    continue
+                with conn:
+                    # 接続は1つずつ処理するため、接続したまま何も送らないクライアントは短い時間で切断し、
+                    # 他の接続を待たせないようにする
+                    conn.settimeout(self.request_timeout)
+                    if _is_same_user(conn):
+                        self._serve_connection(conn)
+                last_activity = time.monotonic()
+        finally:
+            self.shutdown()
+
+    def shutdown(self):
+        """ソケットを閉じ、変更を保存してメモリ上のキーを破棄する。"""
+        self._running = False
+        try:
+            self._server.close()
+        finally:
+            if os.path.exists(self.socket_path):
+                os.remove(self.socket_path)
+            try:
+                if self.password_model is not None: # ロックを解除する前に終了した場合はNone
+                    self.password_model.close()
+            finally:
+                session_key_cache.clear()
+
+    def _serve_connection(self, conn):
+        """1つの接続で送られてくるリクエストを順に処理する。"""
+        with conn.makefile('rb') as reader:
+            while self._running:
+                try:
+                    request = read_message(reader)
+                    if request is None:
+                        return
+                    conn.sendall(encode_message(self._dispatch(request)))
+                except ValueError as e:
+                    conn.sendall(encode_message({'ok': False, 'error': str(e)}))
+                    return
+                except OSError:
+                    return # タイムアウト、またはクライアントが切断した
+
+    def _dispatch(self, request):
+        """リクエストを対応するハンドラに振り分け、レスポンスを作る。"""
+        handler = self._handlers.get(request.get('op'))
+        if handler is None:
+            return {'ok': False, 'error': f"不明な操作です: {request.get('op')}"}
+        if request.get('op') in _READ_OPS:
+            # 他のセッションが保管庫を更新していれば、古いパスワードを返さないよう先に取り込む
+            try:
+                self.password_model.refresh()
+            except (ValueError, RuntimeError) as e:
+                return {'ok': False, 'error': str(e)}
+        try:
+            return {'ok': True, 'result': handler(request)}
+        except (KeyError, TypeError):
+            return {'ok': False, 'error': "リクエストの形式が正しくありません。"}
+        except ValueError as e:
+            return {'ok': False, 'error': str(e)}
+        except RuntimeError as e: # モデルからの保存エラー
+            return {'ok': False, 'error': f"パスワードの保存に失敗しました: {e}"}
+
+    def _handle_ping(self, request):
+        return "pong"
+
+    def _handle_get(self, request):
+        service_name, account_id, password = self.password_model.get_password(request['service_name'])
+        if service_name is None:
+            raise ValueError(f"サービス名 '{request['service_name']}' が見つかりません。")
+        return [service_name, account_id, password]
+
+    def _handle_search(self, request):
+        limit = request.get('limit', SEARCH_RESULT_LIMIT)
+        found_passwords = self.password_model.search_passwords(request['search_term'], limit)
+        if not request.get('passwords'):
+            return [list(found) for found in found_passwords]
+        # パスワードを要求された場合だけ復号して末尾に付ける
+        return [list(found) + [self.password_model.get_password(found[0])[2]] for found in found_passwords]
+
+    def _handle_breaches(self, request):
+        from pwd_gen_tool.model.breach_checker import BreachChecker
+
+        try:
+            with BreachChecker(request['corpus']) as breach_checker:
+                return [list(found) for found in self.password_model.find_breached_passwords(breach_checker)]
+        except OSError as e:
+            raise ValueError(str(e))
+
+    def _handle_audit(self, request):
+        # エージェントは診断結果を保持し続けるため、2回目以降は変更されたパスワードだけを推定し直す
+        return [list(result) for result in self.password_model.audit_passwords()]
+
+    def _handle_list(self, request):
+        return self.password_model.get_all_service_names()
+
+    def _handle_add(self, request):
+        self.password_model.add_password(request['service_name'], request['account_id'], request['password'])
+
+    def _handle_update(self, request):
+        self.password_model.update_password(
+            request['original_service_name'], request['service_name'], request['account_id'], request['password']
+        )
+
+    def _handle_delete(self, request):
+        self.password_model.delete_password(request['service_name'])
+
+    def _handle_stop(self, request):
+        self._running = False
+
+def _is_socket_alive(socket_path):
+    """ソケットの先でエージェントが動いているかを確認する。"""
+    probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        probe.connect(socket_path)
+        return True
+    except OSError:
+        return False
+    finally:
+        probe.close()
+
+def _is_same_user(conn):
+    """接続元がエージェントと同じユーザーかを確認する（SO_PEERCREDが使える環境のみ）。"""
+    if not hasattr(socket, 'SO_PEERCRED'):
+        return True
+    credentials = conn.getsockopt(socket.SOL_SOCKET, socket.SO_PEERCRED, struct.calcsize('3i'))
+    _, uid, _ = struct.unpack('3i', credentials)
+    return uid == os.getuid()
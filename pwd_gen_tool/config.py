@@ -5,12 +5,107 @@ PASSWORD_FILE = "passwords.dat"
 PASSWORD_MIN_LENGTH = 8
 PASSWORD_MAX_LENGTH = 32
 
-# 暗号化キー派生関数の設定（PBKDF2HMACの繰り返し回数）
-KDF_ITERATIONS = 480000
+# 暗号化キー派生関数の設定
+# 新しく保存するキースロットで使うアルゴリズム（"pbkdf2"、"scrypt"、"argon2id"）
+# calibrateコマンドで作成したKDF_PROFILE_FILEがある場合は、そちらの設定が優先される
+KDF_ALGORITHM = "pbkdf2"
+KDF_ITERATIONS = 480000 # PBKDF2HMACの繰り返し回数
+KDF_SCRYPT_N = 2 ** 17 # scryptのコストパラメータ（2のべき乗）
+KDF_SCRYPT_R = 8 # scryptのブロックサイズ
+KDF_SCRYPT_P = 1 # scryptの並列度
+KDF_ARGON2_ITERATIONS = 3 # Argon2idの繰り返し回数
+KDF_ARGON2_MEMORY_KIB = 64 * 1024 # Argon2idのメモリ使用量（KiB）
+KDF_ARGON2_LANES = 4 # Argon2idの並列度
+KDF_PROFILE_FILE = "kdf_profile.json" # calibrateコマンドで測定した、この端末用の設定を保存するファイル名
+KDF_TARGET_UNLOCK_SECONDS = 0.5 # calibrateコマンドが目標にするロック解除の所要時間（秒）
+KDF_REHASH_ON_UNLOCK = True # ロック解除時、キースロットの設定が現在の設定と異なれば作り直す
 
-# リスト表示時の列の余白
-PASSWORD_LIST_DISPLAY_GAP = 20
+# パスワードファイルのデータ部分の形式
+PAYLOAD_CODEC = "records" # "records"（長さ付きフィールドのコンパクトな形式）、"json"（以前の形式）
+PAYLOAD_COMPRESSION = "zlib" # "records"形式で暗号化前に使う圧縮方式（"none"、"zlib"、"lzma"）
+PAYLOAD_CHUNK_SIZE = 64 * 1024 # データ部分を分割して暗号化する単位（バイト）。読み書き時のメモリ使用量の目安になる
+
+# シャード分割の設定。0より大きい場合は、サービス名のハッシュ値でパスワードを分割し、
+# シャードごとに別々に暗号化したファイルに保存する（読み込みは並列に、保存は変更のあったシャードだけ）
+VAULT_SHARD_COUNT = 0 # シャード数（0の場合は分割せず、パスワードファイル1つに保存する）
+VAULT_SHARD_DIR = "passwords.shards" # シャードファイルを保存するディレクトリ名
+
+# パスワードを1件ずつ個別に暗号化して保存し、起動時には索引（サービス名とアカウントID）だけを読み込む設定。
+# パスワードは表示などで必要になったときにだけ復号する（シャード分割しない場合のみ有効）
+VAULT_LAZY_SECRETS = False
+VAULT_RECORD_CACHE_SIZE = 16 # 復号したパスワードを保持しておく件数
+
+# 一覧表示の設定
+TABLE_MAX_COLUMN_WIDTH = 40 # 列の最大の表示幅（半角の文字数）。超える部分は「…」で省略する（パスワードの列は省略しない）
+TABLE_COLUMN_GAP = 2 # 列の間の余白（半角の文字数）
+TABLE_PAGE_SIZE = 0 # 端末に1ページで表示する行数（0の場合は端末の高さに合わせる）
+TABLE_WRITE_ROWS = 1000 # 端末以外（パイプやファイル）に出力する場合に、1回の書き込みにまとめる行数
+TABLE_WIDTH_CACHE_SIZE = 65536 # 表示幅を保持しておく文字列（全角文字などを含むもの）の数
+TABLE_MASK_PASSWORDS = True # 一覧・検索結果のパスワードを伏せ字で表示する（端末ではページャーで表示を切り替えられる）
+PASSWORD_MASK = "********" # パスワードの伏せ字（パスワードの長さが分からないよう固定の長さにする）
 
 # バックアップ設定
 BACKUP_DIR = "backups" # バックアップを保存するディレクトリ名
-MAX_BACKUP_FILES = 5 # 最大バックアップファイル数
\ No newline at end of file
+MAX_BACKUP_FILES = 5 # 世代に関係なく常に残す直近のバックアップの数
+# 世代ごとに残すバックアップの数（1時間・1日・1週間ごとに最新の1つを、新しいものから指定数だけ残す）
+BACKUP_RETENTION_HOURLY = 24
+BACKUP_RETENTION_DAILY = 7
+BACKUP_RETENTION_WEEKLY = 4
+BACKUP_VERIFY_WORKERS = 0 # バックアップの検証・復元でキー派生と復号を並列に行うプロセス数（0の場合はCPUのコア数）
+
+# セッションキーキャッシュの設定
+KEY_CACHE_TIMEOUT = 300 # 派生したキーを最後の利用から保持する秒数
+KEY_CACHE_MAX_ENTRIES = 4 # 同時に保持する派生キーの最大数
+
+# ジャーナル（変更履歴の追記ファイル）の設定
+JOURNAL_FILE = "passwords.journal" # 追加・更新・削除を追記するファイル名
+JOURNAL_MAX_RECORDS = 500 # この件数を超えたらパスワードファイルに取り込む
+JOURNAL_MAX_BYTES = 1024 * 1024 # このサイズ（バイト）を超えたらパスワードファイルに取り込む
+
+# 複数のプロセスから同じ保管庫を使う場合の排他制御の設定
+VAULT_LOCK_FILE = "passwords.lock" # 書き込み時にロックし、保管庫の世代番号を記録するファイル名
+VAULT_LOCK_TIMEOUT = 5.0 # 他のプロセスの書き込みの完了を待つ最大の秒数（超えたら失敗する）
+
+# メニュー画面での変更の保存の設定
+BACKGROUND_SAVE = True # 追加・編集・削除の保存をバックグラウンドのスレッドで行い、すぐにメニューに戻る
+SAVE_COALESCE_DELAY = 0.2 # 続けて行われた変更を1回の書き込みにまとめるために待つ秒数
+
+# 検索の設定
+SEARCH_RESULT_LIMIT = 20 # 検索結果として返す・表示する最大件数（一致度の高い順）
+SEARCH_CACHE_SIZE = 64 # 直近の検索結果を保持しておく検索語の数（パスワードを変更すると破棄する）
+
+# 漏洩したパスワードとの照合の設定
+# Have I Been Pwnedの "pwned passwords"（SHA-1版、ハッシュ値の順）をダウンロードしたファイル名。無い場合は照合しない
+BREACH_CORPUS_FILE = "pwned-passwords-sha1-ordered-by-hash.txt"
+
+# パスワードの診断（auditコマンド）の設定
+AUDIT_MIN_LENGTH = 12 # これより短いパスワードを「短い」と判定する文字数
+AUDIT_WEAK_BITS = 50 # 推定の強さがこのビット数に満たないパスワードを「推測されやすい」と判定する
+
+# 一括インポートの進捗を表示する間隔（件数）
+IMPORT_PROGRESS_INTERVAL = 1000
+
+# エージェント（ロック解除済みの保管庫をメモリに保持する常駐プロセス）の設定
+AGENT_SOCKET_FILE = "agent.sock" # エージェントと通信するUnixドメインソケットのファイル名
+AGENT_SOCKET_ENV = "PWD_GEN_TOOL_AGENT_SOCK" # ソケットのパスを指定する環境変数名
+AGENT_IDLE_TIMEOUT = 900 # この秒数の間リクエストが無ければエージェントを終了する
+AGENT_REQUEST_TIMEOUT = 5 # 接続したクライアントがこの秒数の間リクエストを送らなければ切断する
+
+# コマンドラインからの実行の設定
+MASTER_PASSWORD_ENV = "PWD_GEN_TOOL_MASTER_PASSWORD" # マスターパスワードを渡す環境変数名
+CLI_STARTUP_BUDGET_MS = 150 # generateコマンドの起動から終了までの時間の上限（ミリ秒）
+
+# ベンチマーク（scripts/run_benchmarks.py）の設定
+BENCHMARK_SIZES = (1000, 10000, 100000, 1000000) # 計測に使う合成した保管庫の件数
+BENCHMARK_KDF_ITERATIONS = 1000 # 計測用の保管庫でだけ使うPBKDF2の繰り返し回数（実際の保管庫の設定には影響しない）
+BENCHMARK_BASELINE_FILE = "benchmark_baseline.json" # 比較の基準にする計測結果のファイル名
+BENCHMARK_TIME_THRESHOLD = 0.2 # 処理時間（中央値）が基準からこの割合を超えて増えたら性能の低下と判定する
+BENCHMARK_MEMORY_THRESHOLD = 0.2 # ピークのメモリ使用量が基準からこの割合を超えて増えたら性能の低下と判定する
+BENCHMARK_PASSES = 3 # 各項目を計測する回数。処理時間は最も速かった回の中央値、メモリ使用量は各回の中央値を使う
+BENCHMARK_MIN_TIME_DIFF_MS = 0.05 # 揺らぎとして無視する処理時間の増加の下限（ミリ秒）
+BENCHMARK_MIN_TIME_DIFF_MS_PER_ITEM = 0.0005 # 同じく、1回で処理する1件あたりの分（件数の多い計測ほど大きな差を許容する）
+BENCHMARK_MIN_MEMORY_DIFF_KIB = 64 # 揺らぎとして無視するメモリ使用量の増加の下限（KiB）
+BENCHMARK_MIN_MEMORY_DIFF_KIB_PER_ITEM = 0.25 # 同じく、1回で処理する1件あたりの分
+
+# 処理時間の計測（--profileオプションと同じ）を有効にする環境変数名。"1"・"text"で表形式、"json"でJSON形式で出力する
+PROFILE_ENV = "PWD_GEN_TOOL_PROFILE"
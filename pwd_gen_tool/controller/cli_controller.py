@@ -0,0 +1,447 @@
+import argparse
+import os
+import sys
+
+from pwd_gen_tool.config import (
+    PASSWORD_MIN_LENGTH, PASSWORD_MAX_LENGTH, MASTER_PASSWORD_ENV, AGENT_SOCKET_ENV,
+    KDF_ALGORITHM, KDF_TARGET_UNLOCK_SECONDS, SEARCH_RESULT_LIMIT, BREACH_CORPUS_FILE
+)
+
+# 起動時間を短くするため、暗号化ライブラリやモデルは必要になったサブコマンドの中でだけインポートする
+
+class CliError(Exception):
+    """コマンドラインからの操作が失敗した場合の例外。メッセージを表示して終了コード1で終了する。"""
+
+class CliController:
+    """
+    メニューを使わずに1回の操作だけを行うコマンドラインのコントローラー。
+    エージェントが起動していればエージェント経由で、そうでなければ保管庫を直接開いて操作する。
+    """
+    def __init__(self, stdin=None, stdout=None, stderr=None):
+        self.stdin = stdin or sys.stdin
+        self.stdout = stdout or sys.stdout
+        self.stderr = stderr or sys.stderr
+
+    def run(self, argv):
+        """コマンドライン引数を解析してサブコマンドを実行し、終了コードを返す。"""
+        args = self._build_parser().parse_args(argv)
+        try:
+            args.handler(args)
+        except CliError as e:
+            print(f"エラー: {e}", file=self.stderr)
+            return 1
+        return 0
+
+    def _build_parser(self):
+        parser = argparse.ArgumentParser(prog="main.py", description="パスワード生成・管理ツール")
+        subparsers = parser.add_subparsers(dest="command", required=True)
+
+        master_password_options = argparse.ArgumentParser(add_help=False)
+        group = master_password_options.add_argument_group("マスターパスワードの指定（エージェントが起動していない場合）")
+        group.add_argument("--password-stdin", action="store_true",
+                           help="標準入力の1行目からマスターパスワードを読み込む")
+        group.add_argument("--password-fd", type=int, metavar="FD",
+                           help="ファイルディスクリプタFDからマスターパスワードを読み込む")
+        group.add_argument("--no-agent", action="store_true", help="エージェントを使わずに保管庫を直接開く")
+
+        get_parser = subparsers.add_parser("get", parents=[master_password_options],
+                                           help="サービス名を指定してパスワードを表示する")
+        get_parser.add_argument("service_name", help="サービス名")
+        get_parser.set_defaults(handler=self._handle_get)
+
+        search_parser = subparsers.add_parser("search", parents=[master_password_options],
+                                              help="サービス名またはアカウントIDで検索する")
+        search_parser.add_argument("search_term", help="検索キーワード")
+        search_parser.add_argument("--show-passwords", action="store_true", help="パスワードも表示する")
+        search_parser.add_argument("--limit", type=int, default=SEARCH_RESULT_LIMIT,
+                                   help=f"一致度の高い順に表示する最大件数（既定: {SEARCH_RESULT_LIMIT}）")
+        search_parser.set_defaults(handler=self._handle_search)
+
+        list_parser = subparsers.add_parser("list", parents=[master_password_options],
+                                            help="サービス名の一覧を表示する")
+        list_parser.set_defaults(handler=self._handle_list)
+
+        add_parser = subparsers.add_parser("add", parents=[master_password_options],
+                                           help="パスワードを追加する")
+        add_parser.add_argument("service_name", help="サービス名")
+        add_parser.add_argument("account_id", help="アカウントID")
+        add_parser.add_argument("--generate", action="store_true",
+                                help="パスワードを生成して追加する（生成したパスワードを表示する）")
+        self._add_generate_options(add_parser)
+        add_parser.set_defaults(handler=self._handle_add)
+
+        breaches_parser = subparsers.add_parser("breaches", parents=[master_password_options],
+                                                help="保存されている全てのパスワードを漏洩したパスワードの一覧と照合する")
+        breaches_parser.add_argument("--corpus", default=BREACH_CORPUS_FILE,
+                                     help=f"漏洩したパスワードのSHA-1のハッシュ値の一覧（既定: {BREACH_CORPUS_FILE}）")
+        breaches_parser.set_defaults(handler=self._handle_breaches)
+
+        audit_parser = subparsers.add_parser("audit", parents=[master_password_options],
+                                             help="全てのパスワードの使い回し・長さ・強さを診断する")
+        audit_parser.add_argument("--sort", choices=["strength", "service", "reuse", "length"], default="strength",
+                                  help="並べ替えの順序（弱い順・サービス名順・使い回しの多い順・短い順、既定: strength）")
+        audit_parser.add_argument("--issues-only", action="store_true", help="問題のあるパスワードだけを表示する")
+        audit_parser.set_defaults(handler=self._handle_audit)
+
+        verify_parser = subparsers.add_parser("verify-backups", parents=[master_password_options],
+                                              help="全てのバックアップを並列に復号して検証し、現在の保管庫との差分を表示する")
+        verify_parser.add_argument("--candidates", metavar="FILE",
+                                   help="以前のマスターパスワードの候補を1行に1つずつ書いたファイル")
+        verify_parser.set_defaults(handler=self._handle_verify_backups)
+
+        restore_parser = subparsers.add_parser("restore", parents=[master_password_options],
+                                               help="バックアップから保管庫を復元する")
+        restore_parser.add_argument("timestamp", help="復元するバックアップの日時（verify-backupsで表示されるYYYYmmddHHMMSS）")
+        restore_parser.add_argument("--candidates", metavar="FILE",
+                                    help="バックアップ時点のマスターパスワードの候補を1行に1つずつ書いたファイル（並列に照合する）")
+        restore_parser.add_argument("--yes", action="store_true", help="確認せずに復元する")
+        restore_parser.set_defaults(handler=self._handle_restore)
+
+        generate_parser = subparsers.add_parser("generate", help="パスワードを生成して表示する")
+        generate_parser.add_argument("--count", type=int, default=1, help="生成する数（既定: 1）")
+        self._add_generate_options(generate_parser)
+        generate_parser.set_defaults(handler=self._handle_generate)
+
+        calibrate_parser = subparsers.add_parser(
+            "calibrate", help="この端末でのキー派生の速さを測定し、ロック解除の所要時間に合わせた設定を保存する"
+        )
+        calibrate_parser.add_argument("--algorithm", choices=["pbkdf2", "scrypt", "argon2id"], default=KDF_ALGORITHM,
+                                      help=f"キー派生関数（既定: {KDF_ALGORITHM}）")
+        calibrate_parser.add_argument("--target-ms", type=int, default=int(KDF_TARGET_UNLOCK_SECONDS * 1000),
+                                      help=f"目標とするロック解除の所要時間（ミリ秒、既定: {int(KDF_TARGET_UNLOCK_SECONDS * 1000)}）")
+        calibrate_parser.add_argument("--dry-run", action="store_true", help="測定結果を表示するだけで保存しない")
+        calibrate_parser.set_defaults(handler=self._handle_calibrate)
+
+        return parser
+
+    def _add_generate_options(self, parser):
+        parser.add_argument("--length", type=int, default=16,
+                            help=f"パスワードの長さ（{PASSWORD_MIN_LENGTH}〜{PASSWORD_MAX_LENGTH}、既定: 16）")
+        parser.add_argument("--no-uppercase", action="store_true", help="大文字を含めない")
+        parser.add_argument("--no-lowercase", action="store_true", help="小文字を含めない")
+        parser.add_argument("--no-digits", action="store_true", help="数字を含めない")
+        parser.add_argument("--no-symbols", action="store_true", help="記号を含めない")
+
+    def _handle_get(self, args):
+        if self._use_agent(args):
+            _, _, password = self._agent_request("get", service_name=args.service_name)
+        else:
+            password_model = self._open_password_model(args)
+            try:
+                service_name, _, password = password_model.get_password(args.service_name)
+            finally:
+                password_model.lock()
+            if service_name is None:
+                raise CliError(f"サービス名 '{args.service_name}' が見つかりません。")
+        print(password, file=self.stdout)
+
+    def _handle_search(self, args):
+        if self._use_agent(args):
+            found_passwords = self._agent_request("search", search_term=args.search_term, limit=args.limit,
+                                                  passwords=args.show_passwords)
+        else:
+            password_model = self._open_password_model(args)
+            try:
+                found_passwords = password_model.search_passwords(args.search_term, args.limit)
+                if args.show_passwords: # 表示する場合だけ復号する
+                    found_passwords = [found + (password_model.get_password(found[0])[2],) for found in found_passwords]
+            finally:
+                password_model.lock()
+        # 各行は (サービス名, アカウントID, 一致度) で、パスワードを表示する場合は末尾にパスワードが付く
+        for service_name, account_id, _, *password in found_passwords:
+            print("\t".join([service_name, account_id] + password), file=self.stdout)
+
+    def _handle_audit(self, args):
+        from pwd_gen_tool.model.password_audit import AuditResult, sort_audit_results
+
+        if self._use_agent(args):
+            audit_results = [AuditResult(*result) for result in self._agent_request("audit")]
+        else:
+            password_model = self._open_password_model(args)
+            try:
+                audit_results = password_model.audit_passwords()
+            finally:
+                password_model.lock()
+        problem_count = 0
+        # 列: サービス名、アカウントID、文字数、推定の強さ（ビット）、使い回しの数、弱点
+        for service_name, account_id, length, bits, issues, reuse_count in sort_audit_results(audit_results, args.sort):
+            problem_count += bool(issues)
+            if issues or not args.issues_only:
+                print(f"{service_name}\t{account_id}\t{length}\t{bits:.1f}\t{reuse_count}\t{','.join(issues)}",
+                      file=self.stdout)
+        print(f"{len(audit_results)}件中{problem_count}件に問題があります。", file=self.stderr)
+
+    def _handle_verify_backups(self, args):
+        from pwd_gen_tool.model.backup_store import BackupStore
+        from pwd_gen_tool.model.backup_verifier import diff_digests, verify_backups
+
+        backups = BackupStore().list_backups()
+        if not backups:
+            raise CliError("バックアップはありません。")
+        master_password = self._read_master_password(args)
+        candidates = [master_password] + self._read_candidates(args.candidates)
+        digest_key = os.urandom(32)
+        try:
+            backup_checks = verify_backups(backups, candidates, digest_key)
+        except OSError as e:
+            raise CliError(f"バックアップの検証に失敗しました: {e}")
+
+        vault_digests = self._vault_digests(master_password, digest_key)
+        # 列: 日時、OK/NG、件数、バックアップのみ・現在のみ・内容の違いの件数（比べられない場合は-）、エラー
+        for check in backup_checks:
+            if check.error is not None:
+                print(f"{check.timestamp}\tNG\t-\t-\t-\t-\t{check.error}", file=self.stdout)
+                continue
+            if vault_digests is None:
+                counts = ["-", "-", "-"]
+            else:
+                counts = [len(names) for names in diff_digests(check.digests, vault_digests)]
+            print("\t".join([check.timestamp, "OK", str(check.entry_count), *map(str, counts), ""]), file=self.stdout)
+        failed_count = sum(1 for check in backup_checks if check.error is not None)
+        print(f"{len(backup_checks)}件中{failed_count}件のバックアップを復号できませんでした。", file=self.stderr)
+        if failed_count:
+            raise CliError("復号できないバックアップがあります。")
+
+    def _vault_digests(self, master_password, digest_key):
+        """現在の保管庫のHMACを求める。保管庫を開けない場合は差分を表示せずに続ける。"""
+        from pwd_gen_tool.model.manager_model import PasswordManagerModel
+
+        try:
+            password_model = PasswordManagerModel(master_password)
+        except Exception as e:
+            print(f"警告: 現在の保管庫を開けないため、差分は表示しません: {e}", file=self.stderr)
+            return None
+        try:
+            return password_model.entry_digests(digest_key)
+        finally:
+            password_model.lock()
+
+    def _handle_restore(self, args):
+        from pwd_gen_tool.model.backup_store import BackupStore
+        from pwd_gen_tool.model.backup_verifier import backup_shard_files, find_master_password
+        from pwd_gen_tool.model.data_storage import restore_vault
+
+        if self._use_agent(args):
+            raise CliError("エージェントが起動しています。エージェントを停止してから復元してください。")
+        backup = next((backup for backup in BackupStore().list_backups() if backup["timestamp"] == args.timestamp), None)
+        if backup is None:
+            raise CliError(f"日時 '{args.timestamp}' のバックアップが見つかりません。")
+
+        master_password = self._read_master_password(args)
+        candidates = [master_password] + self._read_candidates(args.candidates)
+        try:
+            password_index = find_master_password(backup["path"], candidates)
+        except OSError as e:
+            raise CliError(str(e))
+        if password_index is None:
+            raise CliError("どのマスターパスワードでもバックアップを復号できませんでした。")
+        if password_index:
+            print(f"マスターパスワードの候補{password_index}で復号できました。復元後はこのマスターパスワードになります。",
+                  file=self.stderr)
+        if not args.yes:
+            raise CliError("現在の保管庫を置き換えます。よろしければ --yes を指定してください。")
+
+        try:
+            count = restore_vault(backup["path"], candidates[password_index], master_password,
+                                  backup_shard_files(backup) or None)
+        except (ValueError, OSError) as e:
+            raise CliError(f"復元に失敗しました: {e}")
+        print(f"{count}件のパスワードを復元しました（復元前の内容はバックアップしました）。", file=self.stderr)
+
+    def _read_candidates(self, path):
+        """マスターパスワードの候補のファイルを読み込む。空行は無視する。"""
+        if path is None:
+            return []
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                return [line.rstrip("\r\n") for line in f if line.rstrip("\r\n")]
+        except OSError as e:
+            raise CliError(f"候補のファイルを読み込めませんでした: {e}")
+
+    def _handle_list(self, args):
+        if self._use_agent(args):
+            service_names = self._agent_request("list")
+        else:
+            password_model = self._open_password_model(args)
+            try:
+                service_names = password_model.get_all_service_names()
+            finally:
+                password_model.lock()
+        for service_name in service_names:
+            print(service_name, file=self.stdout)
+
+    def _handle_add(self, args):
+        if self._use_agent(args):
+            password = self._entry_password(args)
+            self._agent_request("add", service_name=args.service_name, account_id=args.account_id, password=password)
+        else:
+            # 標準入力から読み込む場合は、1行目がマスターパスワード、2行目が追加するパスワードになる。
+            # 追加するパスワードの入力で失敗してもロックを解除したままにならないよう、try/finallyの中で読み込む
+            password_model = self._open_password_model(args)
+            try:
+                password = self._entry_password(args)
+                password_model.add_password(args.service_name, args.account_id, password)
+            except ValueError as e:
+                raise CliError(str(e))
+            except RuntimeError as e:
+                raise CliError(f"パスワードの保存に失敗しました: {e}")
+            finally:
+                # 1件の追加で全体を書き直さないよう、ジャーナルへの追記だけで終える
+                password_model.close(compact=False)
+
+        print(f"'{args.service_name}' のパスワードを保存しました。", file=self.stderr)
+        if args.generate:
+            print(password, file=self.stdout)
+        else:
+            self._warn_if_breached(password)
+
+    def _warn_if_breached(self, password):
+        """漏洩したパスワードの一覧があり、パスワードが含まれていれば警告を表示する。"""
+        from pwd_gen_tool.model.breach_checker import open_breach_checker
+
+        try:
+            breach_checker = open_breach_checker()
+        except (OSError, ValueError) as e:
+            print(f"警告: {e}", file=self.stderr)
+            return
+        if breach_checker is None:
+            return
+        with breach_checker:
+            breach_count = breach_checker.count(password)
+        if breach_count:
+            print(f"警告: このパスワードは過去の漏洩データに{breach_count:,}回含まれています。", file=self.stderr)
+
+    def _handle_breaches(self, args):
+        from pwd_gen_tool.model.breach_checker import BreachChecker
+
+        corpus = os.path.abspath(args.corpus) # エージェントは別の作業ディレクトリで動いていることがある
+        if not os.path.exists(corpus):
+            raise CliError(f"漏洩パスワードの一覧 '{args.corpus}' が見つかりません。")
+        if self._use_agent(args):
+            breached_passwords = self._agent_request("breaches", corpus=corpus)
+            checked_count = len(self._agent_request("list"))
+        else:
+            password_model = self._open_password_model(args)
+            try:
+                with BreachChecker(corpus) as breach_checker:
+                    breached_passwords = password_model.find_breached_passwords(breach_checker)
+                checked_count = password_model.get_password_count()
+            except (OSError, ValueError) as e:
+                raise CliError(str(e))
+            finally:
+                password_model.lock()
+        for service_name, account_id, breach_count in breached_passwords:
+            print(f"{service_name}\t{account_id}\t{breach_count}", file=self.stdout)
+        print(f"{checked_count}件中{len(breached_passwords)}件のパスワードが漏洩データに含まれています。", file=self.stderr)
+
+    def _entry_password(self, args):
+        """追加するパスワードを生成するか、入力から読み込む。"""
+        if args.generate:
+            return self._generate(args, 1)[0]
+        password = self._read_secret("追加するパスワードを入力してください: ")
+        if not password:
+            raise CliError("パスワードを入力してください。")
+        return password
+
+    def _handle_generate(self, args):
+        for password in self._generate(args, args.count):
+            print(password, file=self.stdout)
+
+    def _handle_calibrate(self, args):
+        from pwd_gen_tool.model import kdf
+
+        if args.target_ms <= 0:
+            raise CliError("目標とする所要時間は1ミリ秒以上を指定してください。")
+        print("キー派生の速さを測定しています...", file=self.stderr)
+        try:
+            params = kdf.calibrate(args.algorithm, args.target_ms / 1000)
+        except ValueError as e:
+            raise CliError(str(e))
+
+        print(f"algorithm={params.algorithm} cost={params.cost} memory={params.memory} "
+              f"parallelism={params.parallelism}", file=self.stdout)
+        if args.dry_run:
+            return
+        try:
+            kdf.save_profile(params)
+        except OSError as e:
+            raise CliError(str(e))
+        print("設定を保存しました。次回のロック解除時にキースロットがこの設定で作り直されます。", file=self.stderr)
+
+    def _generate(self, args, count):
+        """オプションで指定された条件でパスワードを生成する。"""
+        from pwd_gen_tool.model.generator_model import PasswordGeneratorModel
+
+        if not PASSWORD_MIN_LENGTH <= args.length <= PASSWORD_MAX_LENGTH:
+            raise CliError(f"パスワードの長さは{PASSWORD_MIN_LENGTH}〜{PASSWORD_MAX_LENGTH}の中から指定してください。")
+        if count < 1:
+            raise CliError("生成する数は1以上を指定してください。")
+        try:
+            return PasswordGeneratorModel().generate_many(
+                count, args.length,
+                not args.no_uppercase, not args.no_lowercase, not args.no_digits, not args.no_symbols
+            )
+        except ValueError as e:
+            raise CliError(str(e))
+
+    def _use_agent(self, args):
+        """エージェントが指定されていて応答する場合はTrueを返す。"""
+        if args.no_agent or not os.environ.get(AGENT_SOCKET_ENV):
+            return False
+        from pwd_gen_tool.agent.client import is_agent_running
+        return is_agent_running()
+
+    def _agent_request(self, op, **params):
+        from pwd_gen_tool.agent.client import AgentClient
+        try:
+            with AgentClient() as client:
+                return client.request(op, **params)
+        except (ValueError, ConnectionError) as e:
+            raise CliError(str(e))
+
+    def _open_password_model(self, args):
+        """マスターパスワードを読み込み、保管庫を開く。"""
+        from pwd_gen_tool.model.manager_model import PasswordManagerModel
+
+        master_password = self._read_master_password(args)
+        try:
+            return PasswordManagerModel(master_password)
+        except ValueError as e:
+            raise CliError(str(e))
+        except Exception as e:
+            raise CliError(f"保管庫を開けませんでした: {e}")
+
+    def _read_master_password(self, args):
+        """マスターパスワードをファイルディスクリプタ、標準入力、環境変数、端末の順に探して読み込む。"""
+        if args.password_fd is not None:
+            try:
+                with os.fdopen(args.password_fd, 'r', closefd=False) as f:
+                    return f.readline().rstrip("\r\n")
+            except OSError as e:
+                raise CliError(f"マスターパスワードを読み込めませんでした: {e}")
+        if args.password_stdin:
+            return self.stdin.readline().rstrip("\r\n")
+        if os.environ.get(MASTER_PASSWORD_ENV):
+            return os.environ[MASTER_PASSWORD_ENV]
+        return self._read_secret("マスターパスワードを入力してください: ")
+
+    def _read_secret(self, prompt):
+        """端末からは入力を表示せずに、それ以外は標準入力の次の1行から読み込む。"""
+        if self.stdin.isatty():
+            import getpass
+            return getpass.getpass(prompt)
+        line = self.stdin.readline()
+        if not line:
+            raise CliError("標準入力から読み込めませんでした。")
+        return line.rstrip("\r\n")
+
+def run_cli(argv):
+    """コマンドラインのサブコマンドを実行し、終了コードを返す。"""
+    try:
+        return CliController().run(argv)
+    except BrokenPipeError:
+        # headなどの出力先が先に終了した場合は、終了時の書き出しでも失敗しないよう
+        # 標準出力を/dev/nullに向け、トレースバックを出さずに終了する
+        devnull = os.open(os.devnull, os.O_WRONLY)
+        os.dup2(devnull, sys.stdout.fileno())
+        return 1
@@ -1,8 +1,16 @@
 import os
 
-from pwd_gen_tool.config import PASSWORD_FILE, PASSWORD_MIN_LENGTH, PASSWORD_MAX_LENGTH
+from pwd_gen_tool.config import PASSWORD_FILE, PASSWORD_MIN_LENGTH, PASSWORD_MAX_LENGTH, BACKGROUND_SAVE, BREACH_CORPUS_FILE
+from pwd_gen_tool.model.backup_store import BackupStore
+from pwd_gen_tool.model.backup_verifier import (
+    backup_shard_files, diff_digests, find_master_password, verify_backups
+)
+from pwd_gen_tool.model.breach_checker import open_breach_checker
+from pwd_gen_tool.model.data_storage import restore_vault
 from pwd_gen_tool.model.generator_model import PasswordGeneratorModel
 from pwd_gen_tool.model.manager_model import PasswordManagerModel
+from pwd_gen_tool.model.password_audit import sort_audit_results
+from pwd_gen_tool.model.transfer import detect_format, read_records, normalize_records, write_records
 from pwd_gen_tool.view.console_view import ConsoleView
 
 class PasswordController:
@@ -21,6 +29,12 @@ class PasswordController:
             {'description': 'パスワードを検索', 'handler': self._handle_search_passwords},
             {'description': 'パスワードを編集', 'handler': self._handle_edit_password},
             {'description': 'パスワードを削除', 'handler': self._handle_delete_password},
+            {'description': 'パスワードをインポート', 'handler': self._handle_import_passwords},
+            {'description': 'パスワードをエクスポート', 'handler': self._handle_export_passwords},
+            {'description': '漏洩したパスワードの確認', 'handler': self._handle_check_breaches},
+            {'description': 'パスワードの診断（使い回し・強さ）', 'handler': self._handle_audit_passwords},
+            {'description': 'バックアップの検証', 'handler': self._handle_verify_backups},
+            {'description': 'バックアップから復元', 'handler': self._handle_restore_backup},
             {'description': 'マスターパスワードの変更', 'handler': self._handle_change_master_password},
             {'description': 'アプリを終了', 'handler': None}
         ]
@@ -35,7 +49,9 @@ class PasswordController:
             master_password = self.view.get_master_password(is_first_time)
 
             # マスターパスワードを使ってPasswordManagerModelを初期化
-            self.password_model = PasswordManagerModel(master_password)
+            # 追加・編集・削除の保存はバックグラウンドで行い、暗号化や書き込みの完了を待たずにメニューに戻る
+            self.password_model = PasswordManagerModel(master_password, background_save=BACKGROUND_SAVE)
+            self.breach_checker = self._open_breach_checker()
 
         except ValueError as e:
             self.view.display_error(str(e))
@@ -46,6 +62,9 @@ class PasswordController:
             return
 
         while True:
+            # 前回の操作以降にバックグラウンドの保存で起きたエラーを表示する
+            self._display_save_errors()
+
             # display_main_menu にメニュー項目リストを渡す
             choice_num = self.view.display_main_menu(self.menu_items)
 
@@ -58,10 +77,50 @@ class PasswordController:
             handler = action_data['handler']
             if handler:
                 handler()  # 対応するハンドラメソッドを呼び出す
+                if self.password_model is None:
+                    # 復元の後に保管庫を開き直せなかった場合は、操作を続けられないため終了する
+                    self._close_breach_checker()
+                    self.view.display_message("アプリを終了します。")
+                    break
             else:  # 'アプリを終了' の項目が選択された場合
+                self._close_password_model()
+                self._close_breach_checker()
                 self.view.display_message("アプリを終了します。")
                 break
 
+    def _close_password_model(self):
+        """ジャーナルに残っている変更をパスワードファイルに取り込む。"""
+        try:
+            self.password_model.close()
+        except (ValueError, RuntimeError) as e:
+            self.view.display_error(f"パスワードの保存に失敗しました: {e}")
+        self._display_save_errors()
+
+    def _close_breach_checker(self):
+        if self.breach_checker:
+            self.breach_checker.close()
+
+    def _open_breach_checker(self):
+        """漏洩したパスワードの一覧を開く。一覧が無い場合や開けない場合はNoneを返し、照合を行わない。"""
+        try:
+            return open_breach_checker()
+        except (OSError, ValueError) as e:
+            self.view.display_error(str(e))
+            return None
+
+    def _warn_if_breached(self, password):
+        """パスワードが漏洩したパスワードの一覧にあれば警告を表示する。"""
+        if self.breach_checker is None:
+            return
+        breach_count = self.breach_checker.count(password)
+        if breach_count:
+            self.view.display_breach_warning(breach_count)
+
+    def _display_save_errors(self):
+        """バックグラウンドでの保存のエラーを表示する。"""
+        for message in self.password_model.take_save_errors():
+            self.view.display_error(message)
+
     def _handle_generate_password(self):
         """パスワード生成の処理を扱う。"""
         while True:
@@ -102,6 +161,7 @@ class PasswordController:
                     try:
                         self.password_model.add_password(service_name, account_id, generated_password)
                         self.view.display_message(f"'{service_name}' のパスワードを保存しました。")
+                        self._warn_if_breached(generated_password)
                         return
                     except ValueError as e:
                         self.view.display_error(str(e))
@@ -135,6 +195,7 @@ class PasswordController:
             try:
                 self.password_model.add_password(service_name, account_id, password)
                 self.view.display_message(f"'{service_name}' のパスワードを保存しました。")
+                self._warn_if_breached(password)
                 break
             except ValueError as e:
                 self.view.display_error(str(e))
@@ -144,8 +205,10 @@ class PasswordController:
 
     def _handle_display_passwords(self):
         """パスワード一覧表示の処理を扱う。"""
-        passwords_items = self.password_model.get_all_passwords()
-        self.view.display_passwords(passwords_items)
+        # パスワードは伏せ字で表示するため、表示を切り替えたページの分だけ復号する
+        accounts = self.password_model.get_accounts(0, self.password_model.get_password_count())
+        self.view.display_passwords(
+            accounts, lambda start, stop: [item[2] for item in self.password_model.get_passwords(start, stop)])
 
     def _handle_search_passwords(self):
         """パスワード検索の処理を扱う。"""
@@ -155,7 +218,10 @@ class PasswordController:
             return
 
         found_passwords = self.password_model.search_passwords(search_term)
-        self.view.display_search_results(search_term, found_passwords)
+        # パスワードは伏せ字で表示するため、表示を切り替えたページの分だけ復号する
+        self.view.display_search_results(
+            search_term, found_passwords,
+            lambda service_names: [self.password_model.get_password(service_name)[2] for service_name in service_names])
 
     def _handle_edit_password(self):
         """パスワード編集の処理を扱う。"""
@@ -202,6 +268,7 @@ class PasswordController:
                 self.view.display_message(f"'{original_account_id}' → '{new_account_id}' にアカウントIDを更新しました。")
             if password_changed:
                 self.view.display_message("パスワードを更新しました。")
+                self._warn_if_breached(new_password)
         except ValueError as e:
             self.view.display_error(str(e))
         except RuntimeError as e: # モデルからの保存エラー
@@ -209,7 +276,7 @@ class PasswordController:
 
     def _handle_delete_password(self):
         """パスワード削除の処理を扱う。"""
-        service_names = sorted(list(self.password_model.passwords.keys()))
+        service_names = self.password_model.get_all_service_names()
         choice_num = self.view.select_password_to_edit_delete(service_names)
 
         if choice_num == 0:
@@ -234,6 +301,135 @@ class PasswordController:
         else:
             self.view.display_message("削除をキャンセルしました。")
 
+    def _handle_import_passwords(self):
+        """CSVまたはJSON Linesファイルからのパスワード一括インポートの処理を扱う。"""
+        file_path = self.view.get_import_file_path()
+        if not file_path:
+            self.view.display_message("インポートをキャンセルしました。")
+            return
+
+        try:
+            file_format = detect_format(file_path)
+        except ValueError as e:
+            self.view.display_error(str(e))
+            return
+
+        on_duplicate = self.view.get_duplicate_policy()
+        # ファイルの読み込み、列の対応付けと検証を1件ずつ流し込み、最後に1回だけ保存する
+        entries = normalize_records(read_records(file_path, file_format))
+        try:
+            result = self.password_model.import_passwords(entries, on_duplicate, self.view.display_import_progress)
+            self.view.display_import_result(result)
+        except ValueError as e: # 他のセッションで同じサービス名が変更されていた場合
+            self.view.display_error(f"インポートを中止しました: {e}")
+        except OSError as e:
+            self.view.display_error(str(e))
+        except RuntimeError as e: # モデルからの保存エラー
+            self.view.display_error(f"インポートしたパスワードの保存に失敗しました: {e}")
+
+    def _handle_export_passwords(self):
+        """CSVまたはJSON Linesファイルへのパスワード一括エクスポートの処理を扱う。"""
+        file_path = self.view.get_export_file_path()
+        if not file_path:
+            self.view.display_message("エクスポートをキャンセルしました。")
+            return
+
+        try:
+            file_format = detect_format(file_path)
+        except ValueError as e:
+            self.view.display_error(str(e))
+            return
+
+        if not self.view.confirm_export():
+            self.view.display_message("エクスポートをキャンセルしました。")
+            return
+
+        try:
+            count = write_records(file_path, file_format, self.password_model.iter_passwords())
+            self.view.display_message(f"{count}件のパスワードを '{file_path}' にエクスポートしました。")
+        except OSError as e:
+            self.view.display_error(str(e))
+
+    def _handle_check_breaches(self):
+        """保管庫の全てのパスワードを漏洩したパスワードの一覧と照合する処理を扱う。"""
+        if self.breach_checker is None:
+            self.view.display_message(
+                f"漏洩パスワードの一覧 '{BREACH_CORPUS_FILE}' が見つからないため、確認できません。"
+                "Have I Been Pwnedの \"pwned passwords\"（SHA-1版、ハッシュ値の順）をダウンロードして配置してください。"
+            )
+            return
+
+        breached_passwords = self.password_model.find_breached_passwords(self.breach_checker)
+        self.view.display_breached_passwords(breached_passwords, self.password_model.get_password_count())
+
+    def _handle_audit_passwords(self):
+        """全てのパスワードの使い回し・長さ・強さの診断の処理を扱う。"""
+        sort_key = self.view.get_audit_sort_key()
+        audit_results = self.password_model.audit_passwords()
+        self.view.display_audit_results(sort_audit_results(audit_results, sort_key))
+
+    def _handle_verify_backups(self):
+        """全てのバックアップを並列に復号して検証し、現在の保管庫との差分を表示する処理を扱う。"""
+        backups = BackupStore().list_backups()
+        if not backups:
+            self.view.display_message("バックアップはありません。")
+            return
+
+        candidates = [self.password_model.master_password] + self.view.get_master_password_candidates()
+        self.view.display_message(f"{len(backups)}件のバックアップを検証しています...")
+        digest_key = os.urandom(32)
+        try:
+            backup_checks = verify_backups(backups, candidates, digest_key)
+        except OSError as e:
+            self.view.display_error(f"バックアップの検証に失敗しました: {e}")
+            return
+        vault_digests = self.password_model.entry_digests(digest_key)
+        backup_diffs = [diff_digests(check.digests, vault_digests) if check.error is None else None
+                        for check in backup_checks]
+        self.view.display_backup_checks(backup_checks, backup_diffs)
+
+    def _handle_restore_backup(self):
+        """バックアップから保管庫を復元する処理を扱う。"""
+        backups = BackupStore().list_backups()
+        choice_num = self.view.select_backup(backups)
+        if choice_num == 0:
+            self.view.display_message("復元をキャンセルしました。")
+            return
+        backup = backups[choice_num - 1]
+
+        # バックアップ時点のマスターパスワードが分からない場合は、候補を並列に照合する
+        candidates = [self.password_model.master_password]
+        try:
+            password_index = find_master_password(backup["path"], candidates)
+            if password_index is None:
+                candidates += self.view.get_master_password_candidates()
+                password_index = find_master_password(backup["path"], candidates)
+        except OSError as e:
+            self.view.display_error(str(e))
+            return
+        if password_index is None:
+            self.view.display_error("どのマスターパスワードでもバックアップを復号できませんでした。")
+            return
+        if not self.view.confirm_restore(backup["timestamp"]):
+            self.view.display_message("復元をキャンセルしました。")
+            return
+
+        # 保存待ちの変更を書き込んでから閉じ、復元した内容で開き直す
+        master_password = self.password_model.master_password
+        self._close_password_model()
+        try:
+            count = restore_vault(backup["path"], candidates[password_index], master_password,
+                                  backup_shard_files(backup) or None)
+            master_password = candidates[password_index]
+            self.view.display_message(f"{count}件のパスワードを復元しました。")
+        except (ValueError, OSError) as e:
+            self.view.display_error(f"復元に失敗しました: {e}")
+        try:
+            self.password_model = PasswordManagerModel(master_password, background_save=BACKGROUND_SAVE)
+        except (ValueError, RuntimeError, OSError) as e:
+            self.password_model = None
+            self.view.display_error(f"保管庫を開き直せませんでした: {e}")
+
     def _handle_change_master_password(self):
         """マスターパスワード変更の処理を扱う。"""
         self.view.display_message("\n-------- マスターパスワードの変更 --------")
@@ -0,0 +1,195 @@
+import hashlib
+import json
+import os
+import re
+import shutil
+from datetime import datetime
+
+from pwd_gen_tool.config import (
+    BACKUP_DIR, MAX_BACKUP_FILES, BACKUP_RETENTION_HOURLY, BACKUP_RETENTION_DAILY, BACKUP_RETENTION_WEEKLY
+)
+from pwd_gen_tool.utils.profiling import profiled
+
+_TIMESTAMP_FORMAT = "%Y%m%d%H%M%S"
+# 以前の形式（バックアップごとに丸ごとコピーしたファイル）のファイル名
+_LEGACY_BACKUP_PATTERN = re.compile(r"^passwords_backup_(\d{14})\.dat$")
+_HASH_CHUNK_SIZE = 1024 * 1024
+
+class BackupStore:
+    """
+    パスワードファイルの内容のハッシュ値をファイル名にして保存する、重複の無いバックアップ置き場。
+    バックアップの一覧（いつ、どの内容か）はマニフェストに記録し、同じ内容は1回だけ保存する。
+    前回から変更が無ければバックアップを作らず、古いバックアップは世代ごとの保持数に従って削除する。
+    """
+    def __init__(self, backup_dir=BACKUP_DIR):
+        self.backup_dir = backup_dir
+        self.objects_dir = os.path.join(backup_dir, "objects")
+        self.manifest_path = os.path.join(backup_dir, "manifest.json")
+
+    def list_backups(self):
+        """
+        バックアップの一覧を新しい順に返す。
+
+        Returns:
+            list: {"timestamp": "YYYYmmddHHMMSS", "hash": ハッシュ値, "size": バイト数, "path": ファイルのパス} のリスト。
+                シャード分割した保管庫のバックアップには、シャードファイルごとの
+                {"name": ファイル名, "hash": ハッシュ値, "size": バイト数, "path": ファイルのパス} のリスト "shards" が付く。
+        """
+        entries = self._load_manifest()["backups"]
+        return [
+            dict(entry, path=self.object_path(entry["hash"]),
+                 shards=[dict(shard, path=self.object_path(shard["hash"])) for shard in entry.get("shards", [])])
+            for entry in reversed(entries)
+        ]
+
+    def object_path(self, digest):
+        """ハッシュ値に対応するバックアップファイルのパスを返す。"""
+        return os.path.join(self.objects_dir, f"{digest}.dat")
+
+    def backup(self, source_path, now=None, shard_paths=()):
+        """
+        ファイルをバックアップする。前回のバックアップから内容が変わっていなければ何もしない。
+        シャード分割した保管庫の場合は、shard_pathsのシャードファイルも同じバックアップとして保存する。
+
+        Returns:
+            bool: バックアップを作成した場合はTrue。
+        """
+        os.makedirs(self.objects_dir, exist_ok=True)
+        manifest = self._load_manifest()
+        if not manifest.get("legacy_imported"):
+            self._import_legacy_backups(manifest)
+            manifest["legacy_imported"] = True
+            self._save_manifest(manifest)
+
+        stat = os.stat(source_path)
+        shard_stats = [(os.path.basename(path), os.stat(path)) for path in shard_paths]
+        last = manifest["backups"][-1] if manifest["backups"] else None
+        # サイズと更新時刻が前回と同じなら、ハッシュ値を計算するまでもなく変更無しとみなす
+        if (last is not None and last.get("size") == stat.st_size and last.get("mtime_ns") == stat.st_mtime_ns
+                and [(shard["name"], shard["size"], shard.get("mtime_ns")) for shard in last.get("shards", [])]
+                == [(name, shard_stat.st_size, shard_stat.st_mtime_ns) for name, shard_stat in shard_stats]):
+            return False
+
+        digest = _file_digest(source_path)
+        shards = [{"name": name, "hash": _file_digest(path), "size": shard_stat.st_size,
+                   "mtime_ns": shard_stat.st_mtime_ns}
+                  for path, (name, shard_stat) in zip(shard_paths, shard_stats)]
+        created = (last is None or last["hash"] != digest
+                   or _shard_hashes(last.get("shards", [])) != _shard_hashes(shards))
+        if created:
+            self._store_object(source_path, digest)
+            for path, shard in zip(shard_paths, shards):
+                self._store_object(path, shard["hash"])
+            timestamp = (now or datetime.now()).strftime(_TIMESTAMP_FORMAT)
+            entry = {"timestamp": timestamp, "hash": digest, "size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+            if shards:
+                entry["shards"] = shards
+            manifest["backups"].append(entry)
+            self._prune(manifest)
+        else:
+            # 内容は同じで更新時刻だけが変わった場合は、次回の比較のために記録だけ更新する
+            last["mtime_ns"] = stat.st_mtime_ns
+            if shards:
+                last["shards"] = shards
+        self._save_manifest(manifest)
+        return created
+
+    @profiled("backup.copy")
+    def _store_object(self, source_path, digest):
+        """内容がまだ保存されていなければ、ハッシュ値をファイル名にしてコピーする。"""
+        object_path = self.object_path(digest)
+        if not os.path.exists(object_path):
+            temp_path = object_path + ".tmp"
+            shutil.copyfile(source_path, temp_path)
+            os.replace(temp_path, object_path)
+
+    def _prune(self, manifest):
+        """世代ごとの保持数を超えたバックアップをマニフェストから外し、参照されなくなった内容を削除する。"""
+        entries = manifest["backups"]
+        newest_first = list(reversed(entries))
+        keep = set(id(entry) for entry in newest_first[:MAX_BACKUP_FILES])
+
+        tiers = [
+            (lambda ts: ts[:10], BACKUP_RETENTION_HOURLY), # 年月日時
+            (lambda ts: ts[:8], BACKUP_RETENTION_DAILY), # 年月日
+            (_week_of, BACKUP_RETENTION_WEEKLY), # 年と週番号
+        ]
+        for bucket_of, count in tiers:
+            seen_buckets = set()
+            for entry in newest_first:
+                if len(seen_buckets) >= count:
+                    break
+                bucket = bucket_of(entry["timestamp"])
+                if bucket not in seen_buckets:
+                    seen_buckets.add(bucket)
+                    keep.add(id(entry))
+
+        manifest["backups"] = [entry for entry in entries if id(entry) in keep]
+        referenced = set()
+        for entry in manifest["backups"]:
+            referenced.update(_entry_hashes(entry))
+        for entry in entries:
+            for digest in _entry_hashes(entry):
+                if digest not in referenced:
+                    referenced.add(digest) # 同じ内容を二重に削除しないようにする
+                    try:
+                        os.remove(self.object_path(digest))
+                    except FileNotFoundError:
+                        pass
+
+    def _import_legacy_backups(self, manifest):
+        """以前の形式のバックアップファイルを、重複を除いてバックアップ置き場に移す（初回のみ）。"""
+        try:
+            file_names = os.listdir(self.backup_dir)
+        except FileNotFoundError:
+            return
+        legacy_files = sorted(name for name in file_names if _LEGACY_BACKUP_PATTERN.match(name))
+        if not legacy_files:
+            return
+
+        imported = []
+        for file_name in legacy_files:
+            file_path = os.path.join(self.backup_dir, file_name)
+            digest = _file_digest(file_path)
+            object_path = self.object_path(digest)
+            if os.path.exists(object_path):
+                os.remove(file_path)
+            else:
+                os.replace(file_path, object_path)
+            timestamp = _LEGACY_BACKUP_PATTERN.match(file_name).group(1)
+            imported.append({"timestamp": timestamp, "hash": digest, "size": os.path.getsize(object_path)})
+        manifest["backups"] = sorted(manifest["backups"] + imported, key=lambda entry: entry["timestamp"])
+
+    def _load_manifest(self):
+        try:
+            with open(self.manifest_path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {"backups": [], "legacy_imported": False}
+
+    def _save_manifest(self, manifest):
+        temp_path = self.manifest_path + ".tmp"
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump(manifest, f, indent=4)
+        os.replace(temp_path, self.manifest_path)
+
+@profiled("backup.hash")
+def _file_digest(file_path):
+    """ファイルの内容のSHA-256ハッシュ値を計算する。"""
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(_HASH_CHUNK_SIZE), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def _shard_hashes(shards):
+    return [(shard["name"], shard["hash"]) for shard in shards]
+
+def _entry_hashes(entry):
+    """バックアップが参照している全ての内容のハッシュ値を返す。"""
+    return [entry["hash"]] + [shard["hash"] for shard in entry.get("shards", [])]
+
+def _week_of(timestamp):
+    """タイムスタンプから年と週番号を求める。"""
+    year, week, _ = datetime.strptime(timestamp, _TIMESTAMP_FORMAT).isocalendar()
+    return f"{year}-{week:02d}"
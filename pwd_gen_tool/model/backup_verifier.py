@@ -0,0 +1,113 @@
+"""
+バックアップの検証と、復元時のマスターパスワードの候補の照合を、プロセスプールで並列に行う。
+キー派生（PBKDF2など）と復号はCPUを使い続ける処理のため、スレッドではなくプロセスに分けて全てのコアを使う。
+各プロセスには一時的にマスターパスワードを渡すが、パスワードの内容はプロセスの外に出さず、
+鍵付きハッシュ値（HMAC）だけを返して現在の保管庫との差分を求める。
+"""
+import hmac
+import multiprocessing
+import os
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from pwd_gen_tool.config import BACKUP_VERIFY_WORKERS
+from pwd_gen_tool.model.data_storage import can_unlock_file, read_vault_file, shard_index
+from pwd_gen_tool.model.password_entry import wipe_entries
+
+# timestamp: バックアップの日時（YYYYmmddHHMMSS）
+# error: 復号できなかった場合のエラーメッセージ（成功した場合はNone）
+# entry_count: パスワードの件数
+# password_index: 復号できたマスターパスワードの候補の番号
+# digests: {サービス名: アカウントIDとパスワードのHMAC}
+BackupCheck = namedtuple("BackupCheck", ["timestamp", "error", "entry_count", "password_index", "digests"])
+
+# 現在の保管庫に対して、バックアップから復元すると戻るもの（only_in_backup）・消えるもの（only_in_vault）・
+# 内容が変わるもの（changed）のサービス名のリスト
+BackupDiff = namedtuple("BackupDiff", ["only_in_backup", "only_in_vault", "changed"])
+
+def entry_digests(passwords: dict, key: bytes) -> dict:
+    """{サービス名: PasswordEntry} から、{サービス名: アカウントIDとパスワードのHMAC} を作る。"""
+    digests = {}
+    for service_name, entry in passwords.items():
+        mac = hmac.new(key, entry.account_id.encode('utf-8'), "sha256")
+        mac.update(b"\x00")
+        mac.update(entry.secret())
+        digests[service_name] = mac.digest()
+    return digests
+
+def diff_digests(backup_digests: dict, vault_digests: dict) -> BackupDiff:
+    """バックアップと現在の保管庫のHMACを比べ、サービス名順の差分を返す。"""
+    return BackupDiff(
+        sorted(backup_digests.keys() - vault_digests.keys()),
+        sorted(vault_digests.keys() - backup_digests.keys()),
+        sorted(name for name in backup_digests.keys() & vault_digests.keys()
+               if backup_digests[name] != vault_digests[name]),
+    )
+
+def backup_shard_files(backup: dict) -> dict:
+    """BackupStore.list_backups()の1件から、{シャード番号: バックアップのシャードファイルのパス} を作る。"""
+    return {shard_index(shard["name"]): shard["path"] for shard in backup.get("shards", [])}
+
+def verify_backups(backups, master_passwords, digest_key: bytes, max_workers: int = BACKUP_VERIFY_WORKERS) -> list:
+    """
+    バックアップを並列に復号して検証する。
+
+    Args:
+        backups: BackupStore.list_backups()の結果。
+        master_passwords (list): マスターパスワードの候補。各バックアップで順に試す。
+        digest_key (bytes): 差分を求めるためのHMACの鍵。
+
+    Returns:
+        list: backupsと同じ順のBackupCheckのリスト。
+    """
+    tasks = [(backup["timestamp"], backup["path"], backup_shard_files(backup)) for backup in backups]
+    if not tasks:
+        return []
+    with _process_pool(len(tasks), max_workers) as executor:
+        futures = [executor.submit(_verify_backup, timestamp, path, shard_files, master_passwords, digest_key)
+                   for timestamp, path, shard_files in tasks]
+        return [future.result() for future in futures]
+
+def find_master_password(path: str, candidates, max_workers: int = BACKUP_VERIFY_WORKERS):
+    """
+    パスワードファイルを開けるマスターパスワードを候補の中から並列に探す。
+    見つかった時点で残りの候補の照合は取りやめる。
+
+    Returns:
+        int: 見つかった候補の番号。どの候補でも開けない場合はNone。
+    """
+    candidates = list(candidates)
+    if not candidates:
+        return None
+    with _process_pool(len(candidates), max_workers) as executor:
+        futures = {executor.submit(can_unlock_file, path, candidate): index for index, candidate in enumerate(candidates)}
+        for future in as_completed(futures):
+            if future.result():
+                executor.shutdown(wait=False, cancel_futures=True)
+                return futures[future]
+    return None
+
+def _process_pool(task_count: int, max_workers: int) -> ProcessPoolExecutor:
+    workers = min(task_count, max_workers or os.cpu_count() or 1)
+    # 保存のスレッドなどが動いているプロセスをforkすると、ロックを取得したままの状態が複製されるため、
+    # 新しいインタープリターで起動する
+    return ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"))
+
+def _verify_backup(timestamp, path, shard_files, master_passwords, digest_key) -> BackupCheck:
+    """プロセスプールで実行する。候補のマスターパスワードで順に復号を試す。"""
+    error = "マスターパスワードが指定されていません。"
+    for index, master_password in enumerate(master_passwords):
+        try:
+            passwords = read_vault_file(path, master_password, shard_files or None)
+        except (ValueError, OSError) as e:
+            error = str(e)
+            if isinstance(e, OSError):
+                break # ファイルが読めない場合は、他の候補でも同じ結果になる
+            continue
+        try:
+            return BackupCheck(timestamp, None, len(passwords), index, entry_digests(passwords, digest_key))
+        except Exception as e: # 個別に暗号化したパスワードのレコードが破損している場合など
+            return BackupCheck(timestamp, f"パスワードの復号に失敗しました: {e}", 0, index, {})
+        finally:
+            wipe_entries(passwords.values(), close=True)
+    return BackupCheck(timestamp, error, 0, None, {})
@@ -0,0 +1,127 @@
+import hashlib
+import mmap
+import threading
+from bisect import bisect_left, insort
+
+from pwd_gen_tool.config import BREACH_CORPUS_FILE
+from pwd_gen_tool.utils.profiling import profiled
+
+HASH_LENGTH = 40 # SHA-1のハッシュ値の16進数の文字数
+FANOUT_HEX_DIGITS = 4 # 索引（ファンアウト表）で区切るハッシュ値の先頭の桁数
+_FANOUT_SIZE = 16 ** FANOUT_HEX_DIGITS
+
+def password_hash(password) -> bytes:
+    """パスワード（strまたはUTF-8のバイト列）のSHA-1のハッシュ値を、一覧と同じ大文字の16進数で返す。"""
+    if isinstance(password, str):
+        password = password.encode('utf-8')
+    return hashlib.sha1(password).hexdigest().upper().encode('ascii')
+
+def open_breach_checker(path: str = BREACH_CORPUS_FILE):
+    """漏洩したパスワードの一覧を開く。ファイルが無い場合はNoneを返す（照合を行わない）。"""
+    try:
+        return BreachChecker(path)
+    except FileNotFoundError:
+        return None
+
+class BreachChecker:
+    """
+    ダウンロードした漏洩パスワードの一覧（Have I Been Pwnedの "pwned passwords" のSHA-1版を
+    ハッシュ値の順に並べたテキストファイル。1行が "ハッシュ値:漏洩件数"）とパスワードを照合する。
+    ネットワークには接続しない。
+
+    ファイルは数十GBになるため読み込まずにメモリマップし、ハッシュ値の先頭4桁ごとの開始位置の表
+    （ファンアウト表）で範囲を絞ってから二分探索する。1回の照合で読むのは数ページだけになる。
+    ファンアウト表は照合に必要になった部分だけを、既に求めた隣の位置の間を二分探索して埋める。
+    """
+    def __init__(self, path: str):
+        self.path = path
+        try:
+            with open(path, 'rb') as f:
+                if not f.seek(0, 2):
+                    raise ValueError(f"漏洩パスワードの一覧 '{path}' が空です。")
+                self._data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except FileNotFoundError:
+            raise
+        except OSError as e:
+            raise OSError(f"漏洩パスワードの一覧 '{path}' を開けませんでした: {e}")
+        if hasattr(mmap, "MADV_RANDOM"):
+            self._data.madvise(mmap.MADV_RANDOM) # 先読みすると1回の照合で不要なページまで読み込むため
+        if not _is_hash(self._data[:HASH_LENGTH]):
+            self.close()
+            raise ValueError(f"'{path}' はSHA-1のハッシュ値の一覧ではありません。")
+
+        # ファンアウト表: _offsets[i]はハッシュ値の先頭4桁がi以上の最初の行の位置。求めた位置だけを_knownに持つ
+        self._offsets = {0: 0, _FANOUT_SIZE: len(self._data)}
+        self._known = [0, _FANOUT_SIZE]
+        self._lock = threading.Lock()
+
+    def count(self, password) -> int:
+        """パスワードが漏洩した件数を返す。一覧に無ければ0を返す。"""
+        return self.count_hash(password_hash(password))
+
+    def count_hash(self, digest: bytes) -> int:
+        """SHA-1のハッシュ値（大文字の16進数）が漏洩した件数を返す。一覧に無ければ0を返す。"""
+        prefix = int(digest[:FANOUT_HEX_DIGITS], 16)
+        with self._lock:
+            start = self._fanout(prefix)
+            stop = self._fanout(prefix + 1)
+        position = self._lower_bound(digest, start, stop)
+        if position >= stop or self._data[position:position + HASH_LENGTH] != digest:
+            return 0
+        end = self._data.find(b"\n", position, stop)
+        line = self._data[position + HASH_LENGTH:end if end != -1 else stop]
+        count = line.strip().lstrip(b":")
+        return int(count) if count.isdigit() else 1
+
+    @profiled("breach.count_hashes")
+    def count_hashes(self, digests) -> list:
+        """
+        複数のハッシュ値の漏洩件数を、digestsと同じ順のリストで返す。
+        ハッシュ値の順に照合して、ファンアウト表の同じ部分やファイルの近くのページを続けて使う。
+        """
+        digests = list(digests)
+        counts = [0] * len(digests)
+        for index in sorted(range(len(digests)), key=digests.__getitem__):
+            counts[index] = self.count_hash(digests[index])
+        return counts
+
+    def close(self):
+        self._data.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+        return False
+
+    def _fanout(self, prefix: int) -> int:
+        """ハッシュ値の先頭4桁がprefix以上の最初の行の位置を、前後の求めた位置の間を二分探索して求める。"""
+        offset = self._offsets.get(prefix)
+        if offset is None:
+            index = bisect_left(self._known, prefix)
+            lower, upper = self._known[index - 1], self._known[index]
+            key = b"%0*X" % (FANOUT_HEX_DIGITS, prefix)
+            offset = self._lower_bound(key, self._offsets[lower], self._offsets[upper])
+            self._offsets[prefix] = offset
+            insort(self._known, prefix)
+        return offset
+
+    def _lower_bound(self, key: bytes, start: int, stop: int) -> int:
+        """
+        行頭の位置startからstopの間で、ハッシュ値がkey以上の最初の行の位置を返す。
+        行の長さは件数の桁数によって異なるため、真ん中の位置を含む行の先頭に戻ってから比べる。
+        """
+        data = self._data
+        while start < stop:
+            middle = (start + stop) // 2
+            line_start = data.rfind(b"\n", start, middle) + 1 or start
+            line_end = data.find(b"\n", line_start, stop)
+            if data[line_start:line_start + HASH_LENGTH] < key:
+                start = line_end + 1 if line_end != -1 else stop
+            else:
+                stop = line_start
+        return start
+
+def _is_hash(value: bytes) -> bool:
+    return len(value) == HASH_LENGTH and all(char in b"0123456789ABCDEF" for char in value)
@@ -0,0 +1,132 @@
+import base64
+import os
+import struct
+
+from cryptography.exceptions import InvalidTag
+from cryptography.hazmat.primitives import hashes
+from cryptography.hazmat.primitives.ciphers.aead import ChaCha20Poly1305
+from cryptography.hazmat.primitives.kdf.hkdf import HKDF
+
+from pwd_gen_tool.config import PAYLOAD_CHUNK_SIZE
+
+# 分割暗号化したデータの先頭に置く識別子とバージョン
+CONTAINER_MAGIC = b"PWDC"
+CONTAINER_VERSION = 1
+
+_HEADER_STRUCT = struct.Struct(">4sBI16s") # 識別子、バージョン、セグメントの平文のサイズ、ファイルごとのソルト
+_TAG_SIZE = 16 # Poly1305の認証タグのサイズ
+_COUNTER_SIZE = 11 # ノンスのうちセグメント番号に使うバイト数（残りの1バイトは最終セグメントの印）
+_MAX_CHUNK_SIZE = 16 * 1024 * 1024 # 壊れたヘッダーを読んで巨大なバッファを確保しないための上限
+
+def is_container(data: bytes) -> bool:
+    """データが分割暗号化の形式で始まっているかを判定する。"""
+    return data[:len(CONTAINER_MAGIC)] == CONTAINER_MAGIC
+
+def _stream_cipher(key: bytes, salt: bytes) -> ChaCha20Poly1305:
+    """データ暗号化キーとファイルごとのソルトから、このファイル専用の暗号化キーを派生する。"""
+    hkdf = HKDF(algorithm=hashes.SHA256(), length=32, salt=salt, info=b"pwd_gen_tool chunked payload")
+    return ChaCha20Poly1305(hkdf.derive(base64.urlsafe_b64decode(key)))
+
+def _nonce(counter: int, last: bool) -> bytes:
+    """セグメント番号と最終セグメントかどうかからノンスを作る（STREAM方式）。"""
+    return counter.to_bytes(_COUNTER_SIZE, "big") + (b"\x01" if last else b"\x00")
+
+class ChunkedWriter:
+    """
+    データを固定サイズのセグメントに分けて、それぞれ認証付き暗号化（ChaCha20-Poly1305）で書き込む。
+    セグメントごとに連番のノンスを使い、最後のセグメントには印を付けるため、
+    セグメントの並べ替え・削除や、ファイルの末尾の切り詰めを読み込み時に検出できる。
+    メモリに保持するのは書き込み待ちの1セグメント分だけになる。
+    """
+    def __init__(self, f, key: bytes, chunk_size: int = PAYLOAD_CHUNK_SIZE):
+        salt = os.urandom(16)
+        self._f = f
+        self._cipher = _stream_cipher(key, salt)
+        self._chunk_size = chunk_size
+        self._buffer = bytearray()
+        self._counter = 0
+        self._closed = False
+        f.write(_HEADER_STRUCT.pack(CONTAINER_MAGIC, CONTAINER_VERSION, chunk_size, salt))
+
+    def write(self, data: bytes):
+        self._buffer += data
+        # 最後のセグメントは閉じるときに印を付けて書き込むため、常に1バイト以上を残しておく
+        while len(self._buffer) > self._chunk_size:
+            self._write_segment(bytes(self._buffer[:self._chunk_size]), last=False)
+            del self._buffer[:self._chunk_size]
+
+    def close(self):
+        """残りのデータを最後のセグメントとして書き込む。"""
+        if self._closed:
+            return
+        self._write_segment(bytes(self._buffer), last=True)
+        self._buffer = bytearray()
+        self._closed = True
+
+    def _write_segment(self, plain: bytes, last: bool):
+        self._f.write(self._cipher.encrypt(_nonce(self._counter, last), plain, None))
+        self._counter += 1
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+
+class ChunkedReader:
+    """
+    ChunkedWriterで書き込んだデータを、1セグメントずつ復号しながら読み込むファイル風のオブジェクト。
+    認証に失敗したセグメントや、最後のセグメントの印が無いまま終わったデータはValueErrorになる。
+    """
+    def __init__(self, f, key: bytes):
+        header = f.read(_HEADER_STRUCT.size)
+        if len(header) < _HEADER_STRUCT.size:
+            raise ValueError("暗号化データが破損しています。")
+        magic, version, chunk_size, salt = _HEADER_STRUCT.unpack(header)
+        if magic != CONTAINER_MAGIC or version != CONTAINER_VERSION:
+            raise ValueError(f"対応していない暗号化データの形式です: {version}")
+        if not 0 < chunk_size <= _MAX_CHUNK_SIZE:
+            raise ValueError("暗号化データが破損しています。")
+        self._f = f
+        self._cipher = _stream_cipher(key, salt)
+        self._segment_size = chunk_size + _TAG_SIZE
+        self._pending = f.read(self._segment_size) # 次に復号するセグメント
+        self._buffer = bytearray()
+        self._counter = 0
+        self._finished = False
+
+    def read(self, size: int = -1) -> bytes:
+        """最大sizeバイトを読み込む。sizeが負の場合は最後まで読み込む。"""
+        self._fill(size)
+        if size < 0:
+            size = len(self._buffer)
+        data = bytes(self._buffer[:size])
+        del self._buffer[:size]
+        return data
+
+    def peek(self, size: int) -> bytes:
+        """読み込み位置を進めずに、最大sizeバイトを返す。"""
+        self._fill(size)
+        return bytes(self._buffer[:size])
+
+    def _fill(self, size: int):
+        while (size < 0 or len(self._buffer) < size) and not self._finished:
+            self._buffer += self._next_segment()
+
+    def _next_segment(self) -> bytes:
+        segment = self._pending
+        if len(segment) < _TAG_SIZE:
+            raise ValueError("暗号化データが途中で途切れています。")
+        # 満杯のセグメントの後に続きが無い場合も、そのセグメントが最後のセグメントになる
+        self._pending = self._f.read(self._segment_size) if len(segment) == self._segment_size else b""
+        last = not self._pending
+        try:
+            plain = self._cipher.decrypt(_nonce(self._counter, last), segment, None)
+        except InvalidTag:
+            raise ValueError("暗号化データが破損しているか、途中で途切れています。")
+        if last and self._f.read(1):
+            raise ValueError("暗号化データの後ろに余分なデータがあります。")
+        self._counter += 1
+        self._finished = last
+        return plain
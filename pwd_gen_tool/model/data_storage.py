@@ -1,104 +1,766 @@
+import base64
+import hashlib
+import io
 import json
+import mmap
 import os
-import base64
+import re
 import shutil
-from datetime import datetime
+import struct
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import ExitStack
 
 from cryptography.fernet import Fernet, InvalidToken
-from cryptography.hazmat.primitives import hashes
-from cryptography.hazmat.primitives.kdf.pbkdf2 import PBKDF2HMAC
-
-from pwd_gen_tool.config import PASSWORD_FILE, KDF_ITERATIONS, BACKUP_DIR, MAX_BACKUP_FILES
-
-def _derive_key(master_password: str, salt: bytes) -> bytes:
-    """マスターパスワードとソルトから暗号化キーを生成する。"""
-    kdf = PBKDF2HMAC(
-        algorithm=hashes.SHA256(),
-        length=32,
-        salt=salt,
-        iterations=KDF_ITERATIONS,  # ハッシュ化の繰り返し回数。
-    )
-    # KDF（キー派生関数）を使ってマスターパスワードから安全なキーを生成
-    return base64.urlsafe_b64encode(kdf.derive(master_password.encode()))
 
-def load_passwords(master_password: str):
-    """暗号化されたパスワードファイルを読み込み、復号する。"""
+from pwd_gen_tool.config import (
+    PASSWORD_FILE, JOURNAL_FILE, KDF_REHASH_ON_UNLOCK, VAULT_SHARD_COUNT, VAULT_SHARD_DIR, VAULT_LAZY_SECRETS
+)
+from pwd_gen_tool.model import kdf
+from pwd_gen_tool.model.backup_store import BackupStore
+from pwd_gen_tool.model.key_cache import session_key_cache
+from pwd_gen_tool.model.journal import VaultJournal
+from pwd_gen_tool.model.chunked_aead import CONTAINER_MAGIC, ChunkedReader, ChunkedWriter, is_container
+from pwd_gen_tool.model.payload_codec import (
+    SHARD_MANIFEST_SIZE, decode_payload_stream, iter_encode_payload, decode_shard_manifest, encode_shard_manifest,
+    decode_index_stream, iter_encode_index
+)
+from pwd_gen_tool.model.password_entry import PasswordEntry, gc_paused, wipe_entries
+from pwd_gen_tool.model.record_store import RecordStore, encrypt_record, record_cipher
+from pwd_gen_tool.model.vault_header import (
+    HEADER_SIZE, SLOT_COUNT, VAULT_VERSION, KeySlot,
+    is_vault_header, pack_header, pack_slot, read_version, slot_offset, unpack_slots
+)
+from pwd_gen_tool.model.vault_lock import VaultState, read_vault_state, vault_lock, write_vault_state
+from pwd_gen_tool.utils import profiling
+
+# 読み込み中に他のプロセスが書き込んだ場合に読み込み直す回数
+_LOAD_ATTEMPTS = 3
+
+_SHARD_FILE_PATTERN = re.compile(r"^(\d{4})\.dat$")
+
+# パスワードを個別に暗号化した形式では、ヘッダーの直後に識別子と索引の位置を置き、
+# 続けてパスワードのレコード、最後に分割暗号化した索引を置く
+_INDEXED_MAGIC = b"PWDX"
+_INDEXED_PREFIX = struct.Struct(">4sQ") # 識別子、索引の位置
+
+def _get_key(master_password: str, salt: bytes, kdf_params: kdf.KdfParams) -> bytes:
+    """セッションキーキャッシュを優先し、無ければキーを派生してキャッシュする。"""
+    # 同じソルトでもKDFの設定が違えば別のキーになるため、設定もキャッシュの識別に含める
+    cache_salt = salt + kdf.pack_params(kdf_params)
+    key = session_key_cache.get(master_password, cache_salt)
+    if key is None:
+        key = kdf.derive_key(master_password, salt, kdf_params)
+        session_key_cache.put(master_password, cache_salt, key)
+    return key
+
+def _read_header():
+    """既存のパスワードファイルからヘッダーを読み込む。v2以降の形式でない場合はNoneを返す。"""
     try:
-        with open(PASSWORD_FILE, 'rb') as f: # 'rb' (バイナリ読み込み)
-            salt = f.read(16)  # ファイルの先頭16バイトはソルト
-            encrypted_data = f.read() # 残りが暗号化されたデータ
+        with open(PASSWORD_FILE, 'rb') as f:
+            header = f.read(HEADER_SIZE)
     except FileNotFoundError:
-        # 初回起動時など、ファイルが存在しない場合は空の辞書を返す
-        return {}
-    except Exception as e:
-        # FileNotFoundError以外のファイル読み込みエラー
+        return None
+    except OSError as e:
         raise OSError(f"パスワードファイルの読み込みに失敗しました: {e}")
+    return header if is_vault_header(header) else None
+
+def _wrap_data_key(master_password: str, data_key: bytes, generation: int, kdf_params=None) -> KeySlot:
+    """
+    データ暗号化キーをマスターパスワード由来のキーで暗号化し、キースロットを作る。
+    kdf_paramsを省略した場合は、現在の設定（calibrateの結果または設定ファイル）のKDFを使う。
+    """
+    kdf_params = kdf_params or kdf.target_params()
+    salt = os.urandom(16)
+    key = _get_key(master_password, salt, kdf_params)
+    # 世代番号も一緒に暗号化し、平文の世代番号が改ざんされていないか確認できるようにする
+    wrapped_key = Fernet(key).encrypt(struct.pack(">Q", generation) + data_key)
+    return KeySlot(generation, salt, wrapped_key, kdf_params)
+
+def _unlock_data_key(master_password: str, slots: list):
+    """
+    キースロットからデータ暗号化キーを取り出す。
+    新しい世代のスロットから順に試し、(データ暗号化キー, スロット番号)を返す。
+    """
+    candidates = sorted(
+        (index for index, slot in enumerate(slots) if slot is not None),
+        key=lambda index: slots[index].generation, reverse=True
+    )
+    for index in candidates:
+        slot = slots[index]
+        key = _get_key(master_password, slot.salt, slot.kdf_params)
+        try:
+            plain = Fernet(key).decrypt(slot.wrapped_key)
+        except InvalidToken:
+            continue
+        if struct.unpack(">Q", plain[:8])[0] != slot.generation:
+            continue
+        return plain[8:], index
+    raise ValueError("マスターパスワードが正しくないか、ファイルが破損しています。")
 
-    # 保存時と同じソルトとマスターパスワードからキーを再生成
-    key = _derive_key(master_password, salt)
-    fernet = Fernet(key)
+def _decrypt_token(encrypted_data: bytes, key: bytes) -> bytes:
+    """以前の形式（Fernetのトークン）の暗号化データを復号する。"""
+    # バイナリで保存したトークンは先頭がFernetのバージョン（0x80）、base64のトークンは"g"で始まる
+    if encrypted_data[:1] == b"\x80":
+        encrypted_data = base64.urlsafe_b64encode(encrypted_data)
+    return Fernet(key).decrypt(encrypted_data)
 
+def _open_payload(f, key: bytes):
+    """
+    ファイルの現在位置からの暗号化データを、復号しながら読み込むオブジェクト（read・peekメソッドを持つ）を返す。
+    以前の形式（Fernetのトークン）は分割されていないため、一度に復号する。
+    """
+    if is_container(f.peek(len(CONTAINER_MAGIC))):
+        return ChunkedReader(f, key)
+    return io.BufferedReader(io.BytesIO(_decrypt_token(f.read(), key)))
+
+def _read_payload(f, data_key: bytes, shard_files: dict = None):
+    """
+    暗号化データを読み込み、(パスワードの辞書, 取り込み済みのジャーナルの連番)を返す。
+    シャード分割した保管庫の場合は、全てのシャードを並列に読み込んでまとめる。
+    shard_files（{シャード番号: パス}）を渡した場合は、シャードファイルをそこから読み込む（バックアップ用）。
+    パスワードを個別に暗号化した保管庫の場合は、索引だけを読み込み、パスワードは参照時に復号する。
+    """
+    if _is_indexed(f):
+        return _read_indexed(f, data_key)
+    reader = _open_payload(f, data_key)
+    manifest = decode_shard_manifest(reader.peek(SHARD_MANIFEST_SIZE))
+    if manifest is None:
+        return decode_payload_stream(reader)
+    shard_count, journal_seq = manifest
+    return _load_shards(data_key, shard_count, shard_files), journal_seq
+
+def _atomic_write(path: str, write, replace=os.replace):
+    """
+    write(ファイルオブジェクト)で書き込んだ内容でファイルを置き換える。
+    一時ファイルに書き込んでから置き換えるため、途中で中断しても元のファイルは壊れない。
+    replace(一時ファイル, path)で置き換える処理を差し替えられる。
+    """
+    temp_file = path + ".tmp"
+    try:
+        # 'wb' (バイナリ書き込み)
+        with open(temp_file, 'wb') as f:
+            write(f)
+            with profiling.span("storage.fsync"):
+                f.flush()
+                os.fsync(f.fileno())
+        replace(temp_file, path)
+    except OSError as e:
+        raise OSError(f"パスワードファイルの保存に失敗しました: {e}")
+
+def _write_encrypted(path: str, header: bytes, pieces, key: bytes):
+    """
+    ヘッダーに続けて、piecesが返すバイト列を一定サイズごとに暗号化しながらファイルに書き込む。
+    メモリに保持するのは暗号化待ちの1セグメント分だけになる。
+    """
+    def write(f):
+        f.write(header)
+        with ChunkedWriter(f, key) as writer:
+            for piece in pieces:
+                writer.write(piece)
+    _atomic_write(path, write)
+
+@profiling.profiled("storage.write_payload")
+def _write_payload(header: bytes, passwords: dict, data_key: bytes, journal_seq: int, changed_names=None):
+    """
+    パスワードの辞書を設定された形式（1ファイル、またはシャード分割）で保存する。
+    シャード分割の場合、changed_namesを渡すとそのサービス名を含むシャードだけを書き直す。
+    """
+    if VAULT_SHARD_COUNT <= 0:
+        if VAULT_LAZY_SECRETS:
+            _write_indexed(header, passwords, data_key, journal_seq)
+        else:
+            _write_encrypted(PASSWORD_FILE, header, iter_encode_payload(passwords, journal_seq), data_key)
+        _remove_shards(0)
+        return
+
+    shard_count = VAULT_SHARD_COUNT
+    targets = range(shard_count)
+    if changed_names is not None and _current_shard_count(data_key) == shard_count:
+        hash_key = _shard_hash_key(data_key)
+        targets = {_shard_of(service_name, hash_key, shard_count) for service_name in changed_names}
+    # シャードを先に書き込み、最後に本体を置き換える。途中で中断しても、各シャードは置き換え前後の
+    # どちらかの完全な状態で残り、その差分はジャーナルの再適用（同じ変更を何度適用しても同じ結果）で埋まる
+    _write_shards(passwords, data_key, shard_count, targets)
+    _write_encrypted(PASSWORD_FILE, header, [encode_shard_manifest(shard_count, journal_seq)], data_key)
+    _remove_shards(shard_count)
+
+def _is_indexed(f) -> bool:
+    return f.peek(len(_INDEXED_MAGIC))[:len(_INDEXED_MAGIC)] == _INDEXED_MAGIC
+
+def _write_indexed(header: bytes, passwords: dict, data_key: bytes, journal_seq: int):
+    """
+    パスワードを1件ずつ個別に暗号化して書き込み、最後にサービス名・アカウントID・レコードの位置の索引を書き込む。
+    読み込み済みで変更の無いパスワードは、復号せずに暗号化されたまま書き写す。
+    書き写し元のファイルのメモリマップは置き換える間だけ閉じ、置き換えた後のファイルのレコードを参照させる。
+    """
+    cipher = record_cipher(data_key)
+    locations = {} # {RecordStore: {レコード番号: (サービス名, 位置, サイズ)}}
+
+    def write(f):
+        f.write(header)
+        prefix_offset = f.tell()
+        f.write(_INDEXED_PREFIX.pack(_INDEXED_MAGIC, 0)) # 索引の位置は最後に書き込む
+        index = []
+        offset = f.tell()
+        for service_name, entry in passwords.items():
+            record = entry.encrypted_record(service_name)
+            if record is None:
+                record = encrypt_record(cipher, service_name, entry.secret())
+            f.write(record)
+            index.append((service_name, entry.account_id, offset, len(record)))
+            if entry.is_lazy():
+                locations.setdefault(entry._store, {})[entry._index] = (service_name, offset, len(record))
+            offset += len(record)
+        with ChunkedWriter(f, data_key) as writer:
+            for piece in iter_encode_index(index, journal_seq):
+                writer.write(piece)
+        f.seek(prefix_offset)
+        f.write(_INDEXED_PREFIX.pack(_INDEXED_MAGIC, offset))
+
+    def replace(temp_file, path):
+        with ExitStack() as stack:
+            for store in locations:
+                stack.enter_context(store.remapping(path))
+            os.replace(temp_file, path)
+            for store, moved in locations.items():
+                store.relocate(moved)
+    _atomic_write(PASSWORD_FILE, write, replace)
+
+def _read_indexed(f, data_key: bytes):
+    """索引だけを復号し、パスワードを参照時に復号するPasswordEntryの辞書を作る。"""
+    _, index_offset = _INDEXED_PREFIX.unpack(f.read(_INDEXED_PREFIX.size))
+    # レコードはメモリマップで参照し、必要になったレコードだけをディスクから読み込む
+    mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    store = RecordStore(mapped, record_cipher(data_key))
+    try:
+        f.seek(index_offset)
+        index, journal_seq = decode_index_stream(ChunkedReader(f, data_key))
+        passwords = {}
+        with gc_paused():
+            for service_names, account_ids, offsets, sizes in index:
+                indexes = store.add_records(service_names, offsets, sizes)
+                for service_name, account_id, index in zip(service_names, account_ids, indexes):
+                    passwords[service_name] = PasswordEntry(account_id, None, store, index)
+    except BaseException:
+        store.close()
+        raise
+    return passwords, journal_seq
+
+def _create_vault(passwords: dict, master_password: str, journal_seq: int = 0):
+    """新しいデータ暗号化キーを作成し、最新の形式のパスワードファイルを作成する。"""
+    data_key = Fernet.generate_key()
+    slots = [_wrap_data_key(master_password, data_key, 1)] + [None] * (SLOT_COUNT - 1)
+    _write_payload(pack_header(slots), passwords, data_key, journal_seq)
+
+def shard_paths() -> list:
+    """現在あるシャードファイルのパスを、シャード番号の順に返す。"""
+    try:
+        file_names = os.listdir(VAULT_SHARD_DIR)
+    except FileNotFoundError:
+        return []
+    return [os.path.join(VAULT_SHARD_DIR, name) for name in sorted(file_names) if _SHARD_FILE_PATTERN.match(name)]
+
+def _shard_path(index: int) -> str:
+    return os.path.join(VAULT_SHARD_DIR, f"{index:04d}.dat")
+
+def _shard_hash_key(data_key: bytes) -> bytes:
+    # データ暗号化キーを鍵にしたハッシュ値で分割し、ファイルからはどのサービスがどのシャードにあるか分からないようにする
+    return base64.urlsafe_b64decode(data_key)
+
+def _shard_of(service_name: str, hash_key: bytes, shard_count: int) -> int:
+    """サービス名が属するシャードの番号を返す。"""
+    digest = hashlib.blake2b(service_name.encode('utf-8'), digest_size=8, key=hash_key, person=b"pwdshard").digest()
+    return int.from_bytes(digest, "big") % shard_count
+
+def _shard_key(data_key: bytes, index: int) -> bytes:
+    """
+    シャードごとの暗号化キーをデータ暗号化キーから派生する。
+    シャードファイルを別の番号のファイルと入れ替えられても、認証に失敗して検出できる。
+    """
+    digest = hashlib.blake2b(struct.pack(">H", index), digest_size=32,
+                             key=base64.urlsafe_b64decode(data_key), person=b"pwdshkey").digest()
+    return base64.urlsafe_b64encode(digest)
+
+def _current_shard_count(data_key: bytes) -> int:
+    """保存済みのパスワードファイルのシャード数を返す。シャード分割していない場合は0を返す。"""
+    try:
+        with open(PASSWORD_FILE, 'rb') as f:
+            f.seek(HEADER_SIZE)
+            if _is_indexed(f):
+                return 0
+            manifest = decode_shard_manifest(_open_payload(f, data_key).peek(SHARD_MANIFEST_SIZE))
+    except (OSError, ValueError, InvalidToken):
+        return 0
+    return manifest[0] if manifest is not None else 0
+
+def _write_shards(passwords: dict, data_key: bytes, shard_count: int, targets):
+    """指定された番号のシャードを、それぞれ別のキーで暗号化して並列に書き込む。"""
+    shards = {index: {} for index in targets}
+    if not shards:
+        return
+    hash_key = _shard_hash_key(data_key)
+    for service_name, data in passwords.items():
+        shard = shards.get(_shard_of(service_name, hash_key, shard_count))
+        if shard is not None:
+            shard[service_name] = data
+
+    def write_shard(index):
+        _write_encrypted(_shard_path(index), b"", iter_encode_payload(shards[index]), _shard_key(data_key, index))
+
+    try:
+        os.makedirs(VAULT_SHARD_DIR, exist_ok=True)
+    except OSError as e:
+        raise OSError(f"パスワードファイルの保存に失敗しました: {e}")
+    with ThreadPoolExecutor(max_workers=min(len(shards), os.cpu_count() or 1)) as executor:
+        list(executor.map(write_shard, shards))
+
+def _load_shards(data_key: bytes, shard_count: int, shard_files: dict = None) -> dict:
+    """全てのシャードをスレッドプールで並列に読み込んで復号し、1つの辞書にまとめる。"""
+    def load_shard(index):
+        path = _shard_path(index) if shard_files is None else shard_files.get(index, "")
+        try:
+            f = open(path, 'rb')
+        except OSError as e:
+            raise OSError(f"シャードファイルの読み込みに失敗しました: {e}")
+        with f:
+            entries, _ = decode_payload_stream(_open_payload(f, _shard_key(data_key, index)))
+        return entries
+
+    passwords = {}
+    with ThreadPoolExecutor(max_workers=min(shard_count, os.cpu_count() or 1)) as executor:
+        for entries in executor.map(load_shard, range(shard_count)):
+            passwords.update(entries)
+    return passwords
+
+def _remove_shards(shard_count: int):
+    """シャード数を減らした場合などに、使われなくなったシャードファイルを削除する。"""
+    for path in shard_paths():
+        if int(_SHARD_FILE_PATTERN.match(os.path.basename(path)).group(1)) >= shard_count:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+    if shard_count == 0 and os.path.isdir(VAULT_SHARD_DIR) and not os.listdir(VAULT_SHARD_DIR):
+        os.rmdir(VAULT_SHARD_DIR)
+
+def _load_legacy_passwords(master_password: str, data: bytes) -> dict:
+    """v1形式（ソルト16バイト + Fernetトークン）のパスワードファイルを復号する。"""
+    salt = data[:16]  # ファイルの先頭16バイトはソルト
+    encrypted_data = data[16:] # 残りが暗号化されたデータ
+
+    # 保存時と同じソルトとマスターパスワードからキーを再生成（セッション中は一度だけ派生する）
+    fernet = Fernet(_get_key(master_password, salt, kdf.LEGACY_PARAMS))
     try:
         # データを復号
         decrypted_data = fernet.decrypt(encrypted_data)
-        # 復号したバイナリデータをUTF-8でデコードし、JSONからPythonの辞書に変換
-        return json.loads(decrypted_data.decode('utf-8'))
     except InvalidToken:
         raise ValueError("マスターパスワードが正しくないか、ファイルが破損しています。")
+    # 復号したバイナリデータをUTF-8でデコードし、JSONからPythonの辞書に変換
+    return {service_name: PasswordEntry.from_dict(data)
+            for service_name, data in json.loads(decrypted_data.decode('utf-8')).items()}
+
+@profiling.profiled("storage.load_passwords")
+def load_passwords(master_password: str, journal: VaultJournal = None):
+    """
+    暗号化されたパスワードファイルを読み込み、復号する。
+    journalを渡した場合は、スナップショットに取り込まれていないジャーナルのレコードも適用し、
+    読み込んだ時点の保管庫の世代番号を記録する。
+    ロックは取得しないため、読み込み中に他のプロセスが書き込んだ場合は読み込み直す。
+    """
+    for attempt in range(_LOAD_ATTEMPTS):
+        state = read_vault_state()
+        passwords = _load_passwords(master_password, journal)
+        if read_vault_state() == state or attempt == _LOAD_ATTEMPTS - 1:
+            break
+        wipe_entries(passwords.values(), close=True)
+    # 読み込み直しても世代番号が変わり続けた場合は、古い世代番号のままにして次の書き込み時に同期させる
+    if journal is not None:
+        journal.generation = state.generation
+    return passwords
+
+def _load_passwords(master_password: str, journal: VaultJournal = None):
+    try:
+        f = open(PASSWORD_FILE, 'rb') # 'rb' (バイナリ読み込み)
+    except FileNotFoundError:
+        # 初回起動時など、ファイルが存在しない場合は空の辞書を返す
+        return {}
     except Exception as e:
-        raise Exception(f"ファイルの復号中に予期せぬエラーが発生しました: {e}")
+        # FileNotFoundError以外のファイル読み込みエラー
+        raise OSError(f"パスワードファイルの読み込みに失敗しました: {e}")
 
-def save_passwords(passwords: dict, master_password: str):
-    """パスワードデータを暗号化してファイルに保存する。"""
-    # 保存のたびにランダムなソルトを生成。これにより同じパスワードでも毎回違う暗号結果になる
-    salt = os.urandom(16)
-    key = _derive_key(master_password, salt)
-    fernet = Fernet(key)
+    with f:
+        header = f.read(HEADER_SIZE)
+        legacy = not is_vault_header(header)
+        if not legacy:
+            try:
+                slots = unpack_slots(header)
+                with profiling.span("storage.unlock_data_key"):
+                    data_key, active_index = _unlock_data_key(master_password, slots)
+                # データ部分は先頭から少しずつ復号・デコードし、ファイル全体を一度にメモリに読み込まない
+                with profiling.span("storage.read_payload"):
+                    passwords, journal_seq = _read_payload(f, data_key)
+            except InvalidToken:
+                raise ValueError("マスターパスワードが正しくないか、ファイルが破損しています。")
+            except (ValueError, OSError):
+                raise
+            except Exception as e:
+                raise Exception(f"ファイルの復号中に予期せぬエラーが発生しました: {e}")
 
-    # パスワードの辞書をJSON形式の文字列に変換
-    passwords_json = json.dumps(passwords, indent=4, ensure_ascii=False)
-    # JSON文字列をUTF-8でエンコードし、暗号化
-    encrypted_data = fernet.encrypt(passwords_json.encode('utf-8'))
+    if legacy:
+        # v1形式のファイルは最新の形式に移行してから、移行後のファイルを読み込む
+        _migrate_legacy_vault(master_password)
+        return _load_passwords(master_password, journal)
 
+    # 古い形式のヘッダーや、現在の設定と異なるKDFのキースロットはロック解除のついでに作り直す
+    outdated_header = read_version(header) < VAULT_VERSION
+    if outdated_header or (KDF_REHASH_ON_UNLOCK and slots[active_index].kdf_params != kdf.target_params()):
+        try:
+            with vault_lock():
+                _replace_slot(master_password, data_key, slots, active_index, header)
+        except OSError:
+            pass # 失敗しても読み込みには影響しないため、次回のロック解除時に再試行する
+
+    if journal is not None:
+        journal.replay(passwords, data_key, journal_seq)
+    return passwords
+
+def _migrate_legacy_vault(master_password: str):
+    """
+    v1形式のパスワードファイルを最新の形式に移行する。
+    ロックを取得してからv1形式のままかを確かめて読み込み直すため、他のプロセスが先に移行して書き込んでいても
+    古い内容で上書きしない。移行前のファイルはバックアップし、バックアップできない場合は移行しない。
+    """
     try:
-        # 'wb' (バイナリ書き込み)
-        with open(PASSWORD_FILE, 'wb') as f:
-            f.write(salt)  # 最初にソルトを書き込む
-            f.write(encrypted_data) # 続けて暗号化データを書き込む
+        with vault_lock():
+            try:
+                with open(PASSWORD_FILE, 'rb') as f:
+                    data = f.read()
+            except FileNotFoundError:
+                return
+            if is_vault_header(data[:HEADER_SIZE]):
+                return # 他のプロセスが移行済み
+            passwords = _load_legacy_passwords(master_password, data)
+            try:
+                BackupStore().backup(PASSWORD_FILE, shard_paths=shard_paths())
+                save_passwords(passwords, master_password)
+            finally:
+                wipe_entries(passwords.values())
     except OSError as e:
-        raise OSError(f"パスワードファイルの保存に失敗しました: {e}")
+        raise OSError(f"v1形式のパスワードファイルを移行できませんでした: {e}")
 
-def create_backups():
+@profiling.profiled("storage.save_passwords")
+def save_passwords(passwords: dict, master_password: str, journal: VaultJournal = None, journal_seq: int = None,
+                   changed_names=None):
     """
-    パスワードファイルをバックアップディレクトリにコピーし、
-    最大バックアップファイル数を超えた古いバックアップを削除する。
+    パスワードデータを暗号化してファイルに保存する。
+    journalを渡した場合は、journal_seq（省略時は最新の連番）までのレコードを取り込み済みとしてジャーナルから削除する。
+    シャード分割した保管庫では、changed_namesとジャーナルで変更されたサービス名を含むシャードだけを書き直す。
+    changed_namesがNoneの場合は全てのシャードを書き直す。
     """
-    os.makedirs(BACKUP_DIR, exist_ok=True) # backupsディレクトリが存在しない場合は作成
+    if journal_seq is None:
+        journal_seq = journal.last_seq if journal is not None else 0
+        if journal is not None and (changed_names is None or changed_names):
+            # ジャーナルに記録していない変更を含むため連番を進め、他のプロセスにパスワードファイルから読み込み直させる
+            journal_seq += 1
+    if changed_names is not None and journal is not None:
+        changed_names = set(changed_names) | journal.changed_names(journal_seq)
 
-    if not os.path.exists(PASSWORD_FILE):
-        return # passwords.datが存在しない場合はバックアップしない
+    with vault_lock():
+        _begin_write(journal, journal_seq)
+        header = _read_header()
+        if header is None:
+            # 初回保存時、またはv1形式のファイルの場合は新しい形式のファイルを作成する
+            _create_vault(passwords, master_password, journal_seq)
+        else:
+            # ヘッダーはそのまま残し、既存のデータ暗号化キーでデータ部分だけを暗号化し直す
+            data_key, _ = _unlock_data_key(master_password, unpack_slots(header))
+            _write_payload(header, passwords, data_key, journal_seq, changed_names)
 
-    # タイムスタンプ付きのバックアップファイル名を生成
-    timestamp = datetime.now().strftime("%Y%m%d%H%M%S")
-    backup_filename = f"passwords_backup_{timestamp}.dat"
-    backup_filepath = os.path.join(BACKUP_DIR, backup_filename)
+        if journal is not None:
+            journal.discard_through(journal_seq)
+            journal.last_seq = max(journal.last_seq, journal_seq)
 
-    try:
-        shutil.copy(PASSWORD_FILE, backup_filepath) # ファイルをコピー
-        # print(f"パスワードファイルが '{backup_filepath}' にバックアップされました。") # デバッグ用
-    except Exception as e:
-        print(f"バックアップファイルの作成中にエラーが発生しました: {e}")
+def append_journal(journal: VaultJournal, master_password: str, op: str, service_name: str,
+                   data: PasswordEntry = None, previous_name: str = None) -> bool:
+    """
+    1件の変更をジャーナルに追記する。パスワードファイル全体は書き換えない。
+
+    Returns:
+        bool: 追記した場合はTrue。v2以降の形式のファイルが存在せず、全体の保存が必要な場合はFalse。
+    """
+    return append_journal_changes(journal, master_password, [(op, service_name, data, previous_name)])
+
+@profiling.profiled("storage.append_journal")
+def append_journal_changes(journal: VaultJournal, master_password: str, changes) -> bool:
+    """
+    複数の変更（(op, service_name, data, previous_name) のリスト）をまとめてジャーナルに追記する。
+    ディスクへの書き込みの確定は最後に1回だけ行う。
+
+    Returns:
+        bool: 追記した場合はTrue。v2以降の形式のファイルが存在せず、全体の保存が必要な場合はFalse。
+    """
+    with vault_lock():
+        header = _read_header()
+        if header is None:
+            return False
+        data_key, _ = _unlock_data_key(master_password, unpack_slots(header))
+        _begin_write(journal)
+        journal.append_many(data_key, changes)
+    return True
+
+def sync_passwords(passwords: dict, master_password: str, journal: VaultJournal):
+    """
+    読み込んだ後に他のプロセスが保管庫に書き込んでいれば、その変更をパスワードの辞書に取り込む。
+    vault_lock()でロックを取得した状態で呼び出すこと。
+
+    Returns:
+        tuple: (最新のパスワードの辞書, 変更されたサービス名の集合)。
+            ジャーナルの追記分だけを取り込めた場合は渡された辞書をそのまま更新して返す。
+            他のプロセスがジャーナルを取り込み済みの場合はパスワードファイルから読み込み直した新しい辞書を返し、
+            変更されたサービス名はNoneになる。
+    """
+    state = read_vault_state()
+    if state.generation is not None and state.generation == journal.generation:
+        return passwords, set()
+
+    header = _read_header()
+    if header is not None and state.snapshot_seq is not None and state.snapshot_seq <= journal.last_seq:
+        data_key, _ = _unlock_data_key(master_password, unpack_slots(header))
+        changed_names = journal.catch_up(passwords, data_key)
+        if changed_names is not None:
+            journal.generation = state.generation
+            if state.generation is None:
+                _repair_state(journal)
+            return passwords, changed_names
+
+    passwords = _load_passwords(master_password, journal)
+    journal.generation = state.generation
+    if state.generation is None:
+        _repair_state(journal)
+    return passwords, None
+
+def _begin_write(journal: VaultJournal, snapshot_seq: int = None):
+    """
+    書き込みの前に、読み込み後に他のプロセスが書き込んでいないかを確認し、世代番号を進める。
+    世代番号は書き込みの前に進めるため、書き込みが途中で失敗しても他のプロセスは最新の内容を読み込み直す。
+    vault_lock()でロックを取得した状態で呼び出すこと。
+    """
+    state = read_vault_state()
+    if journal is not None and (state.generation is None or state.generation != journal.generation):
+        raise ValueError("保管庫が他のセッションで更新されています。最新の内容を読み込んでからやり直してください。")
+    if snapshot_seq is None:
+        snapshot_seq = state.snapshot_seq or 0
+    generation = (state.generation or 0) + 1
+    write_vault_state(VaultState(generation, snapshot_seq))
+    if journal is not None:
+        journal.generation = generation
+
+def _repair_state(journal: VaultJournal):
+    """
+    読み取れなかったロックファイルの世代番号を書き直す。他のプロセスが記録している世代番号と
+    重ならないよう現在時刻を使い、取り込み済みの連番は安全側（大きい方）に記録する。
+    """
+    generation = time.time_ns()
+    write_vault_state(VaultState(generation, journal.last_seq))
+    journal.generation = generation
+
+def rewrap_data_key(current_master_password: str, new_master_password: str) -> bool:
+    """
+    データ暗号化キーを新しいマスターパスワードで包み直し、キースロットだけを書き換える。
+    データ部分は再暗号化しないため、件数に関係なく一定の時間で完了する。
+
+    Returns:
+        bool: 書き換えた場合はTrue。v2以降の形式のファイルが存在しない場合はFalse。
+    """
+    with vault_lock():
+        return _rewrap_data_key(current_master_password, new_master_password)
+
+def _rewrap_data_key(current_master_password: str, new_master_password: str) -> bool:
+    header = _read_header()
+    if header is None:
+        return False
+
+    slots = unpack_slots(header)
+    data_key, active_index = _unlock_data_key(current_master_password, slots)
+    _replace_slot(new_master_password, data_key, slots, active_index, header)
+    return True
+
+def _replace_slot(master_password: str, data_key: bytes, slots: list, active_index: int, header: bytes):
+    """
+    データ暗号化キーを現在のKDFの設定で包み直し、使われていない側のキースロットに書き込んでから
+    古いスロットを消去する。古い形式のヘッダーの場合はファイル全体を最新の形式で書き直す。
+    ロックを取得した状態で呼び出すこと。
+    """
+    inactive_index = (active_index + 1) % SLOT_COUNT
+    generation = max(slot.generation for slot in slots if slot is not None) + 1
+    new_slot = _wrap_data_key(master_password, data_key, generation)
+
+    if read_version(header) < VAULT_VERSION:
+        # スロットの形式が異なるため、一度だけファイル全体を一時ファイル経由で書き直す
+        new_slots = [None] * SLOT_COUNT
+        new_slots[inactive_index] = new_slot
+
+        def write(f):
+            f.write(pack_header(new_slots))
+            with open(PASSWORD_FILE, 'rb') as source:
+                source.seek(HEADER_SIZE)
+                shutil.copyfileobj(source, f)
+        _atomic_write(PASSWORD_FILE, write)
         return
 
-    # バックアップファイルの数を管理
-    backup_files = sorted([f for f in os.listdir(BACKUP_DIR)
-                           if f.startswith("passwords_backup_") and f.endswith(".dat")])
+    try:
+        with open(PASSWORD_FILE, 'r+b') as f:
+            # 新しいスロットを書き込んで確定させてから、古いスロットを消去する
+            f.seek(slot_offset(inactive_index))
+            f.write(pack_slot(new_slot))
+            f.flush()
+            os.fsync(f.fileno())
+            f.seek(slot_offset(active_index))
+            f.write(pack_slot(None))
+            f.flush()
+            os.fsync(f.fileno())
+    except OSError as e:
+        raise OSError(f"パスワードファイルの保存に失敗しました: {e}")
+
+def shard_index(path: str) -> int:
+    """シャードファイル（またはバックアップでのファイル名）からシャード番号を返す。シャードファイルでなければNone。"""
+    match = _SHARD_FILE_PATTERN.match(os.path.basename(path))
+    return int(match.group(1)) if match else None
+
+@profiling.profiled("storage.read_vault_file")
+def read_vault_file(path: str, master_password: str, shard_files: dict = None) -> dict:
+    """
+    バックアップなどのパスワードファイルを読み込んで復号する。
+    ジャーナルの適用やキースロットの作り直しは行わず、ファイルには書き込まない。
+
+    Args:
+        shard_files (dict): シャード分割した保管庫の場合の {シャード番号: シャードファイルのパス}。
 
-    # 古いバックアップファイルを削除
-    while len(backup_files) > MAX_BACKUP_FILES:
-        oldest_backup = backup_files.pop(0) # 最も古いファイルを取得
+    Returns:
+        dict: {サービス名: PasswordEntry}。
+    """
+    passwords, _, _ = _read_vault_file(path, master_password, shard_files)
+    return passwords
+
+def _read_vault_file(path: str, master_password: str, shard_files: dict = None):
+    """パスワードファイルを読み込み、(パスワードの辞書, ヘッダー, データ暗号化キー)を返す。v1形式ではヘッダーとキーはNone。"""
+    try:
+        f = open(path, 'rb')
+    except OSError as e:
+        raise OSError(f"'{path}' を読み込めませんでした: {e}")
+    with f:
+        header = f.read(HEADER_SIZE)
+        if not is_vault_header(header):
+            return _load_legacy_passwords(master_password, header + f.read()), None, None
         try:
-            os.remove(os.path.join(BACKUP_DIR, oldest_backup))
-            # print(f"古いバックアップファイル '{oldest_backup}' が削除されました。")  # デバッグ用
+            data_key, _ = _unlock_data_key(master_password, unpack_slots(header))
+            passwords, _ = _read_payload(f, data_key, shard_files)
+        except InvalidToken:
+            raise ValueError("マスターパスワードが正しくないか、ファイルが破損しています。")
+        except (ValueError, OSError):
+            raise
         except Exception as e:
-            print(f"古いバックアップファイルの削除中にエラーが発生しました: {e}")
\ No newline at end of file
+            raise ValueError(f"ファイルの復号中にエラーが発生しました: {e}")
+    return passwords, header, data_key
+
+def can_unlock_file(path: str, master_password: str) -> bool:
+    """マスターパスワードでパスワードファイルのデータ暗号化キーを取り出せるか（v1形式では復号できるか）を調べる。"""
+    try:
+        with open(path, 'rb') as f:
+            header = f.read(HEADER_SIZE)
+            if not is_vault_header(header):
+                wipe_entries(_load_legacy_passwords(master_password, header + f.read()).values())
+                return True
+    except OSError as e:
+        raise OSError(f"'{path}' を読み込めませんでした: {e}")
+    except ValueError:
+        return False
+    try:
+        _unlock_data_key(master_password, unpack_slots(header))
+    except ValueError:
+        return False
+    return True
+
+@profiling.profiled("storage.restore_vault")
+def restore_vault(path: str, master_password: str, current_master_password: str, shard_files: dict = None) -> int:
+    """
+    バックアップのパスワードファイルの内容で保管庫を置き換える。
+    キースロットはバックアップのものを引き継ぐため、マスターパスワードはバックアップ時点のものになる。
+    置き換える前に、ジャーナルの変更を現在のマスターパスワードでパスワードファイルに取り込んでからバックアップし、
+    バックアップに含まれた後でジャーナルを削除する。取り込みやバックアップに失敗した場合は復元しない。
+
+    Args:
+        master_password (str): バックアップを復号するマスターパスワード。
+        current_master_password (str): 現在の保管庫のマスターパスワード（ジャーナルの取り込みに使う）。
+
+    Returns:
+        int: 復元したパスワードの件数。
+    """
+    passwords, header, data_key = _read_vault_file(path, master_password, shard_files)
+    try:
+        with vault_lock():
+            # 復元するバックアップが世代管理で削除されることがあるため、読み込んでからバックアップする
+            _compact_journal(current_master_password)
+            _backup_before_restore()
+            # 取り込み済みの連番を他のセッションのどのジャーナルの連番よりも大きくし、
+            # 他のセッションに差分ではなくパスワードファイル全体を読み込み直させる
+            journal_seq = max((read_vault_state().snapshot_seq or 0) + 1, time.time_ns())
+            _begin_write(None, journal_seq)
+            if header is None:
+                _create_vault(passwords, master_password, journal_seq)
+            else:
+                _write_payload(header, passwords, data_key, journal_seq)
+            try:
+                os.remove(JOURNAL_FILE)
+            except FileNotFoundError:
+                pass
+        return len(passwords)
+    finally:
+        wipe_entries(passwords.values(), close=True)
+
+def _compact_journal(master_password: str):
+    """
+    ジャーナルに残っている変更をパスワードファイルに取り込む。
+    コマンドラインからの追加などは変更をジャーナルにだけ書き込むため、バックアップの前に取り込む。
+    vault_lock()でロックを取得した状態で呼び出すこと。
+    """
+    try:
+        if os.path.getsize(JOURNAL_FILE) == 0:
+            return
+    except FileNotFoundError:
+        return
+    journal = VaultJournal()
+    try:
+        passwords = load_passwords(master_password, journal)
+    except ValueError as e:
+        raise ValueError(f"ジャーナルの変更を取り込めないため、復元を中止しました（現在のマスターパスワードで開けません）: {e}")
+    try:
+        if journal.record_count:
+            save_passwords(passwords, master_password, journal)
+    finally:
+        wipe_entries(passwords.values(), close=True)
+
+def _backup_before_restore():
+    """復元の前に現在の保管庫をバックアップする。失敗した場合は復元しないよう、OSErrorにする。"""
+    if not os.path.exists(PASSWORD_FILE):
+        return
+    try:
+        BackupStore().backup(PASSWORD_FILE, shard_paths=shard_paths())
+    except Exception as e:
+        raise OSError(f"現在の保管庫をバックアップできないため、復元を中止しました: {e}")
+
+@profiling.profiled("storage.create_backups")
+def create_backups():
+    """
+    パスワードファイルをバックアップする。
+    前回のバックアップから内容が変わっていなければ何もせず、同じ内容は1回だけ保存する。
+    古いバックアップは世代ごとの保持数（1時間・1日・1週間ごと）に従って削除する。
+    """
+    if not os.path.exists(PASSWORD_FILE):
+        return # passwords.datが存在しない場合はバックアップしない
+
+    try:
+        BackupStore().backup(PASSWORD_FILE, shard_paths=shard_paths())
+    except Exception as e:
+        print(f"バックアップファイルの作成中にエラーが発生しました: {e}")
@@ -1,6 +1,12 @@
-import secrets
-import random
+import os
 import string
+from functools import lru_cache
+
+# OSの乱数生成器から一度に取得するバイト数の上限と下限
+_RANDOM_CHUNK_SIZE = 64 * 1024
+_MIN_RANDOM_CHUNK_SIZE = 64
+# 0以上n未満の乱数を1バイトから偏りなく得るための棄却の境界（nの倍数に収まる最大値）
+_BYTE_LIMITS = [0] + [256 - 256 % n for n in range(1, 257)]
 
 class PasswordGeneratorModel:
     """
@@ -21,29 +27,132 @@ class PasswordGeneratorModel:
         Returns:
             str: 生成されたパスワード。
         """
-        char_pool = ""
-        password_chars = []
+        return self.generate_many(1, length, use_uppercase, use_lowercase, use_digits, use_symbols)[0]
+
+    def generate_many(self, count, length, use_uppercase, use_lowercase, use_digits, use_symbols):
+        """
+        指定された条件に基づいてランダムなパスワードをまとめて生成する。
+        乱数はOSの乱数生成器からまとめて取得し、剰余による偏りが出ないよう棄却法で文字に変換する。
+        各パスワードには選択した文字種が必ず1文字以上含まれる。
+
+        Args:
+            count (int): 生成するパスワードの数。
+            length (int): 生成するパスワードの長さ。
+            use_uppercase (bool): 大文字を含めるか。
+            use_lowercase (bool): 小文字を含めるか。
+            use_digits (bool): 数字を含めるか。
+            use_symbols (bool): 記号を含めるか。
 
-        # 使用する全ての文字をchar_poolに入れ、各文字種の中から1文字ランダムでpassword_charsに追加
+        Returns:
+            list: 生成されたパスワードのリスト。
+        """
+        char_classes = []
         if use_uppercase:
-            char_pool += string.ascii_uppercase
-            password_chars.append(secrets.choice(string.ascii_uppercase))
+            char_classes.append(string.ascii_uppercase)
         if use_lowercase:
-            char_pool += string.ascii_lowercase
-            password_chars.append(secrets.choice(string.ascii_lowercase))
+            char_classes.append(string.ascii_lowercase)
         if use_digits:
-            char_pool += string.digits
-            password_chars.append(secrets.choice(string.digits))
+            char_classes.append(string.digits)
         if use_symbols:
-            char_pool += string.punctuation
-            password_chars.append(secrets.choice(string.punctuation))
+            char_classes.append(string.punctuation)
 
-        if not char_pool:
+        if not char_classes:
             raise ValueError("パスワードには最低1種類以上の文字を含めてください。")
+        if length < len(char_classes):
+            raise ValueError(f"パスワードの長さは{len(char_classes)}文字以上にしてください。")
 
-        # 指定した文字数になるまでchar_poolからランダムでpassword_charsに追加
-        for _ in range(length - len(password_chars)):
-            password_chars.append(secrets.choice(char_pool))
+        # 1つだけ生成する場合に大量生成用の64KiBを取得しないよう、必要な分（棄却される分を見込んで2倍）だけ取得する
+        random_stream = _RandomStream(count * length * 2)
+        char_pool = "".join(char_classes)
+        fill_length = length - len(char_classes)
 
-        random.shuffle(password_chars)
-        return "".join(password_chars)
\ No newline at end of file
+        # 各文字種から1文字ずつ、残りは全ての文字から、全パスワード分をまとめて取り出す
+        required_chars = [random_stream.choose(char_class, count) for char_class in char_classes]
+        fill_chars = random_stream.choose(char_pool, count * fill_length)
+
+        passwords = []
+        buffer = bytearray(length) # 1つのパスワードを組み立てるバッファを使い回す
+        for i in range(count):
+            for class_index, chars in enumerate(required_chars):
+                buffer[class_index] = chars[i]
+            buffer[len(char_classes):] = fill_chars[i * fill_length:(i + 1) * fill_length]
+            random_stream.shuffle(buffer)
+            passwords.append(buffer.decode('ascii'))
+        return passwords
+
+class _RandomStream:
+    """OSの乱数生成器（CSPRNG）からまとめて取得したバイト列を、偏りのない乱数に変換する。"""
+    def __init__(self, expected_size=_RANDOM_CHUNK_SIZE):
+        self._buffer = b""
+        self._position = 0
+        # 一度に取得するバイト数。見込みの使用量に合わせ、上限と下限の間に収める
+        self._chunk_size = max(_MIN_RANDOM_CHUNK_SIZE, min(_RANDOM_CHUNK_SIZE, expected_size))
+
+    def choose(self, alphabet, count):
+        """alphabetから一様にcount文字を選び、バイト列として返す。"""
+        table, rejected, limit = _choice_table(alphabet)
+
+        chunks = []
+        remaining = count
+        while remaining > 0:
+            # 棄却される分を見込んで多めに取得する
+            raw = os.urandom(remaining * 256 // limit + 16)
+            accepted = raw.translate(table, rejected)[:remaining]
+            chunks.append(accepted)
+            remaining -= len(accepted)
+        return b"".join(chunks)
+
+    def randbelow(self, upper):
+        """0以上upper未満の整数を一様に返す。"""
+        num_bytes = (upper.bit_length() + 7) // 8
+        limit = (1 << (8 * num_bytes)) - (1 << (8 * num_bytes)) % upper
+        while True:
+            value = int.from_bytes(self._take(num_bytes), "big")
+            if value < limit:
+                return value % upper
+
+    def shuffle(self, buffer):
+        """フィッシャー–イェーツのシャッフルでbufferの要素をその場で並べ替える。"""
+        if len(buffer) > 256:
+            for i in range(len(buffer) - 1, 0, -1):
+                j = self.randbelow(i + 1)
+                buffer[i], buffer[j] = buffer[j], buffer[i]
+            return
+
+        # 256要素以下なら乱数は1バイトで足りるため、バッファから直接読み出して高速化する
+        random_bytes = self._buffer
+        position = self._position
+        for i in range(len(buffer) - 1, 0, -1):
+            upper = i + 1
+            limit = _BYTE_LIMITS[upper]
+            while True:
+                if position >= len(random_bytes):
+                    random_bytes = self._buffer = os.urandom(self._chunk_size)
+                    position = 0
+                value = random_bytes[position]
+                position += 1
+                if value < limit:
+                    break
+            j = value % upper
+            buffer[i], buffer[j] = buffer[j], buffer[i]
+        self._position = position
+
+    def _take(self, size):
+        if self._position + size > len(self._buffer):
+            self._buffer = os.urandom(max(self._chunk_size, size))
+            self._position = 0
+        data = self._buffer[self._position:self._position + size]
+        self._position += size
+        return data
+
+@lru_cache(maxsize=16)
+def _choice_table(alphabet):
+    """
+    alphabetから文字を選ぶbytes.translate用の変換表、棄却するバイト、棄却の境界を返す。
+    文字種の組み合わせは少ないため、生成のたびに作り直さないよう保持しておく。
+    """
+    size = len(alphabet)
+    # sizeの倍数に収まらない値は捨てることで、剰余による偏りを無くす
+    limit = 256 - 256 % size
+    table = bytes(ord(alphabet[value % size]) if value < limit else 0 for value in range(256))
+    return table, bytes(range(limit, 256)), limit
@@ -0,0 +1,230 @@
+import json
+import os
+import struct
+import threading
+
+from cryptography.fernet import Fernet, InvalidToken
+
+from pwd_gen_tool.config import JOURNAL_FILE, JOURNAL_MAX_RECORDS, JOURNAL_MAX_BYTES
+from pwd_gen_tool.model.password_entry import PasswordEntry
+from pwd_gen_tool.utils.profiling import profiled
+
+# 各レコードの先頭に置く長さ（4バイト）
+_LENGTH_STRUCT = struct.Struct(">I")
+# 壊れた長さを読んで巨大なバッファを確保しないための上限
+_MAX_RECORD_SIZE = 16 * 1024 * 1024
+
+class VaultJournal:
+    """
+    パスワードの追加・更新・削除を1件ずつ追記する暗号化ジャーナル。
+    各レコードはデータ暗号化キーで個別に暗号化・認証され、連番が付与される。
+    スナップショット（パスワードファイル）には取り込み済みの連番が記録されており、
+    それより新しいレコードだけを読み込み時に再適用する。
+    """
+    def __init__(self, path=JOURNAL_FILE):
+        self.path = path
+        self.last_seq = 0 # 最後に書き込まれた（または読み込まれた）レコードの連番
+        self.end_offset = 0 # 正常に読み込めたレコードの終端位置
+        self._records = [] # [(連番, 開始位置)] 未圧縮のレコードの一覧
+        self._record_names = {} # {連番: 変更されたサービス名のタプル}
+        # 読み込み時点の保管庫の世代番号。書き込み前に比べ、他のプロセスが書き込んだかを判定する
+        self.generation = None
+        self._lock = threading.Lock()
+
+    @property
+    def record_count(self):
+        return len(self._records)
+
+    @profiled("journal.replay")
+    def replay(self, passwords: dict, data_key: bytes, base_seq: int):
+        """
+        ジャーナルのレコードをパスワードの辞書に適用する。
+        書き込み途中で途切れたレコードや認証に失敗したレコード以降は無視する。
+        """
+        with self._lock:
+            self.last_seq = base_seq
+            self.end_offset = 0
+            self._records = []
+            self._record_names = {}
+            records, end_offset = self._read_records(data_key)
+            for seq, offset, record in records:
+                if seq <= base_seq:
+                    continue
+                if seq != self.last_seq + 1:
+                    end_offset = offset # 連番が飛んでいる場合はそれ以降を信頼しない
+                    break
+                _apply_record(passwords, record)
+                self.last_seq = seq
+                self._records.append((seq, offset))
+                self._record_names[seq] = _record_service_names(record)
+            self.end_offset = end_offset
+
+    def catch_up(self, passwords: dict, data_key: bytes):
+        """
+        他のプロセスが追記したレコードをパスワードの辞書に適用し、変更されたサービス名の集合を返す。
+        他のプロセスがジャーナルを取り込んだために、未適用のレコードが既に残っていない場合はNoneを返す
+        （パスワードファイルから読み込み直す必要がある）。
+        """
+        with self._lock:
+            records, end_offset = self._read_records(data_key)
+            pending = [(seq, record) for seq, _, record in records if seq > self.last_seq]
+            if pending and pending[0][0] != self.last_seq + 1:
+                return None
+
+            changed_names = set()
+            for seq, record in pending:
+                _apply_record(passwords, record)
+                changed_names.update(_record_service_names(record))
+                self.last_seq = seq
+            # ジャーナルファイルは他のプロセスが整理して書き直している場合があるため、位置を読み直す
+            self._records = [(seq, offset) for seq, offset, _ in records]
+            self._record_names = {seq: _record_service_names(record) for seq, _, record in records}
+            self.end_offset = end_offset
+            return changed_names
+
+    def _read_records(self, data_key: bytes):
+        """
+        ジャーナルファイルから連番が連続している正常なレコードを読み込み、
+        ([(連番, 開始位置, レコード)], 最後の正常なレコードの終端位置)を返す。
+        """
+        fernet = Fernet(data_key)
+        try:
+            with open(self.path, 'rb') as f:
+                data = f.read()
+        except FileNotFoundError:
+            return [], 0
+        except OSError as e:
+            raise OSError(f"ジャーナルファイルの読み込みに失敗しました: {e}")
+
+        records = []
+        offset = 0
+        while offset + _LENGTH_STRUCT.size <= len(data):
+            (length,) = _LENGTH_STRUCT.unpack_from(data, offset)
+            start = offset + _LENGTH_STRUCT.size
+            if length == 0 or length > _MAX_RECORD_SIZE or start + length > len(data):
+                break # 書き込み途中で途切れたレコード
+            try:
+                record = json.loads(fernet.decrypt(data[start:start + length]).decode('utf-8'))
+            except (InvalidToken, ValueError):
+                break # 破損したレコード、または別の保管庫のレコード
+            if records and record["seq"] != records[-1][0] + 1:
+                break # 連番が飛んでいる場合はそれ以降を信頼しない
+            records.append((record["seq"], offset, record))
+            offset = start + length
+        return records, offset
+
+    def append(self, data_key: bytes, op: str, service_name: str, data=None, previous_name=None):
+        """
+        レコードを1件追記し、ディスクへの書き込みを確定させる。
+
+        Args:
+            op (str): "put"（追加・更新）または "delete"（削除）。
+            data (PasswordEntry): "put"の場合の追加・更新後のデータ。
+            previous_name (str): サービス名を変更した場合の変更前のサービス名。
+        """
+        self.append_many(data_key, [(op, service_name, data, previous_name)])
+
+    def append_many(self, data_key: bytes, changes):
+        """
+        複数のレコードを続けて追記し、1回の書き込みでディスクへの書き込みを確定させる。
+
+        Args:
+            changes: (op, service_name, data, previous_name) のリスト。各要素の意味はappend()と同じ。
+        """
+        fernet = Fernet(data_key)
+        with self._lock:
+            records = []
+            chunks = []
+            for seq, (op, service_name, data, previous_name) in enumerate(changes, self.last_seq + 1):
+                record = {"seq": seq, "op": op, "service": service_name}
+                if data is not None:
+                    record["data"] = data.to_dict()
+                if previous_name is not None:
+                    record["previous"] = previous_name
+                token = fernet.encrypt(json.dumps(record, ensure_ascii=False).encode('utf-8'))
+                records.append((record, _LENGTH_STRUCT.size + len(token)))
+                chunks.append(_LENGTH_STRUCT.pack(len(token)) + token)
+            if not records:
+                return
+
+            try:
+                with open(self.path, 'ab') as f:
+                    # 前回途切れたレコードが残っていれば切り詰めてから追記する
+                    if f.tell() != self.end_offset:
+                        f.truncate(self.end_offset)
+                    f.write(b"".join(chunks))
+                    f.flush()
+                    os.fsync(f.fileno())
+            except OSError as e:
+                raise OSError(f"ジャーナルファイルへの書き込みに失敗しました: {e}")
+
+            for record, size in records:
+                self._records.append((record["seq"], self.end_offset))
+                self._record_names[record["seq"]] = _record_service_names(record)
+                self.end_offset += size
+                self.last_seq = record["seq"]
+
+    def needs_compaction(self) -> bool:
+        """ジャーナルがスナップショットへの取り込みが必要な大きさになったかを判定する。"""
+        return self.record_count >= JOURNAL_MAX_RECORDS or self.end_offset >= JOURNAL_MAX_BYTES
+
+    def changed_names(self, through_seq: int) -> set:
+        """連番through_seqまでの未取り込みのレコードで変更されたサービス名を返す。"""
+        with self._lock:
+            return {service_name for record_seq, names in self._record_names.items()
+                    if record_seq <= through_seq for service_name in names}
+
+    def discard_through(self, seq: int):
+        """
+        スナップショットに取り込まれた連番seqまでのレコードを削除する。
+        取り込み中に追記されたレコードは新しいジャーナルファイルに引き継ぐ。
+        """
+        with self._lock:
+            remaining = [(record_seq, offset) for record_seq, offset in self._records if record_seq > seq]
+            self._record_names = {record_seq: names for record_seq, names in self._record_names.items()
+                                  if record_seq > seq}
+            try:
+                if not remaining:
+                    if os.path.exists(self.path):
+                        os.remove(self.path)
+                    self._records = []
+                    self.end_offset = 0
+                    return
+
+                start = remaining[0][1]
+                with open(self.path, 'rb') as f:
+                    f.seek(start)
+                    tail = f.read(self.end_offset - start)
+                temp_path = self.path + ".tmp"
+                with open(temp_path, 'wb') as f:
+                    f.write(tail)
+                    f.flush()
+                    os.fsync(f.fileno())
+                os.replace(temp_path, self.path)
+            except OSError as e:
+                raise OSError(f"ジャーナルファイルの整理に失敗しました: {e}")
+
+            self._records = [(record_seq, offset - start) for record_seq, offset in remaining]
+            self.end_offset -= start
+
+def _record_service_names(record: dict) -> tuple:
+    """レコードで変更されるサービス名（名前の変更の場合は変更前の名前も）を返す。"""
+    previous_name = record.get("previous")
+    return (record["service"],) if previous_name is None else (record["service"], previous_name)
+
+def _apply_record(passwords: dict, record: dict):
+    """ジャーナルのレコード1件をパスワードの辞書に適用する。"""
+    if record["op"] == "put":
+        previous_name = record.get("previous")
+        if previous_name is not None:
+            _discard(passwords, previous_name)
+        _discard(passwords, record["service"])
+        passwords[record["service"]] = PasswordEntry.from_dict(record["data"])
+    elif record["op"] == "delete":
+        _discard(passwords, record["service"])
+
+def _discard(passwords: dict, service_name: str):
+    """パスワードを消去してから辞書から取り除く。"""
+    entry = passwords.pop(service_name, None)
+    if entry is not None:
+        entry.wipe()
@@ -0,0 +1,134 @@
+import base64
+import json
+import os
+import struct
+import time
+from collections import namedtuple
+
+from cryptography.hazmat.primitives import hashes
+from cryptography.hazmat.primitives.kdf.pbkdf2 import PBKDF2HMAC
+from cryptography.hazmat.primitives.kdf.scrypt import Scrypt
+
+try:
+    from cryptography.hazmat.primitives.kdf.argon2 import Argon2id
+except ImportError: # Argon2idはcryptography 44.0以降でのみ使える
+    Argon2id = None
+
+from pwd_gen_tool.config import (
+    KDF_ALGORITHM, KDF_ITERATIONS, KDF_SCRYPT_N, KDF_SCRYPT_R, KDF_SCRYPT_P,
+    KDF_ARGON2_ITERATIONS, KDF_ARGON2_MEMORY_KIB, KDF_ARGON2_LANES,
+    KDF_PROFILE_FILE, KDF_TARGET_UNLOCK_SECONDS
+)
+from pwd_gen_tool.utils.profiling import profiled
+
+# キースロットに記録するアルゴリズムの番号
+ALGORITHM_IDS = {"pbkdf2": 1, "scrypt": 2, "argon2id": 3}
+ALGORITHM_NAMES = {algorithm_id: name for name, algorithm_id in ALGORITHM_IDS.items()}
+
+# algorithm: アルゴリズム名
+# cost: PBKDF2・Argon2idの繰り返し回数、scryptのN
+# memory: Argon2idのメモリ使用量（KiB）、scryptのr（PBKDF2では0）
+# parallelism: Argon2idの並列度、scryptのp（PBKDF2では0）
+KdfParams = namedtuple("KdfParams", ["algorithm", "cost", "memory", "parallelism"])
+
+# KDFの設定を記録していない旧形式（v1・v2）のファイルで使われていた設定
+LEGACY_PARAMS = KdfParams("pbkdf2", 480000, 0, 0)
+
+_PARAMS_STRUCT = struct.Struct(">BIII")
+PARAMS_SIZE = _PARAMS_STRUCT.size
+
+# scryptのメモリ使用量（128 * N * r バイト）が大きくなりすぎないようにする上限
+_SCRYPT_MAX_N = 2 ** 20
+
+def is_available(algorithm):
+    """アルゴリズムがこの環境で使えるかを判定する。"""
+    if algorithm == "argon2id":
+        return Argon2id is not None
+    return algorithm in ALGORITHM_IDS
+
+@profiled("kdf.derive_key")
+def derive_key(master_password: str, salt: bytes, params: KdfParams) -> bytes:
+    """マスターパスワードとソルトから、指定されたKDFで暗号化キーを生成する。"""
+    if params.algorithm == "pbkdf2":
+        kdf = PBKDF2HMAC(algorithm=hashes.SHA256(), length=32, salt=salt, iterations=params.cost)
+    elif params.algorithm == "scrypt":
+        kdf = Scrypt(salt=salt, length=32, n=params.cost, r=params.memory, p=params.parallelism)
+    elif params.algorithm == "argon2id" and Argon2id is not None:
+        kdf = Argon2id(salt=salt, length=32, iterations=params.cost,
+                       lanes=params.parallelism, memory_cost=params.memory)
+    else:
+        raise ValueError(f"このキー派生関数は使用できません: {params.algorithm}")
+    # KDF（キー派生関数）を使ってマスターパスワードから安全なキーを生成
+    return base64.urlsafe_b64encode(kdf.derive(master_password.encode()))
+
+def pack_params(params: KdfParams) -> bytes:
+    """KDFの設定を固定長のバイト列に変換する。"""
+    return _PARAMS_STRUCT.pack(ALGORITHM_IDS[params.algorithm], params.cost, params.memory, params.parallelism)
+
+def unpack_params(data: bytes, offset: int = 0) -> KdfParams:
+    """バイト列からKDFの設定を取り出す。"""
+    algorithm_id, cost, memory, parallelism = _PARAMS_STRUCT.unpack_from(data, offset)
+    if algorithm_id not in ALGORITHM_NAMES:
+        raise ValueError(f"不明なキー派生関数です: {algorithm_id}")
+    return KdfParams(ALGORITHM_NAMES[algorithm_id], cost, memory, parallelism)
+
+def default_params(algorithm=KDF_ALGORITHM) -> KdfParams:
+    """設定ファイル（config.py）の値からKDFの設定を作る。"""
+    if algorithm == "pbkdf2":
+        return KdfParams("pbkdf2", KDF_ITERATIONS, 0, 0)
+    if algorithm == "scrypt":
+        return KdfParams("scrypt", KDF_SCRYPT_N, KDF_SCRYPT_R, KDF_SCRYPT_P)
+    if algorithm == "argon2id":
+        return KdfParams("argon2id", KDF_ARGON2_ITERATIONS, KDF_ARGON2_MEMORY_KIB, KDF_ARGON2_LANES)
+    raise ValueError(f"不明なキー派生関数です: {algorithm}")
+
+def target_params() -> KdfParams:
+    """新しいキースロットで使うKDFの設定を返す。calibrateの結果があればそれを優先する。"""
+    try:
+        with open(KDF_PROFILE_FILE, 'r', encoding='utf-8') as f:
+            profile = json.load(f)
+        params = KdfParams(profile["algorithm"], profile["cost"], profile["memory"], profile["parallelism"])
+        if is_available(params.algorithm):
+            return params
+    except (OSError, ValueError, KeyError, TypeError):
+        pass
+    return default_params()
+
+def save_profile(params: KdfParams):
+    """calibrateの結果を、この端末用のKDFの設定として保存する。"""
+    try:
+        with open(KDF_PROFILE_FILE, 'w', encoding='utf-8') as f:
+            json.dump(params._asdict(), f, indent=4)
+    except OSError as e:
+        raise OSError(f"KDFの設定ファイルの保存に失敗しました: {e}")
+
+def calibrate(algorithm=KDF_ALGORITHM, target_seconds=KDF_TARGET_UNLOCK_SECONDS) -> KdfParams:
+    """
+    この端末でキー派生にかかる時間を測定し、ロック解除がおよそtarget_seconds秒になる設定を求める。
+    メモリ使用量と並列度は設定ファイルの値を使い、繰り返し回数（scryptではN）を調整する。
+    """
+    if not is_available(algorithm):
+        raise ValueError(f"このキー派生関数は使用できません: {algorithm}")
+    base = default_params(algorithm)
+
+    if algorithm == "scrypt":
+        # Nは2のべき乗である必要があるため、目標の時間を超えるまで倍にしていく
+        n = 2 ** 14
+        while n < _SCRYPT_MAX_N:
+            if _measure(base._replace(cost=n)) * 2 > target_seconds:
+                break
+            n *= 2
+        return base._replace(cost=n)
+
+    # PBKDF2とArgon2idは所要時間が繰り返し回数にほぼ比例するため、少ない回数で測って換算する
+    probe_cost = 100000 if algorithm == "pbkdf2" else 1
+    elapsed = _measure(base._replace(cost=probe_cost))
+    minimum_cost = 100000 if algorithm == "pbkdf2" else 1
+    cost = max(minimum_cost, int(probe_cost * target_seconds / max(elapsed, 1e-6)))
+    return base._replace(cost=cost)
+
+def _measure(params: KdfParams) -> float:
+    """指定された設定でキー派生にかかる時間（秒）を測定する。"""
+    start = time.perf_counter()
+    derive_key("calibration", os.urandom(16), params)
+    return time.perf_counter() - start
@@ -0,0 +1,99 @@
+import atexit
+import hashlib
+import hmac
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from pwd_gen_tool.config import KEY_CACHE_TIMEOUT, KEY_CACHE_MAX_ENTRIES
+
+class SessionKeyCache:
+    """
+    マスターパスワードから派生した暗号化キーをセッション中だけ保持する有界キャッシュ。
+    キー派生（PBKDF2）は重い処理のため、一度派生したキーを再利用して保存のたびの派生を避ける。
+    一定時間使われなかったキーとアプリ終了時のキーはゼロ埋めして破棄する。
+    """
+    def __init__(self, max_entries=KEY_CACHE_MAX_ENTRIES, timeout=KEY_CACHE_TIMEOUT):
+        self.max_entries = max_entries
+        self.timeout = timeout
+        # エントリは {識別子: (キーのbytearray, 最終利用時刻)} の順序付き辞書（LRU順）
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._timer = None
+        # マスターパスワードそのものを辞書のキーにしないよう、プロセスごとの秘密値でHMACを取る
+        self._secret = os.urandom(32)
+
+    def _entry_id(self, master_password: str, salt: bytes) -> bytes:
+        """マスターパスワードとソルトの組からキャッシュ上の識別子を作る。"""
+        return hmac.new(self._secret, salt + master_password.encode(), hashlib.sha256).digest()
+
+    def get(self, master_password: str, salt: bytes):
+        """キャッシュ済みのキーを返す。無い場合や期限切れの場合はNoneを返す。"""
+        entry_id = self._entry_id(master_password, salt)
+        with self._lock:
+            self._purge_expired()
+            entry = self._entries.get(entry_id)
+            if entry is None:
+                return None
+            key, _ = entry
+            self._entries[entry_id] = (key, time.monotonic())
+            self._entries.move_to_end(entry_id)
+            return bytes(key)
+
+    def put(self, master_password: str, salt: bytes, key: bytes):
+        """派生したキーをキャッシュに追加する。上限を超えた場合は最も古いキーを破棄する。"""
+        entry_id = self._entry_id(master_password, salt)
+        with self._lock:
+            old_entry = self._entries.pop(entry_id, None)
+            if old_entry is not None:
+                self._wipe(old_entry[0])
+            self._entries[entry_id] = (bytearray(key), time.monotonic())
+            while len(self._entries) > self.max_entries:
+                _, (evicted_key, _) = self._entries.popitem(last=False)
+                self._wipe(evicted_key)
+            self._schedule_purge()
+
+    def clear(self):
+        """保持している全てのキーをゼロ埋めして破棄する。"""
+        with self._lock:
+            for key, _ in self._entries.values():
+                self._wipe(key)
+            self._entries.clear()
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+
+    def _purge_expired(self):
+        """期限切れのキーを破棄する。ロックを取得した状態で呼び出すこと。"""
+        now = time.monotonic()
+        expired_ids = [entry_id for entry_id, (_, last_used) in self._entries.items()
+                       if now - last_used >= self.timeout]
+        for entry_id in expired_ids:
+            key, _ = self._entries.pop(entry_id)
+            self._wipe(key)
+
+    def _schedule_purge(self):
+        """期限切れのキーを破棄するタイマーを設定する。ロックを取得した状態で呼び出すこと。"""
+        if self._timer is not None:
+            self._timer.cancel()
+        self._timer = threading.Timer(self.timeout, self._on_timer)
+        self._timer.daemon = True # タイマーがアプリの終了を妨げないようにする
+        self._timer.start()
+
+    def _on_timer(self):
+        with self._lock:
+            self._timer = None
+            self._purge_expired()
+            if self._entries:
+                self._schedule_purge()
+
+    @staticmethod
+    def _wipe(key: bytearray):
+        """キーのバッファをゼロ埋めする。"""
+        for i in range(len(key)):
+            key[i] = 0
+
+# アプリ全体で共有するキャッシュ。終了時には必ず破棄する
+session_key_cache = SessionKeyCache()
+atexit.register(session_key_cache.clear)
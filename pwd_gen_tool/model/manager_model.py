@@ -1,95 +1,652 @@
-from pwd_gen_tool.model.data_storage import load_passwords, save_passwords
+import threading
+from collections import namedtuple
+from contextlib import contextmanager
+
+from pwd_gen_tool.config import IMPORT_PROGRESS_INTERVAL, SEARCH_RESULT_LIMIT
+from pwd_gen_tool.model.backup_verifier import entry_digests
+from pwd_gen_tool.model.breach_checker import password_hash
+from pwd_gen_tool.model.data_storage import (
+    load_passwords, save_passwords, rewrap_data_key, append_journal_changes, sync_passwords
+)
+from pwd_gen_tool.model.journal import VaultJournal
+from pwd_gen_tool.model.password_audit import PasswordAuditor
+from pwd_gen_tool.model.password_entry import PasswordEntry, wipe_entries
+from pwd_gen_tool.model.save_worker import SaveWorker
+from pwd_gen_tool.model.search_index import SearchIndex
+from pwd_gen_tool.model.sorted_keys import SortedKeys
+from pwd_gen_tool.model.transfer import DUPLICATE_SKIP, DUPLICATE_OVERWRITE, DUPLICATE_RENAME
+from pwd_gen_tool.model.vault_lock import read_vault_state, vault_lock
+from pwd_gen_tool.utils.profiling import profiled
+
+# バックグラウンドで保存する1件の変更。dataとbaseの値は、保存後に消去できるようメモリ上のデータとは別の複製
+# base: 変更したサービス名ごとの変更前のデータ（存在しなかった場合はNone）。他のセッションとの競合の判定に使う
+_PendingChange = namedtuple("_PendingChange", ["op", "service_name", "data", "previous_name", "base"])
 
 class PasswordManagerModel:
     """
     パスワードデータの追加、編集、削除、検索などを扱うモデル。
     """
-    def __init__(self, master_password):
+    def __init__(self, master_password, background_save=False):
+        """
+        Args:
+            background_save (bool): Trueの場合、追加・編集・削除の保存をバックグラウンドのスレッドで行い、
+                メソッドはメモリ上の変更だけを行ってすぐに戻る。保存のエラーはtake_save_errors()で受け取る。
+        """
         # インスタンス変数としてマスターパスワードと初回起動フラグを保持
         self.master_password = master_password
+        # 変更は1件ずつジャーナルに追記し、一定量たまったらバックグラウンドでパスワードファイルに取り込む
+        self._journal = VaultJournal()
+        self._compaction_thread = None
+        # メモリ上のパスワードと検索用のインデックスを、保存のスレッドと同時に変更しないためのロック
+        self._lock = threading.RLock()
+        self._change_base = {}
         # load_passwordsにマスターパスワードを渡す
-        self.passwords = load_passwords(self.master_password)
+        self.passwords = load_passwords(self.master_password, self._journal)
+        self._build_indexes()
+        # 診断結果を保持し、再診断では変更されたパスワードだけを推定し直す
+        self._auditor = PasswordAuditor()
+        self._save_worker = SaveWorker(self._write_pending) if background_save else None
+
+    def _build_indexes(self):
+        """検索用のインデックスとソート済みのサービス名を作り直す。"""
+        # 検索用のインデックスは読み込み時に一度だけ作成し、以降は変更のたびに更新する
+        self._search_index = SearchIndex()
+        for service_name, entry in self.passwords.items():
+            self._search_index.add(service_name, entry.account_id)
+        # 一覧表示と番号での選択のため、サービス名を常にソート済みで保持する
+        self._sorted_names = SortedKeys(self.passwords)
 
     def add_password(self, service_name, account_id, password):
         """パスワードを追加する。"""
-        if service_name in self.passwords:
-            raise ValueError(f"サービス名 '{service_name}' は既に存在します。")
-        # passwordsの辞書にservice_nameのキー、account_idとpasswordの値を追加。
-        self.passwords[service_name] = {"account_id": account_id, "password": password}
-        self._save()
+        with self._mutation(service_name):
+            if service_name in self.passwords:
+                raise ValueError(f"サービス名 '{service_name}' は既に存在します。")
+            # passwordsの辞書にservice_nameのキー、account_idとpasswordの値を追加。
+            self.passwords[service_name] = PasswordEntry.from_password(account_id, password)
+            self._search_index.add(service_name, account_id)
+            self._sorted_names.add(service_name)
+            self._record_change("put", service_name, self.passwords[service_name])
 
+    @profiled("model.get_all_service_names")
     def get_all_service_names(self):
         """全てのサービス名をソートして取得する"""
-        return sorted(list(self.passwords.keys()))
+        with self._lock:
+            return self._sorted_names[:]
 
     def get_all_passwords(self):
         """全てのパスワードをソートして取得する。"""
+        with self._lock:
+            return self.get_passwords(0, len(self._sorted_names))
+
+    @profiled("model.get_passwords")
+    def get_passwords(self, start, stop):
+        """ソート順でstart番目からstop番目の手前までのパスワードを取得する（ページ表示用）。"""
         items_for_display = []
-        for service_name, data in sorted(self.passwords.items()):
-            items_for_display.append((service_name, data["account_id"], data["password"]))
+        with self._lock:
+            for service_name in self._sorted_names[start:stop]:
+                entry = self.passwords[service_name]
+                items_for_display.append((service_name, entry.account_id, entry.password))
         return items_for_display
 
-    def search_passwords(self, search_term):
-        """サービス名またはアカウントIDでパスワードを検索する。"""
-        found_passwords = {}
-        for service_name, data in self.passwords.items():
-            if search_term.lower() in service_name.lower() or \
-               search_term.lower() in data["account_id"].lower():
-                found_passwords[service_name] = data
-        return sorted(found_passwords.items())
+    @profiled("model.get_accounts")
+    def get_accounts(self, start, stop):
+        """
+        ソート順でstart番目からstop番目の手前までの (サービス名, アカウントID) を取得する（一覧表示用）。
+        パスワードは復号しない。
+        """
+        with self._lock:
+            return [(service_name, self.passwords[service_name].account_id)
+                    for service_name in self._sorted_names[start:stop]]
+
+    def iter_passwords(self):
+        """全てのパスワードをソート順に1件ずつ返す（エクスポート用）。"""
+        with self._lock:
+            service_names = self._sorted_names[:]
+        for service_name in service_names:
+            with self._lock:
+                entry = self.passwords.get(service_name)
+                if entry is None:
+                    continue # 他のセッションの変更を取り込んだ際に削除された
+                item = (service_name, entry.account_id, entry.password)
+            yield item
+
+    @profiled("model.import_passwords")
+    def import_passwords(self, entries, on_duplicate=DUPLICATE_SKIP, progress=None):
+        """
+        複数のパスワードをまとめて追加し、最後に1回だけ保存する。
+
+        Args:
+            entries: (サービス名, アカウントID, パスワード) または例外を順に返すイテラブル。
+            on_duplicate (str): 既に存在するサービス名の扱い（skip / overwrite / rename）。
+            progress (callable): 処理済みの件数を受け取る関数。一定件数ごとに呼び出される。
+
+        Returns:
+            dict: 追加・上書き・別名追加・スキップの件数と、不正なデータのエラーメッセージのリスト。
+        """
+        result = {"added": 0, "overwritten": 0, "renamed": 0, "skipped": 0, "errors": []}
+        # インポートは同期して保存するため、保存待ちの変更を先に書き込んでおく
+        self.flush()
+        # ファイルの読み込み中にエラーが起きても既存のデータに影響しないよう、いったん別の辞書にためる
+        staged = {}
+        processed = 0
+
+        for entry in entries:
+            processed += 1
+            if progress is not None and processed % IMPORT_PROGRESS_INTERVAL == 0:
+                progress(processed)
+
+            if isinstance(entry, Exception):
+                result["errors"].append(str(entry))
+                continue
+
+            service_name, account_id, password = entry
+            if service_name in self.passwords or service_name in staged:
+                if on_duplicate == DUPLICATE_OVERWRITE:
+                    result["overwritten"] += 1
+                elif on_duplicate == DUPLICATE_RENAME:
+                    service_name = self._unique_service_name(service_name, staged)
+                    result["renamed"] += 1
+                else:
+                    result["skipped"] += 1
+                    continue
+            else:
+                result["added"] += 1
+            previous = staged.get(service_name)
+            if previous is not None:
+                previous.wipe()
+            staged[service_name] = PasswordEntry.from_password(account_id, password)
+
+        if progress is not None and processed % IMPORT_PROGRESS_INTERVAL != 0:
+            progress(processed)
+
+        if not staged:
+            return result
+
+        # ファイルの読み込み中に他のセッションで同じサービス名が変更されていた場合は、取り込まずに失敗させる
+        applied = False
+        try:
+            with self._exclusive(*staged):
+                applied = True
+                new_service_names = [service_name for service_name in staged if service_name not in self.passwords]
+                # 上書きされるパスワードは消去してから置き換える
+                wipe_entries([self.passwords[service_name] for service_name in staged if service_name in self.passwords])
+                self.passwords.update(staged)
+                for service_name, entry in staged.items():
+                    self._search_index.add(service_name, entry.account_id)
+                self._sorted_names.add_many(new_service_names)
+                # 全件を取り込んでから1回だけ保存する
+                self._save(changed_names=staged)
+        except (ValueError, RuntimeError):
+            if not applied:
+                wipe_entries(staged.values()) # 取り込まなかったパスワードは消去する
+            raise
+        return result
+
+    def _unique_service_name(self, service_name, staged):
+        """「サービス名 (2)」のように、まだ使われていないサービス名を作る。"""
+        number = 2
+        while f"{service_name} ({number})" in self.passwords or f"{service_name} ({number})" in staged:
+            number += 1
+        return f"{service_name} ({number})"
+
+    def get_password_count(self):
+        """保存されているパスワードの件数を取得する。"""
+        with self._lock:
+            return len(self._sorted_names)
+
+    @profiled("model.search_passwords")
+    def search_passwords(self, search_term, limit=SEARCH_RESULT_LIMIT):
+        """
+        サービス名またはアカウントIDでパスワードを検索する。
+        部分一致に加えて略語や入力ミスにも一致させ、一致度の高い順に上位limit件だけを返す。
+        パスワードは復号しないため、表示する場合はget_password()で取得する。
+
+        Returns:
+            list: 一致度の高い順の (サービス名, アカウントID, 一致度) のリスト。
+        """
+        with self._lock:
+            found = self._search_index.search_ranked(search_term, limit)
+            return [(service_name, self.passwords[service_name].account_id, score) for score, service_name in found]
+
+    @profiled("model.find_breached_passwords")
+    def find_breached_passwords(self, breach_checker):
+        """
+        全てのパスワードを漏洩したパスワードの一覧と照合する。
+        パスワードは文字列にせず、保持しているバイト列から直接ハッシュ値を求める。
+
+        Args:
+            breach_checker (BreachChecker): 漏洩したパスワードの一覧。
+
+        Returns:
+            list: 漏洩していたパスワードの (サービス名, アカウントID, 漏洩件数) のサービス名順のリスト。
+        """
+        with self._lock:
+            accounts = [(service_name, self.passwords[service_name].account_id) for service_name in self._sorted_names]
+            digests = [password_hash(self.passwords[service_name].secret()) for service_name, _ in accounts]
+        counts = breach_checker.count_hashes(digests)
+        return [(service_name, account_id, count)
+                for (service_name, account_id), count in zip(accounts, counts) if count]
+
+    def entry_digests(self, key):
+        """
+        全てのパスワードの {サービス名: アカウントIDとパスワードのHMAC} を返す。
+        バックアップとの差分を、パスワードそのものを比べずに求めるために使う。
+        """
+        with self._lock:
+            return entry_digests(self.passwords, key)
+
+    @profiled("model.audit_passwords")
+    def audit_passwords(self):
+        """
+        全てのパスワードの使い回し・長さ・強さを診断する。
+        前回の診断以降に追加・変更されたパスワードだけを推定し直すため、再診断は変更の件数分の時間で済む。
+
+        Returns:
+            list: サービス名順のAuditResult（サービス名, アカウントID, 文字数, 推定の強さ（ビット）,
+                弱点の説明のタプル, 同じパスワードを使っている他のサービスの数）のリスト。
+        """
+        with self._lock:
+            return self._auditor.audit(self.passwords, self._sorted_names)
+
+    def get_password(self, service_name):
+        """サービス名に基づいてパスワード情報を取得する。"""
+        with self._lock:
+            entry = self.passwords.get(service_name)
+            if entry is None:
+                return None, None, None
+            return service_name, entry.account_id, entry.password
 
     def get_password_by_index(self, index):
         """インデックスに基づいてパスワード情報を取得する。"""
-        service_names = sorted(list(self.passwords.keys()))
-        if 0 <= index < len(service_names):
-            service_name = service_names[index]
-            data = self.passwords[service_name]
-            return service_name, data["account_id"], data["password"]
-        return None, None, None
+        with self._lock:
+            if 0 <= index < len(self._sorted_names):
+                service_name = self._sorted_names[index]
+                entry = self.passwords[service_name]
+                return service_name, entry.account_id, entry.password
+            return None, None, None
 
     def update_password(self, original_service_name, new_service_name, new_account_id, new_password):
         """パスワード情報を更新する。"""
-        if original_service_name not in self.passwords:
-            raise ValueError(f"サービス名 '{original_service_name}' が見つかりません。")
+        with self._mutation(original_service_name, new_service_name):
+            if original_service_name not in self.passwords:
+                raise ValueError(f"サービス名 '{original_service_name}' が見つかりません。")
 
-        if new_service_name != original_service_name and new_service_name in self.passwords:
-            raise ValueError(f"サービス名 '{new_service_name}' は既に存在します。")
+            if new_service_name != original_service_name and new_service_name in self.passwords:
+                raise ValueError(f"サービス名 '{new_service_name}' は既に存在します。")
 
-        if new_service_name != original_service_name:
-            data = self.passwords.pop(original_service_name)
-        else:
-            data = self.passwords[original_service_name]
-
-        data["account_id"] = new_account_id
-        data["password"] = new_password
-        self.passwords[new_service_name] = data
-        self._save()
+            # 変更前のパスワードは消去してから新しいデータに置き換える
+            self.passwords.pop(original_service_name).wipe()
+            entry = PasswordEntry.from_password(new_account_id, new_password)
+            self.passwords[new_service_name] = entry
+            self._search_index.remove(original_service_name)
+            self._search_index.add(new_service_name, new_account_id)
+            if new_service_name != original_service_name:
+                self._sorted_names.rename(original_service_name, new_service_name)
+            previous_name = original_service_name if new_service_name != original_service_name else None
+            self._record_change("put", new_service_name, entry, previous_name)
 
     def delete_password(self, service_name):
         """パスワードを削除する。"""
-        if service_name not in self.passwords:
-            raise ValueError(f"サービス名 '{service_name}' が見つかりません。")
-        del self.passwords[service_name]
-        self._save()
+        with self._mutation(service_name):
+            if service_name not in self.passwords:
+                raise ValueError(f"サービス名 '{service_name}' が見つかりません。")
+            self.passwords.pop(service_name).wipe()
+            self._search_index.remove(service_name)
+            self._sorted_names.remove(service_name)
+            self._record_change("delete", service_name)
 
     def change_master_password(self, new_master_password: str):
-        """マスターパスワードを変更し、全てのパスワードを新しいマスターパスワードで再暗号化して保存する。"""
+        """
+        マスターパスワードを変更する。
+        データ暗号化キーを包み直すだけなので、パスワードの件数に関係なくすぐに完了する。
+        """
+        # 保存待ちの変更を変更前のマスターパスワードで書き込んでから変更する
+        self.flush()
         # 新しいマスターパスワードを設定
         original_master_password = self.master_password # 変更前のマスターパスワードを保持
         self.master_password = new_master_password
         try:
-            # 新しいマスターパスワードでデータを再保存
-            self._save()
+            # キースロットだけを書き換える。ファイルがまだ無い場合は新しいマスターパスワードで保存する
+            if not rewrap_data_key(original_master_password, new_master_password):
+                self._save()
             return True
         except Exception as e:
             # 失敗した場合、元のマスターパスワードに戻す
             self.master_password = original_master_password
             raise RuntimeError(f"マスターパスワードの更新に失敗しました: {e}")
 
-    def _save(self):
-        """パスワードデータを保存する内部メソッド。"""
+    def close(self, compact=True):
+        """
+        ジャーナルに残っている変更をパスワードファイルに取り込む。
+        バックアップがパスワードファイルだけで完結するよう、アプリ終了時に呼び出す。
+        compact=Falseの場合は、実行中の取り込みの完了だけを待つ（コマンドラインからの単発の操作用）。
+        バックグラウンドで保存している場合は、保存待ちの変更を書き込んでから保存のスレッドを終了する。
+        取り込みの後はlock()でメモリ上のパスワードを消去する。
+        """
+        try:
+            if self._save_worker is not None:
+                self._save_worker.close()
+            self._wait_for_compaction()
+            if compact and self._journal.record_count:
+                with self._exclusive():
+                    # 変更は全てジャーナルに記録されているため、シャード分割時はその分だけを書き直せばよい
+                    self._save(changed_names=())
+        finally:
+            self.lock()
+
+    def lock(self):
+        """
+        メモリ上の全てのパスワードを0で上書きして破棄する。
+        以降はパスワードを参照できなくなるため、保管庫を使い終わったときに呼び出す。
+        """
+        self._wait_for_compaction()
+        with self._lock:
+            wipe_entries(self.passwords.values(), close=True)
+            self.passwords.clear()
+            self._auditor.clear()
+            self._search_index = SearchIndex()
+            self._sorted_names = SortedKeys()
+
+    def flush(self):
+        """
+        バックグラウンドで保存待ちの変更を全て書き込み、完了するまで待つ。
+        書き込みに失敗した場合はRuntimeErrorになる。同期して保存している場合は何もしない。
+        """
+        if self._save_worker is not None:
+            self._save_worker.flush()
+
+    def refresh(self):
+        """
+        読み込み後に他のセッションが保管庫を更新していれば、その変更を取り込む。
+        常駐して読み取りに応える場合など、古い内容を返さないよう読み取りの前に呼び出す。
+        世代番号が変わっていなければロックファイルを読むだけで済む。
+        """
+        try:
+            generation = read_vault_state().generation
+        except OSError as e:
+            raise RuntimeError(f"他のセッションの変更を読み込めませんでした: {e}")
+        if generation is not None and generation == self._journal.generation:
+            return
+        # 保存待ちの変更は、他のセッションの変更と競合しないかを確かめながら先に書き込む
+        self.flush()
+        with self._exclusive():
+            pass
+
+    def take_save_errors(self):
+        """
+        バックグラウンドでの保存で起きたエラーのメッセージを取り出す（前回の呼び出し以降の分）。
+        他のセッションの変更と競合して保存しなかった変更のメッセージも含む。
+        """
+        if self._save_worker is None:
+            return []
+        return self._save_worker.take_errors()
+
+    @contextmanager
+    def _mutation(self, *service_names):
+        """
+        パスワードを変更するwith文。service_namesには変更するサービス名を全て渡す。
+        同期して保存する場合は_exclusive()と同じ。バックグラウンドで保存する場合は、
+        ロックを取得せずに変更前のデータを控え、保存時の他のセッションとの競合の判定に使う。
+        """
+        if self._save_worker is None:
+            with self._exclusive(*service_names):
+                yield
+            return
+        with self._lock:
+            self._change_base = {service_name: _copy_entry(self.passwords.get(service_name))
+                                 for service_name in service_names}
+            try:
+                yield
+            finally:
+                # 変更せずに終わった場合は、控えた変更前のデータを消去する
+                _wipe_base(self._change_base)
+                self._change_base = {}
+
+    @contextmanager
+    def _exclusive(self, *service_names):
+        """
+        保管庫の書き込みロックを取得し、読み込み後に他のセッション（別のプロセス）が行った変更を取り込んでから
+        with文の中の変更を行う。service_namesのいずれかが他のセッションで変更されていた場合は、
+        古い内容に基づく変更で上書きしないよう、最新の内容を取り込んだ上でValueErrorにする。
+        """
+        # 取り込み中のスレッドもロックを使うため、ロックを取得する前に完了を待つ
+        self._wait_for_compaction()
+        try:
+            with vault_lock(), self._lock:
+                self._sync(service_names)
+                yield
+        except OSError as e:
+            raise RuntimeError(f"保管庫を更新できませんでした: {e}")
+
+    def _sync(self, service_names):
+        """他のセッションの変更を取り込み、service_namesのうち変更されていたものがあればValueErrorにする。"""
+        try:
+            passwords, changed_names = sync_passwords(self.passwords, self.master_password, self._journal)
+        except ValueError:
+            raise
+        except (OSError, Exception) as e:
+            raise RuntimeError(f"他のセッションの変更を読み込めませんでした: {e}")
+
+        if changed_names is None:
+            # パスワードファイルから読み込み直した場合は、変更の有無を対象のサービス名だけ比べる
+            conflicts = [service_name for service_name in service_names
+                         if not _same_entry(self.passwords.get(service_name), passwords.get(service_name))]
+            previous_passwords, self.passwords = self.passwords, passwords
+            self._build_indexes()
+            wipe_entries(previous_passwords.values())
+        else:
+            conflicts = [service_name for service_name in service_names if service_name in changed_names]
+            for service_name in changed_names:
+                self._reindex(service_name)
+
+        if conflicts:
+            raise ValueError(f"サービス名 '{conflicts[0]}' は他のセッションで変更されています。"
+                             "最新の内容を確認してからやり直してください。")
+
+    def _reindex(self, service_name):
+        """他のセッションで変更されたサービス名の検索用のインデックスとソート順を更新する。"""
+        entry = self.passwords.get(service_name)
+        self._search_index.remove(service_name)
+        if entry is None:
+            if service_name in self._sorted_names:
+                self._sorted_names.remove(service_name)
+            return
+        self._search_index.add(service_name, entry.account_id)
+        if service_name not in self._sorted_names:
+            self._sorted_names.add(service_name)
+
+    def _record_change(self, op, service_name, data=None, previous_name=None):
+        """
+        1件の変更をジャーナルに追記する内部メソッド。
+        バックグラウンドで保存する場合は、変更の複製を保存のスレッドに渡してすぐに戻る。
+        """
+        if self._save_worker is not None:
+            # 保存するまでにメモリ上のデータが消去・変更されても影響しないよう、複製して渡す
+            base, self._change_base = self._change_base, {}
+            self._save_worker.put(_PendingChange(op, service_name, _copy_entry(data), previous_name, base))
+            return
+        self._append_changes([(op, service_name, data, previous_name)])
+
+    def _append_changes(self, changes):
+        """変更（(op, service_name, data, previous_name) のリスト）をまとめてジャーナルに追記する。"""
+        try:
+            appended = append_journal_changes(self._journal, self.master_password, changes)
+        except (OSError, Exception) as e:
+            raise RuntimeError(f"データ保存中にエラーが発生しました: {e}")
+        with self._lock:
+            if not appended:
+                # パスワードファイルがまだ無い場合は全体を保存する
+                self._save()
+            elif self._journal.needs_compaction():
+                self._start_compaction()
+
+    @profiled("model.write_pending")
+    def _write_pending(self, take):
+        """
+        保存のスレッドから呼び出され、たまっている変更をまとめてジャーナルに追記する。
+        他のセッションの変更と競合した変更は保存せずに取り消し、そのメッセージのリストを返す。
+        """
+        # 取り込み中のスレッドもロックを使うため、ロックを取得する前に完了を待つ
+        self._wait_for_compaction()
+        try:
+            with vault_lock():
+                with self._lock:
+                    changes = take()
+                    if not changes:
+                        return []
+                    try:
+                        changes, dropped, conflicts = self._merge_pending(changes)
+                    except Exception:
+                        self._save_worker.requeue(changes)
+                        raise
+                    _wipe_changes(dropped)
+
+                try:
+                    self._append_changes([change[:4] for change in changes])
+                except Exception:
+                    self._save_worker.requeue(changes)
+                    raise
+                _wipe_changes(changes)
+        except OSError as e:
+            raise RuntimeError(f"データ保存中にエラーが発生しました: {e}")
+        except ValueError as e:
+            raise RuntimeError(str(e))
+        return [f"サービス名 '{service_name}' の変更は、他のセッションでの変更と競合したため保存されませんでした。"
+                for service_name in sorted(conflicts)]
+
+    def _merge_pending(self, changes):
+        """
+        他のセッションの変更を取り込み、保存待ちの変更と競合していないかを調べる。
+        競合したサービス名に関係する変更は取り消し、メモリ上のデータを他のセッションの変更後の内容にする。
+
+        Returns:
+            tuple: (保存する変更のリスト, 取り消した変更のリスト, 競合したサービス名の集合)
+        """
+        base = {}
+        for change in changes:
+            for service_name, entry in change.base.items():
+                base.setdefault(service_name, entry)
+
+        passwords, changed_names = sync_passwords(self.passwords, self.master_password, self._journal)
+        if changed_names is None:
+            # パスワードファイルから読み込み直した場合は、変更前のデータと比べて競合を判定する
+            conflicts = {service_name for service_name in base
+                         if not _same_entry(base[service_name], passwords.get(service_name))}
+        else:
+            conflicts = set(base) & changed_names
+
+        # 取り消す変更に関係するサービス名の変更は、続けて行われたものも全て取り消す
+        dropped_names = set(conflicts)
+        while True:
+            dropped = [change for change in changes if _change_names(change) & dropped_names]
+            grown = dropped_names.union(*(_change_names(change) for change in dropped))
+            if grown == dropped_names:
+                break
+            dropped_names = grown
+        kept = [change for change in changes if not _change_names(change) & dropped_names]
+
+        if changed_names is None:
+            previous_passwords, self.passwords = self.passwords, passwords
+            for change in kept:
+                _apply_change(self.passwords, change)
+            self._build_indexes()
+            wipe_entries(previous_passwords.values())
+        else:
+            # 他のセッションで変更されていないサービス名は、取り消した変更の前のデータに戻す
+            for service_name in dropped_names - changed_names:
+                entry = base.get(service_name)
+                previous = self.passwords.pop(service_name, None)
+                if previous is not None:
+                    previous.wipe()
+                if entry is not None:
+                    self.passwords[service_name] = entry.copy()
+            for service_name in changed_names | dropped_names:
+                self._reindex(service_name)
+        return kept, dropped, conflicts
+
+    def _start_compaction(self):
+        """ジャーナルのパスワードファイルへの取り込みをバックグラウンドで開始する。"""
+        if self._compaction_thread is not None and self._compaction_thread.is_alive():
+            return
+        # 取り込み中も変更できるよう、現時点の内容と連番を控えてから別スレッドで書き込む
+        # copy()はパスワードを後から復号するデータを復号せずに複製する
+        snapshot = {service_name: entry.copy() for service_name, entry in self.passwords.items()}
+        journal_seq = self._journal.last_seq
+        self._compaction_thread = threading.Thread(
+            target=self._compact, args=(snapshot, self.master_password, journal_seq)
+        )
+        self._compaction_thread.start()
+
+    def _compact(self, snapshot, master_password, journal_seq):
+        try:
+            save_passwords(snapshot, master_password, self._journal, journal_seq, changed_names=())
+        except Exception:
+            # 取り込みに失敗してもジャーナルに変更が残っているため、次の機会に再試行する
+            pass
+        finally:
+            # 複製したパスワードのバッファも消去する（RecordStoreのキャッシュは本体と共有のため残す）
+            for entry in snapshot.values():
+                entry.wipe()
+
+    def _wait_for_compaction(self):
+        # 保存のスレッドからも呼び出されるため、属性を一度だけ読み出して使う
+        compaction_thread = self._compaction_thread
+        if compaction_thread is not None:
+            compaction_thread.join()
+            if self._compaction_thread is compaction_thread:
+                self._compaction_thread = None
+
+    def _save(self, changed_names=None):
+        """
+        パスワードデータを保存する内部メソッド。
+        changed_namesにはジャーナルに記録していない変更のサービス名を渡す（Noneの場合は全体を書き直す）。
+        """
+        self._wait_for_compaction()
         try:
             # save_passwordsにマスターパスワードを渡す
-            save_passwords(self.passwords, self.master_password)
+            save_passwords(self.passwords, self.master_password, self._journal, changed_names=changed_names)
         except (OSError, Exception) as e:
-            raise RuntimeError(f"データ保存中にエラーが発生しました: {e}")
\ No newline at end of file
+            raise RuntimeError(f"データ保存中にエラーが発生しました: {e}")
+
+def _same_entry(entry, other):
+    """2つのPasswordEntry（またはNone）が同じアカウントIDとパスワードかを判定する。"""
+    if entry is None or other is None:
+        return entry is other
+    return entry.account_id == other.account_id and entry.secret() == other.secret()
+
+def _copy_entry(entry):
+    return entry.copy() if entry is not None else None
+
+def _change_names(change):
+    """変更に関係するサービス名（変更前のサービス名を含む）の集合を返す。"""
+    names = set(change.base)
+    names.add(change.service_name)
+    if change.previous_name is not None:
+        names.add(change.previous_name)
+    return names
+
+def _apply_change(passwords, change):
+    """保存待ちの変更を、読み込み直したパスワードの辞書に適用し直す。"""
+    removed = []
+    if change.previous_name is not None:
+        removed.append(passwords.pop(change.previous_name, None))
+    if change.op == "put":
+        removed.append(passwords.get(change.service_name))
+        passwords[change.service_name] = change.data.copy()
+    else:
+        removed.append(passwords.pop(change.service_name, None))
+    for entry in removed:
+        if entry is not None:
+            entry.wipe()
+
+def _wipe_changes(changes):
+    """保存の済んだ（または取り消した）変更の複製のパスワードを消去する。"""
+    for change in changes:
+        if change.data is not None:
+            change.data.wipe()
+        _wipe_base(change.base)
+
+def _wipe_base(base):
+    for entry in base.values():
+        if entry is not None:
+            entry.wipe()
@@ -0,0 +1,195 @@
+import hmac
+import math
+import os
+import re
+import string
+from collections import namedtuple
+
+from pwd_gen_tool.config import AUDIT_MIN_LENGTH, AUDIT_WEAK_BITS
+
+# bits: パスワードの推定の強さ（総当たりで当てるのに必要な試行回数の対数、ビット）
+# issues: 見つかった弱点の説明のタプル
+Strength = namedtuple("Strength", ["length", "bits", "issues"])
+
+# 診断結果の1件分。reuse_countは同じパスワードを使っている他のサービスの数
+AuditResult = namedtuple("AuditResult", ["service_name", "account_id", "length", "bits", "issues", "reuse_count"])
+
+ISSUE_SHORT = "短い"
+ISSUE_WEAK = "推測されやすい"
+ISSUE_REUSED = "使い回し"
+ISSUE_WORD = "よく使われる単語"
+ISSUE_SEQUENCE = "連続した文字"
+ISSUE_REPEAT = "同じ文字の繰り返し"
+ISSUE_YEAR = "年号"
+
+# よく使われるパスワードや単語（小文字）。含まれる場合は、単語全体を一覧から1つ選ぶ程度の強さとして数える
+_COMMON_WORDS = (
+    "password", "passwd", "admin", "administrator", "root", "user", "login", "welcome", "letmein",
+    "master", "secret", "qwerty", "azerty", "dragon", "monkey", "shadow", "sunshine", "princess",
+    "football", "baseball", "soccer", "hockey", "superman", "batman", "trustno1", "iloveyou", "love",
+    "hello", "freedom", "whatever", "starwars", "pokemon", "computer", "internet", "michael", "jordan",
+    "charlie", "summer", "winter", "spring", "autumn", "flower", "cookie", "cheese", "pepper", "ginger",
+    "orange", "banana", "apple", "google", "amazon", "facebook", "twitter", "github", "gmail", "yahoo",
+    "sakura", "tokyo", "japan", "pass", "test", "guest", "default", "changeme", "access", "abc123",
+)
+_WORD_BITS = math.log2(len(_COMMON_WORDS)) + 1 # 大文字・小文字の変化の分を1ビット足す
+_YEAR_BITS = math.log2(200) # 1900〜2099年
+# 記号を似た文字に置き換えた単語（p@ssw0rd など）も単語として見つけるための対応表
+_LEET_TABLE = str.maketrans({"@": "a", "4": "a", "3": "e", "1": "i", "!": "i", "0": "o", "$": "s", "5": "s", "+": "t", "7": "t"})
+_KEYBOARD_ROWS = ("1234567890", "qwertyuiop", "asdfghjkl", "zxcvbnm", string.ascii_lowercase)
+
+_WORD_PATTERN = re.compile("|".join(sorted(map(re.escape, _COMMON_WORDS), key=len, reverse=True)))
+_YEAR_PATTERN = re.compile(r"(?:19|20)\d\d")
+_REPEAT_PATTERN = re.compile(r"(.)\1{2,}")
+
+def estimate_strength(password: str) -> Strength:
+    """
+    パスワードの強さを推定する。
+    使われている文字の種類から1文字あたりのビット数を求め、長さを掛けたものを基本とする。
+    よく使われる単語・連続した文字（abc、321、キーボードの並び）・同じ文字の繰り返し・年号の部分は、
+    その部分全体で数ビットとして数える。
+    """
+    per_char = math.log2(_pool_size(password)) if password else 0.0
+    covered = [False] * len(password)
+    bits = 0.0
+    issues = []
+    for issue, start, end, cost in _weak_patterns(password, per_char):
+        if any(covered[start:end]):
+            continue # 先に見つかった弱点と重なる部分は二重に数えない
+        covered[start:end] = [True] * (end - start)
+        bits += cost
+        if issue not in issues:
+            issues.append(issue)
+    bits += per_char * covered.count(False)
+
+    if len(password) < AUDIT_MIN_LENGTH:
+        issues.insert(0, ISSUE_SHORT)
+    if bits < AUDIT_WEAK_BITS:
+        issues.insert(0, ISSUE_WEAK)
+    return Strength(len(password), round(bits, 1), tuple(issues))
+
+def _pool_size(password: str) -> int:
+    """パスワードに使われている文字の種類から、1文字が取りうる値の数を求める。"""
+    pool = 0
+    if any(char in string.ascii_lowercase for char in password):
+        pool += 26
+    if any(char in string.ascii_uppercase for char in password):
+        pool += 26
+    if any(char in string.digits for char in password):
+        pool += 10
+    if any(char in string.punctuation or char == " " for char in password):
+        pool += 33
+    if any(not char.isascii() for char in password):
+        pool += 100 # 全角文字などは種類が多いが、実際に使われるのは一部と見なす
+    return pool
+
+def _weak_patterns(password: str, per_char: float):
+    """弱点の (説明, 開始位置, 終了位置, その部分のビット数) を、弱いものから順に返す。"""
+    lowered = password.lower()
+    for match in _WORD_PATTERN.finditer(lowered.translate(_LEET_TABLE)):
+        yield ISSUE_WORD, match.start(), match.end(), _WORD_BITS
+    for start, end in _sequences(lowered):
+        # 始まりの文字と、向き・長さの分だけを数える
+        yield ISSUE_SEQUENCE, start, end, per_char + 1 + math.log2(end - start)
+    for match in _REPEAT_PATTERN.finditer(lowered):
+        yield ISSUE_REPEAT, match.start(), match.end(), per_char + math.log2(match.end() - match.start())
+    for match in _YEAR_PATTERN.finditer(lowered):
+        yield ISSUE_YEAR, match.start(), match.end(), _YEAR_BITS
+
+def _sequences(text: str):
+    """3文字以上の連続した文字（アルファベット・数字・キーボードの並びの順または逆順）の範囲を返す。"""
+    start = 0
+    while start < len(text) - 2:
+        steps = _steps(text[start], text[start + 1])
+        end = start + 2 if steps else start + 1
+        # 同じ並びの同じ向きに続いている間だけ伸ばす（"aba" などは連続と見なさない）
+        while steps and end < len(text) and steps & _steps(text[end - 1], text[end]):
+            steps &= _steps(text[end - 1], text[end])
+            end += 1
+        if end - start >= 3:
+            yield start, end
+            start = end
+        else:
+            start += 1
+
+def _steps(previous: str, char: str) -> set:
+    """2文字が隣り合っている並びとその向きの {(並びの番号, ±1)} を返す。"""
+    steps = set()
+    for row_number, row in enumerate(_KEYBOARD_ROWS):
+        index = row.find(previous)
+        next_index = row.find(char)
+        if index != -1 and next_index != -1 and abs(next_index - index) == 1:
+            steps.add((row_number, next_index - index))
+    return steps
+
+class PasswordAuditor:
+    """
+    保管庫の全てのパスワードの使い回しと強さを診断する。
+
+    使い回しは、パスワードのHMAC（セッションごとのランダムな鍵を使うため、メモリ上の値から
+    パスワードを総当たりで調べることはできない）で分類して、1回の走査で見つける。
+    強さの推定結果は、サービス名ごとの診断したエントリーと、パスワードのHMACごとに保持し、
+    前回の診断以降に追加・変更されたエントリーだけを復号・推定し直す。
+    """
+    def __init__(self):
+        self._key = os.urandom(32)
+        self._entries = {} # {サービス名: (診断したPasswordEntry, HMAC)}
+        self._strengths = {} # {HMAC: Strength}
+
+    def audit(self, passwords: dict, service_names) -> list:
+        """
+        Args:
+            passwords (dict): {サービス名: PasswordEntry}。
+            service_names: 診断するサービス名（この順で結果を返す）。
+
+        Returns:
+            list: AuditResultのリスト。
+        """
+        entries = {}
+        digests = []
+        for service_name in service_names:
+            entry = passwords[service_name]
+            cached = self._entries.get(service_name)
+            # エントリーは変更のたびに新しいオブジェクトに置き換わるため、同じオブジェクトなら診断済み
+            if cached is not None and cached[0] is entry:
+                digest = cached[1]
+            else:
+                digest = hmac.digest(self._key, entry.secret(), "sha256")
+                if digest not in self._strengths:
+                    self._strengths[digest] = estimate_strength(entry.password)
+            entries[service_name] = (entry, digest)
+            digests.append(digest)
+
+        # 削除・変更されたエントリーの結果は捨てる
+        self._entries = entries
+        self._strengths = {digest: self._strengths[digest] for digest in digests}
+
+        reuse_counts = {}
+        for digest in digests:
+            reuse_counts[digest] = reuse_counts.get(digest, 0) + 1
+        results = []
+        for (service_name, (entry, digest)) in entries.items():
+            strength = self._strengths[digest]
+            reuse_count = reuse_counts[digest] - 1
+            issues = ((ISSUE_REUSED,) if reuse_count else ()) + strength.issues
+            results.append(AuditResult(service_name, entry.account_id, strength.length, strength.bits,
+                                       issues, reuse_count))
+        return results
+
+    def clear(self):
+        self._entries.clear()
+        self._strengths.clear()
+
+# 診断結果の並べ替えの順序。既定は弱いものから
+AUDIT_SORT_KEYS = {
+    "strength": lambda result: (result.bits, result.service_name),
+    "service": lambda result: result.service_name,
+    "reuse": lambda result: (-result.reuse_count, result.bits, result.service_name),
+    "length": lambda result: (result.length, result.bits, result.service_name),
+}
+
+def sort_audit_results(results, sort_key: str = "strength") -> list:
+    """診断結果をsort_key（AUDIT_SORT_KEYSのいずれか）の順に並べ替える。"""
+    if sort_key not in AUDIT_SORT_KEYS:
+        raise ValueError(f"不明な並べ替えの順序です: {sort_key}")
+    return sorted(results, key=AUDIT_SORT_KEYS[sort_key])
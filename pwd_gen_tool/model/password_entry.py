@@ -0,0 +1,115 @@
+import gc
+import sys
+from contextlib import contextmanager
+
+class PasswordEntry:
+    """
+    パスワードの辞書の1件分のデータ（アカウントIDとパスワード）。
+    件数分作られるため、辞書ではなく__slots__で属性を固定して1件あたりのメモリを抑える。
+    パスワードはUTF-8のbytearrayで保持し、削除・更新・ロック時にwipe()で0で上書きしてから手放す。
+    パスワードを個別に暗号化した保管庫から読み込んだ場合は、参照されるまでRecordStoreから復号しない。
+    """
+    __slots__ = ("account_id", "_secret", "_store", "_index")
+
+    def __init__(self, account_id: str, secret: bytearray = None, store=None, index: int = 0):
+        self.account_id = account_id
+        self._secret = secret
+        self._store = store
+        self._index = index
+
+    @classmethod
+    def from_password(cls, account_id: str, password: str) -> "PasswordEntry":
+        """アカウントIDとパスワードの文字列から作る。同じアカウントIDは1つの文字列を共有する。"""
+        return cls(sys.intern(account_id), bytearray(password.encode('utf-8')))
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "PasswordEntry":
+        """{"account_id": ..., "password": ...} の辞書（JSON形式のペイロードやジャーナル）から作る。"""
+        return cls.from_password(data["account_id"], data["password"])
+
+    @property
+    def password(self) -> str:
+        return self.secret().decode('utf-8')
+
+    def secret(self):
+        """
+        パスワードのUTF-8のバイト列を返す。
+        RecordStoreから復号した場合はキャッシュのバッファをそのまま返すため、呼び出し側で保持し続けないこと
+        （キャッシュから追い出されると0で上書きされる）。
+        """
+        if self._secret is not None:
+            return self._secret
+        if self._store is None:
+            raise ValueError("パスワードは既に消去されています。")
+        return self._store.read(self._index)
+
+    def set_password(self, password: str):
+        """パスワードを変更する。変更前のパスワードのバッファは0で上書きする。"""
+        self.wipe()
+        self._secret = bytearray(password.encode('utf-8'))
+
+    def wipe(self):
+        """
+        保持しているパスワードのバッファを0で上書きして手放す。
+        表示などのために作られたstrのコピーは消去できないため、できる範囲での消去になる。
+        """
+        if self._secret is not None:
+            self._secret[:] = bytes(len(self._secret))
+            self._secret = None
+        self._store = None
+
+    def is_lazy(self) -> bool:
+        """パスワードを参照時にRecordStoreから復号するデータかを判定する。"""
+        return self._secret is None and self._store is not None
+
+    def encrypted_record(self, service_name: str):
+        """
+        パスワードが変更されておらず、同じサービス名のまま保存できる場合は、暗号化されたままのレコードを返す。
+        それ以外の場合はNoneを返す。
+        """
+        if not self.is_lazy() or service_name != self._store.service_name(self._index):
+            return None
+        return self._store.raw(self._index)
+
+    def copy(self) -> "PasswordEntry":
+        """複製する。参照時に復号するデータは復号せずに、それ以外はパスワードのバッファごと複製する。"""
+        secret = bytearray(self._secret) if self._secret is not None else None
+        return PasswordEntry(self.account_id, secret, self._store, self._index)
+
+    def to_dict(self) -> dict:
+        """ジャーナルやJSON形式のペイロードに保存する辞書に変換する。"""
+        return {"account_id": self.account_id, "password": self.password}
+
+    def __repr__(self):
+        # パスワードがログやトレースバックに出ないようにする
+        return f"PasswordEntry(account_id={self.account_id!r})"
+
+def wipe_entries(entries, close: bool = False):
+    """
+    複数のPasswordEntryのパスワードを消去し、参照していたRecordStoreの復号済みのキャッシュも破棄する。
+    close=Trueの場合はRecordStoreのメモリマップも閉じる（複製を含め、同じRecordStoreを使うデータが残っていないときだけ）。
+    """
+    stores = set()
+    for entry in entries:
+        if entry._store is not None:
+            stores.add(entry._store)
+        entry.wipe()
+    for store in stores:
+        if close:
+            store.close()
+        else:
+            store.clear_cache()
+
+@contextmanager
+def gc_paused():
+    """
+    ブロックの中の間だけ、循環参照のガベージコレクションを止める。
+    読み込み時に件数分のPasswordEntryを作る間、ガベージコレクションが何度も走って遅くなるのを避ける。
+    """
+    enabled = gc.isenabled()
+    gc.disable()
+    try:
+        yield
+    finally:
+        if enabled:
+            gc.enable()
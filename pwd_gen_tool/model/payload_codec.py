@@ -0,0 +1,367 @@
+import io
+import json
+import lzma
+import struct
+import sys
+import zlib
+from array import array
+from itertools import accumulate, islice
+
+from pwd_gen_tool.config import PAYLOAD_CODEC, PAYLOAD_COMPRESSION
+from pwd_gen_tool.model.password_entry import PasswordEntry, gc_paused
+
+# レコード形式のペイロードの先頭に置く識別子とバージョン（JSON形式は必ず"{"で始まるため区別できる）
+RECORDS_MAGIC = b"PWDR"
+RECORDS_VERSION = 3
+# 以前の形式（読み込みのみ対応）。1は全件を1つのブロックにまとめていた形式、2はパスワードも文字列に連結していた形式
+_TEXT_SECRET_VERSIONS = (1, 2)
+
+# パスワードを個別に暗号化した保管庫の索引（サービス名、アカウントID、レコードの位置とサイズ）の識別子とバージョン
+INDEX_MAGIC = b"PWDI"
+INDEX_VERSION = 1
+
+# シャード分割した保管庫で、パスワードファイル本体に置くシャードの一覧の識別子とバージョン
+SHARD_MANIFEST_MAGIC = b"PWDS"
+SHARD_MANIFEST_VERSION = 1
+_SHARD_MANIFEST_STRUCT = struct.Struct(">4sBHQ") # 識別子、バージョン、シャード数、取り込み済みのジャーナルの連番
+SHARD_MANIFEST_SIZE = _SHARD_MANIFEST_STRUCT.size
+
+# 圧縮方式とペイロードに記録する番号
+COMPRESSION_IDS = {"none": 0, "zlib": 1, "lzma": 2}
+COMPRESSION_NAMES = {compression_id: name for name, compression_id in COMPRESSION_IDS.items()}
+
+_PREFIX_STRUCT = struct.Struct(">4sBB") # 識別子、バージョン、圧縮方式
+_COUNTS_STRUCT = struct.Struct(">QI") # 取り込み済みのジャーナルの連番、件数
+# 各フィールドの長さ（サービス名とアカウントIDは文字数、パスワードはUTF-8のバイト数）は
+# 32ビット符号無し整数の配列として、ビッグエンディアンでまとめて記録する
+_LENGTH_TYPECODE = "I"
+_OFFSET_TYPECODE = "Q" # 索引に記録するレコードの位置（64ビット符号無し整数）
+_FIELDS_PER_ENTRY = 3 # サービス名、アカウントID、パスワード
+_BLOCK_STRUCT = struct.Struct(">II") # ブロック内の件数、連結したサービス名とアカウントIDのバイト数
+_BLOCK_ENTRIES = 4096 # 1ブロックの件数
+_READ_SIZE = 64 * 1024 # 展開する際に一度に読み込むバイト数
+
+class JsonCodec:
+    """以前の形式。パスワードの辞書をインデント付きのJSONで表す。読み込みと移行のために残している。"""
+    name = "json"
+
+    def encode(self, passwords: dict, journal_seq: int) -> bytes:
+        entries = {service_name: entry.to_dict() for service_name, entry in passwords.items()}
+        payload = {"entries": entries, "journal_seq": journal_seq}
+        return json.dumps(payload, indent=4, ensure_ascii=False).encode('utf-8')
+
+    def decode(self, data: bytes):
+        payload = json.loads(data.decode('utf-8'))
+        passwords = {service_name: PasswordEntry.from_dict(entry) for service_name, entry in payload["entries"].items()}
+        return passwords, payload.get("journal_seq", 0)
+
+class RecordCodec:
+    """
+    パスワードの辞書を長さ付きのフィールドの並びで表すコンパクトな形式。
+    一定件数ごとのブロックに分け、各ブロックは全フィールドの長さの配列、サービス名とアカウントIDを連結した
+    1つのUTF-8文字列、パスワードを連結したバイト列からなる。読み込み時はブロックごとに文字列のデコードを
+    1回で済ませてから長さに従って切り出し、パスワードは文字列にせずにbytearrayのまま切り出す。
+    ファイル全体を一度にメモリに展開せずに少しずつ読み込める。
+    """
+    name = "records"
+
+    def __init__(self, compression=PAYLOAD_COMPRESSION):
+        if compression not in COMPRESSION_IDS:
+            raise ValueError(f"不明な圧縮方式です: {compression}")
+        self.compression = compression
+
+    def encode(self, passwords: dict, journal_seq: int) -> bytes:
+        return b"".join(self.iter_encode(passwords, journal_seq))
+
+    def iter_encode(self, passwords: dict, journal_seq: int):
+        """エンコードした結果を、ブロックごとに少しずつ返す。"""
+        yield _PREFIX_STRUCT.pack(RECORDS_MAGIC, RECORDS_VERSION, COMPRESSION_IDS[self.compression])
+        compressor = _compressor(self.compression)
+        yield compressor.compress(_COUNTS_STRUCT.pack(journal_seq, len(passwords)))
+
+        items = iter(passwords.items())
+        while True:
+            block = list(islice(items, _BLOCK_ENTRIES))
+            if not block:
+                break
+            yield compressor.compress(_encode_block(block))
+        yield compressor.flush()
+
+    def decode(self, data: bytes):
+        return self.decode_stream(io.BytesIO(data))
+
+    def decode_stream(self, reader):
+        """readメソッドを持つオブジェクトから、ブロックごとに読み込んでデコードする。"""
+        magic, version, compression_id = _PREFIX_STRUCT.unpack(_read_exact(reader, _PREFIX_STRUCT.size))
+        if magic != RECORDS_MAGIC or version not in (RECORDS_VERSION,) + _TEXT_SECRET_VERSIONS:
+            raise ValueError(f"対応していないペイロードの形式です: {version}")
+        if compression_id not in COMPRESSION_NAMES:
+            raise ValueError(f"不明な圧縮方式です: {compression_id}")
+        body = _DecompressingReader(reader, COMPRESSION_NAMES[compression_id])
+        journal_seq, count = _COUNTS_STRUCT.unpack(_read_exact(body, _COUNTS_STRUCT.size))
+
+        passwords = {}
+        if version == 1:
+            # ブロックに分けていなかった以前の形式は、全件を1つのブロックとして扱う
+            rest = body.read(-1)
+            _decode_text_block(passwords, _read_lengths(io.BytesIO(rest), count), rest[count * _FIELDS_PER_ENTRY * 4:])
+            return passwords, journal_seq
+
+        with gc_paused():
+            self._decode_blocks(passwords, body, version, count)
+        return passwords, journal_seq
+
+    def _decode_blocks(self, passwords: dict, body, version: int, count: int):
+        remaining = count
+        while remaining > 0:
+            entry_count, text_size = _BLOCK_STRUCT.unpack(_read_exact(body, _BLOCK_STRUCT.size))
+            if entry_count == 0 or entry_count > remaining:
+                raise ValueError("ペイロードのブロックの件数が一致しません。")
+            lengths = _read_lengths(body, entry_count)
+            text_bytes = _read_exact(body, text_size)
+            if version == RECORDS_VERSION:
+                secrets = bytearray(_read_exact(body, sum(lengths[2::_FIELDS_PER_ENTRY])))
+                _decode_block(passwords, lengths, text_bytes, secrets)
+            else:
+                _decode_text_block(passwords, lengths, text_bytes)
+            remaining -= entry_count
+        if body.read(1):
+            raise ValueError("ペイロードの後ろに余分なデータがあります。")
+
+def get_codec(name=PAYLOAD_CODEC):
+    """保存に使う形式のコーデックを返す。"""
+    if name == JsonCodec.name:
+        return JsonCodec()
+    if name == RecordCodec.name:
+        return RecordCodec()
+    raise ValueError(f"不明なペイロードの形式です: {name}")
+
+def encode_payload(passwords: dict, journal_seq: int = 0, codec=None) -> bytes:
+    """パスワードの辞書と取り込み済みのジャーナルの連番を、暗号化する前のバイト列に変換する。"""
+    return (codec or get_codec()).encode(passwords, journal_seq)
+
+def iter_encode_payload(passwords: dict, journal_seq: int = 0, codec=None):
+    """encode_payloadの結果を少しずつ返す。レコード形式以外は一度にエンコードして返す。"""
+    codec = codec or get_codec()
+    if isinstance(codec, RecordCodec):
+        yield from codec.iter_encode(passwords, journal_seq)
+    else:
+        yield codec.encode(passwords, journal_seq)
+
+def decode_payload(data: bytes):
+    """
+    復号したバイト列から(パスワードの辞書, 取り込み済みのジャーナルの連番)を取り出す。
+    形式は先頭のバイトから判別するため、設定に関係なくどちらの形式でも読み込める。
+    """
+    if data.startswith(RECORDS_MAGIC):
+        return RecordCodec().decode(data)
+    return JsonCodec().decode(data)
+
+def decode_payload_stream(reader):
+    """
+    read・peekメソッドを持つオブジェクトから少しずつ読み込んでdecode_payloadと同じ結果を返す。
+    JSON形式は一度に全体を読み込む。
+    """
+    if reader.peek(len(RECORDS_MAGIC))[:len(RECORDS_MAGIC)] == RECORDS_MAGIC:
+        return RecordCodec().decode_stream(reader)
+    return JsonCodec().decode(reader.read())
+
+def iter_encode_index(entries: list, journal_seq: int = 0, compression=PAYLOAD_COMPRESSION):
+    """
+    索引をエンコードし、ブロックごとに少しずつ返す。
+
+    Args:
+        entries (list): (サービス名, アカウントID, レコードの位置, レコードのサイズ)のリスト。
+    """
+    yield _PREFIX_STRUCT.pack(INDEX_MAGIC, INDEX_VERSION, COMPRESSION_IDS[compression])
+    compressor = _compressor(compression)
+    yield compressor.compress(_COUNTS_STRUCT.pack(journal_seq, len(entries)))
+    for start in range(0, len(entries), _BLOCK_ENTRIES):
+        block = entries[start:start + _BLOCK_ENTRIES]
+        lengths = array(_LENGTH_TYPECODE)
+        offsets = array(_OFFSET_TYPECODE)
+        sizes = array(_LENGTH_TYPECODE)
+        fields = []
+        for service_name, account_id, offset, size in block:
+            fields += (service_name, account_id)
+            lengths.extend((len(service_name), len(account_id)))
+            offsets.append(offset)
+            sizes.append(size)
+        if sys.byteorder == "little":
+            for values in (lengths, offsets, sizes):
+                values.byteswap()
+        text = "".join(fields).encode('utf-8')
+        yield compressor.compress(b"".join([
+            _BLOCK_STRUCT.pack(len(block), len(text)), lengths.tobytes(), offsets.tobytes(), sizes.tobytes(), text
+        ]))
+    yield compressor.flush()
+
+def decode_index_stream(reader):
+    """
+    readメソッドを持つオブジェクトから索引を読み込み、(索引のイテレーター, 取り込み済みのジャーナルの連番)を返す。
+    イテレーターはブロックごとに読み込みながら、1ブロック分の
+    (サービス名のリスト, アカウントIDのリスト, レコードの位置の配列, レコードのサイズの配列)を返す。
+    """
+    magic, version, compression_id = _PREFIX_STRUCT.unpack(_read_exact(reader, _PREFIX_STRUCT.size))
+    if magic != INDEX_MAGIC or version != INDEX_VERSION:
+        raise ValueError(f"対応していない索引の形式です: {version}")
+    if compression_id not in COMPRESSION_NAMES:
+        raise ValueError(f"不明な圧縮方式です: {compression_id}")
+    body = _DecompressingReader(reader, COMPRESSION_NAMES[compression_id])
+    journal_seq, count = _COUNTS_STRUCT.unpack(_read_exact(body, _COUNTS_STRUCT.size))
+    return _iter_index_blocks(body, count), journal_seq
+
+def _iter_index_blocks(body, count: int):
+    remaining = count
+    while remaining > 0:
+        entry_count, text_size = _BLOCK_STRUCT.unpack(_read_exact(body, _BLOCK_STRUCT.size))
+        if entry_count == 0 or entry_count > remaining:
+            raise ValueError("索引のブロックの件数が一致しません。")
+        lengths = _read_array(body, _LENGTH_TYPECODE, entry_count * 2)
+        offsets = _read_array(body, _OFFSET_TYPECODE, entry_count)
+        sizes = _read_array(body, _LENGTH_TYPECODE, entry_count)
+        text = _read_exact(body, text_size).decode('utf-8')
+
+        # 各フィールドの開始位置を累積和でまとめて求めてから切り出す
+        positions = list(accumulate(lengths, initial=0))
+        if positions[-1] != len(text):
+            raise ValueError("索引のフィールドの長さが一致しません。")
+        names = [text[start:end] for start, end in zip(positions[0::2], positions[1::2])]
+        account_ids = [sys.intern(text[start:end]) for start, end in zip(positions[1::2], positions[2::2])]
+        yield names, account_ids, offsets, sizes
+        remaining -= entry_count
+    if body.read(1):
+        raise ValueError("索引の後ろに余分なデータがあります。")
+
+def encode_shard_manifest(shard_count: int, journal_seq: int) -> bytes:
+    """シャード分割した保管庫の本体に保存する、シャード数と取り込み済みのジャーナルの連番を作る。"""
+    return _SHARD_MANIFEST_STRUCT.pack(SHARD_MANIFEST_MAGIC, SHARD_MANIFEST_VERSION, shard_count, journal_seq)
+
+def decode_shard_manifest(data: bytes):
+    """
+    復号したバイト列がシャードの一覧であれば(シャード数, 取り込み済みのジャーナルの連番)を返す。
+    シャード分割していない保管庫のペイロードの場合はNoneを返す。
+    """
+    if not data.startswith(SHARD_MANIFEST_MAGIC):
+        return None
+    _, version, shard_count, journal_seq = _SHARD_MANIFEST_STRUCT.unpack_from(data)
+    if version != SHARD_MANIFEST_VERSION:
+        raise ValueError(f"対応していないシャードの一覧の形式です: {version}")
+    return shard_count, journal_seq
+
+def _encode_block(block: list) -> bytes:
+    """(サービス名, PasswordEntry)のリストを、件数・長さの配列・連結したフィールドからなるブロックに変換する。"""
+    lengths = array(_LENGTH_TYPECODE)
+    fields = []
+    # RecordStoreから復号したパスワードはキャッシュから追い出されると0で上書きされるため、参照を保持せずにすぐ写す
+    secrets = bytearray()
+    for service_name, entry in block:
+        account_id, secret = entry.account_id, entry.secret()
+        fields += (service_name, account_id)
+        secrets += secret
+        lengths.extend((len(service_name), len(account_id), len(secret)))
+    if sys.byteorder == "little":
+        lengths.byteswap()
+    text = "".join(fields).encode('utf-8')
+    try:
+        return b"".join((_BLOCK_STRUCT.pack(len(block), len(text)), lengths.tobytes(), text, secrets))
+    finally:
+        secrets[:] = bytes(len(secrets))
+
+def _read_lengths(reader, entry_count: int) -> array:
+    return _read_array(reader, _LENGTH_TYPECODE, entry_count * _FIELDS_PER_ENTRY)
+
+def _read_array(reader, typecode: str, count: int) -> array:
+    """ビッグエンディアンで記録された整数の配列を読み込む。"""
+    values = array(typecode)
+    values.frombytes(_read_exact(reader, count * values.itemsize))
+    if sys.byteorder == "little":
+        values.byteswap()
+    return values
+
+def _decode_block(passwords: dict, lengths: array, text_bytes: bytes, secrets: bytearray):
+    """ブロック1つ分のフィールドを切り出してパスワードの辞書に追加する。"""
+    text = text_bytes.decode('utf-8')
+    intern = sys.intern
+    position = 0
+    secret_position = 0
+    field_lengths = iter(lengths)
+    for name_length, account_length, secret_length in zip(field_lengths, field_lengths, field_lengths):
+        account_start = position + name_length
+        end = account_start + account_length
+        secret_end = secret_position + secret_length
+        passwords[text[position:account_start]] = PasswordEntry(
+            intern(text[account_start:end]), secrets[secret_position:secret_end]
+        )
+        position = end
+        secret_position = secret_end
+    # 切り出し元のパスワードのバッファは不要になるため消去する
+    secrets[:] = bytes(len(secrets))
+    if position != len(text):
+        raise ValueError("ペイロードのフィールドの長さが一致しません。")
+
+def _decode_text_block(passwords: dict, lengths: array, text_bytes: bytes):
+    """パスワードも文字列に連結していた以前の形式のブロックを、パスワードの辞書に追加する。"""
+    text = text_bytes.decode('utf-8')
+    position = 0
+    field_lengths = iter(lengths)
+    for name_length, account_length, password_length in zip(field_lengths, field_lengths, field_lengths):
+        account_start = position + name_length
+        password_start = account_start + account_length
+        end = password_start + password_length
+        passwords[text[position:account_start]] = PasswordEntry.from_password(
+            text[account_start:password_start], text[password_start:end]
+        )
+        position = end
+    if position != len(text):
+        raise ValueError("ペイロードのフィールドの長さが一致しません。")
+
+def _read_exact(reader, size: int) -> bytes:
+    data = reader.read(size)
+    if len(data) != size:
+        raise ValueError("ペイロードが途中で途切れています。")
+    return data
+
+class _NullCompressor:
+    """圧縮しない場合の、zlib・lzmaの圧縮オブジェクトと同じ使い方ができるオブジェクト。"""
+    def compress(self, data: bytes) -> bytes:
+        return data
+
+    def flush(self) -> bytes:
+        return b""
+
+def _compressor(compression: str):
+    if compression == "zlib":
+        return zlib.compressobj()
+    if compression == "lzma":
+        return lzma.LZMACompressor()
+    return _NullCompressor()
+
+class _DecompressingReader:
+    """readメソッドを持つオブジェクトから少しずつ読み込みながら展開する。"""
+    def __init__(self, reader, compression: str):
+        self._reader = reader
+        if compression == "zlib":
+            self._decompressor = zlib.decompressobj()
+        elif compression == "lzma":
+            self._decompressor = lzma.LZMADecompressor()
+        else:
+            self._decompressor = None
+        self._buffer = bytearray()
+
+    def read(self, size: int = -1) -> bytes:
+        if self._decompressor is None:
+            return self._reader.read(size)
+        while size < 0 or len(self._buffer) < size:
+            chunk = self._reader.read(_READ_SIZE)
+            if not chunk:
+                break
+            try:
+                self._buffer += self._decompressor.decompress(chunk)
+            except (zlib.error, lzma.LZMAError) as e:
+                raise ValueError(f"ペイロードの展開に失敗しました: {e}")
+        if size < 0:
+            size = len(self._buffer)
+        data = bytes(self._buffer[:size])
+        del self._buffer[:size]
+        return data
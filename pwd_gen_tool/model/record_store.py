@@ -0,0 +1,153 @@
+import base64
+import mmap
+import os
+import threading
+from array import array
+from collections import OrderedDict
+from contextlib import contextmanager
+
+from cryptography.exceptions import InvalidTag
+from cryptography.hazmat.primitives import hashes
+from cryptography.hazmat.primitives.ciphers.aead import ChaCha20Poly1305
+from cryptography.hazmat.primitives.kdf.hkdf import HKDF
+
+from pwd_gen_tool.config import VAULT_RECORD_CACHE_SIZE
+
+_NONCE_SIZE = 12
+
+def record_cipher(data_key: bytes) -> ChaCha20Poly1305:
+    """
+    パスワードのレコードを暗号化するキーをデータ暗号化キーから派生する。
+    保存し直しても同じキーになるため、変更の無いレコードは復号せずにそのまま書き写せる。
+    """
+    hkdf = HKDF(algorithm=hashes.SHA256(), length=32, salt=None, info=b"pwd_gen_tool password records")
+    return ChaCha20Poly1305(hkdf.derive(base64.urlsafe_b64decode(data_key)))
+
+def encrypt_record(cipher: ChaCha20Poly1305, service_name: str, secret: bytes) -> bytes:
+    """
+    パスワード1件（UTF-8のバイト列）を暗号化したレコード（ノンス + 暗号文）を作る。
+    サービス名を関連データとして認証するため、レコードを別のサービスのものと入れ替えると復号に失敗する。
+    """
+    nonce = os.urandom(_NONCE_SIZE)
+    return nonce + cipher.encrypt(nonce, secret, service_name.encode('utf-8'))
+
+def map_file(path: str):
+    """ファイルを読み込み専用でメモリマップする。"""
+    with open(path, 'rb') as f:
+        return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+def _wipe(buffer: bytearray):
+    buffer[:] = bytes(len(buffer))
+
+class RecordStore:
+    """
+    メモリマップしたパスワードファイルから、パスワードのレコードを必要になったときだけ復号する。
+    復号したパスワードは、直近に使った少数だけをLRUキャッシュにbytearrayで保持し、追い出すときに0で上書きする。
+    """
+    def __init__(self, mapped, cipher: ChaCha20Poly1305, cache_size: int = VAULT_RECORD_CACHE_SIZE):
+        self._mapped = mapped
+        self._cipher = cipher
+        self._cache_size = cache_size
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+        # レコード番号ごとのサービス名・位置・サイズ（件数分のオブジェクトを作らないよう配列で持つ）
+        self._service_names = []
+        self._offsets = array("Q")
+        self._sizes = array("I")
+
+    def add_records(self, service_names: list, offsets: array, sizes: array) -> range:
+        """索引のレコードをまとめて登録し、割り当てたレコード番号の範囲を返す。"""
+        start = len(self._service_names)
+        if any(offset + size > len(self._mapped) for offset, size in zip(offsets, sizes)):
+            raise ValueError("パスワードファイルが破損しています。")
+        self._service_names += service_names
+        self._offsets += offsets
+        self._sizes += sizes
+        return range(start, len(self._service_names))
+
+    def service_name(self, index: int) -> str:
+        return self._service_names[index]
+
+    def raw(self, index: int) -> bytes:
+        """暗号化されたままのレコードを返す。"""
+        with self._lock:
+            size = self._sizes[index]
+            if self._mapped is None or self._mapped.closed or size == 0:
+                raise ValueError("パスワードは既に消去されています。")
+            offset = self._offsets[index]
+            return self._mapped[offset:offset + size]
+
+    def read(self, index: int) -> bytearray:
+        """
+        レコードを復号してパスワードのUTF-8のバイト列を返す。
+        返すのはキャッシュのバッファそのもので、キャッシュから追い出されると0で上書きされる。
+        """
+        with self._lock:
+            password = self._cache.get(index)
+            if password is not None:
+                self._cache.move_to_end(index)
+                return password
+
+        service_name = self._service_names[index]
+        record = self.raw(index)
+        try:
+            plain = self._cipher.decrypt(record[:_NONCE_SIZE], record[_NONCE_SIZE:], service_name.encode('utf-8'))
+        except InvalidTag:
+            raise ValueError(f"サービス名 '{service_name}' のパスワードのデータが破損しています。")
+
+        # 復号結果のbytesは消去できないため、すぐにbytearrayへ写して手放す
+        password = bytearray(plain)
+        del plain
+        with self._lock:
+            cached = self._cache.get(index)
+            if cached is not None:
+                # 他のスレッドが先に復号していた場合は、そちらのバッファを使う
+                _wipe(password)
+                self._cache.move_to_end(index)
+                return cached
+            self._cache[index] = password
+            if len(self._cache) > self._cache_size:
+                _wipe(self._cache.popitem(last=False)[1])
+        return password
+
+    def clear_cache(self):
+        """復号済みのパスワードのキャッシュを0で上書きして破棄する。"""
+        with self._lock:
+            for password in self._cache.values():
+                _wipe(password)
+            self._cache.clear()
+
+    def close(self):
+        """キャッシュを破棄し、メモリマップを閉じる。以降はレコードを参照できない。"""
+        self.clear_cache()
+        with self._lock:
+            if self._mapped is not None:
+                self._mapped.close()
+                self._mapped = None
+
+    @contextmanager
+    def remapping(self, path: str):
+        """
+        ブロックの中でpathのファイルを置き換える間だけメモリマップを閉じ、抜けるときにマップし直す。
+        Windowsではマップしたままのファイルを置き換えられないため。置き換え中のレコードの参照は待たせる。
+        置き換えた場合は、ブロックの中でrelocate()を呼び出してレコードの位置を更新すること。
+        """
+        with self._lock:
+            if self._mapped is not None:
+                self._mapped.close()
+                self._mapped = None
+            try:
+                yield self
+            finally:
+                self._mapped = map_file(path)
+
+    def relocate(self, locations: dict):
+        """
+        置き換えた後のファイルでのレコードの位置に更新する。remapping()のブロックの中で呼び出す。
+        locationsは{レコード番号: (サービス名, 位置, サイズ)}で、含まれないレコードは参照できなくなる。
+        """
+        self._sizes = array("I", bytes(self._sizes.itemsize * len(self._sizes)))
+        for index, (service_name, offset, size) in locations.items():
+            self._service_names[index] = service_name
+            self._offsets[index] = offset
+            self._sizes[index] = size
@@ -0,0 +1,121 @@
+import atexit
+import threading
+
+from pwd_gen_tool.config import SAVE_COALESCE_DELAY
+
+class SaveWorker:
+    """
+    変更の保存をバックグラウンドのスレッドで行う。
+    put()した変更は、delay秒以内に続けて行われた変更とまとめて、write_pendingの1回の呼び出しで書き込む。
+    保存に失敗した場合やメッセージがある場合は、take_errors()で次の操作のときに受け取る。
+    書き込みに失敗した変更は残しておき、次のput()またはflush()で再試行する。
+    """
+    def __init__(self, write_pending, delay: float = SAVE_COALESCE_DELAY):
+        """
+        Args:
+            write_pending (callable): take()を受け取り、取り出した変更を書き込む関数。
+                書き込めなかった変更はrequeue()で戻してから例外を送出する。
+                利用者に伝えるメッセージのリストを返すことができる。
+            delay (float): 最後の変更から書き込みを始めるまで待つ秒数。
+        """
+        self._write_pending = write_pending
+        self._delay = delay
+        self._condition = threading.Condition()
+        self._pending = []
+        self._errors = []
+        self._writing = False
+        self._failed = False # 書き込みに失敗した後は、次のput()・flush()まで再試行しない
+        self._flush_requested = False
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name="save-worker", daemon=True)
+        self._thread.start()
+        # close()を呼ばずに終了した場合も、終了時に残りの変更を書き込む
+        atexit.register(self._flush_at_exit)
+
+    def put(self, change):
+        """保存する変更を追加する。"""
+        with self._condition:
+            if self._closed:
+                raise RuntimeError("保存処理は既に終了しています。")
+            self._pending.append(change)
+            self._failed = False
+            self._condition.notify_all()
+
+    def take(self) -> list:
+        """たまっている変更を全て取り出す。write_pendingの中から呼び出す。"""
+        with self._condition:
+            pending, self._pending = self._pending, []
+            return pending
+
+    def requeue(self, changes):
+        """書き込めなかった変更を、後から追加された変更より前に戻す。"""
+        with self._condition:
+            self._pending[:0] = changes
+
+    def take_errors(self) -> list:
+        """前回の呼び出し以降の保存のエラーとメッセージを取り出す。"""
+        with self._condition:
+            errors, self._errors = self._errors, []
+            return errors
+
+    def flush(self):
+        """
+        たまっている変更を待たずに書き込み、書き込みが完了するまで待つ。
+        書き込みに失敗した場合はRuntimeErrorになる（変更は残り、次のflush()で再試行する）。
+        """
+        with self._condition:
+            self._failed = False
+            self._flush_requested = True
+            self._condition.notify_all()
+            try:
+                while (self._pending or self._writing) and not self._failed:
+                    self._condition.wait()
+            finally:
+                self._flush_requested = False
+            if self._failed:
+                message = self._errors.pop() if self._errors else "不明なエラー"
+                raise RuntimeError(message)
+
+    def close(self):
+        """残りの変更を書き込んでからスレッドを終了する。書き込みに失敗した場合はRuntimeErrorになる。"""
+        try:
+            self.flush()
+        finally:
+            with self._condition:
+                self._closed = True
+                self._condition.notify_all()
+            self._thread.join()
+            atexit.unregister(self._flush_at_exit)
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while not self._closed and (not self._pending or self._failed):
+                    self._condition.wait()
+                if self._closed:
+                    return
+                # 続けて行われた変更をまとめるため、delay秒の間に新しい変更が無くなるまで待つ
+                while not self._flush_requested and not self._closed:
+                    count = len(self._pending)
+                    self._condition.wait(self._delay)
+                    if len(self._pending) == count:
+                        break
+                self._writing = True
+
+            try:
+                messages = self._write_pending(self.take)
+                failed = False
+            except Exception as e:
+                messages = [str(e)]
+                failed = True
+            with self._condition:
+                self._errors.extend(messages or ())
+                self._failed = failed
+                self._writing = False
+                self._condition.notify_all()
+
+    def _flush_at_exit(self):
+        try:
+            self.flush()
+        except RuntimeError:
+            pass # 終了時にはエラーを表示できないため、書き込めなかった変更は失われる
@@ -0,0 +1,297 @@
+import heapq
+import operator
+import re
+from bisect import bisect_left
+from collections import Counter, OrderedDict
+from itertools import compress, repeat
+
+from pwd_gen_tool.config import SEARCH_CACHE_SIZE
+
+# 一致の種類ごとの一致度（0〜100）。同じ一致度の中ではサービス名の昇順に並べる
+SCORE_EXACT = 100 # サービス名と完全一致
+SCORE_PREFIX = 90 # サービス名の前方一致
+SCORE_WORD = 85 # サービス名の単語の先頭に一致
+SCORE_SUBSTRING = 80 # サービス名の部分一致
+SCORE_ACCOUNT = 70 # アカウントIDの部分一致
+SCORE_SUBSEQUENCE = 65 # 略語（検索語の文字を順に含む）。文字の間に空白を挟む場合は10下げる
+SCORE_TYPO = 60 # 入力ミス（編集距離が1）。2の場合は10下げる
+
+class SearchIndex:
+    """
+    サービス名とアカウントIDの部分一致検索のための転置インデックス。
+    大文字・小文字を区別しない（casefold）文字列から長さ1〜3のn-gramを取り出し、
+    n-gramごとにそれを含むサービス名の集合を保持する。
+    検索時は候補をn-gramの積集合で絞り込んでから、候補だけを部分一致で確認する。
+
+    search_ranked()は一致度の高い順に上位の件数だけを返し、部分一致で足りない場合は
+    略語（部分列）や入力ミス（編集距離）でも探す。結果は変更があるまでLRUキャッシュに保持する。
+    """
+    GRAM_SIZE = 3
+    FUZZY_CANDIDATE_LIMIT = 50 # 入力ミスとして編集距離を計算する候補の最大数
+    COMMON_GRAM_RATIO = 10 # 全体の1/COMMON_GRAM_RATIOより多くのサービス名に含まれるn-gramは入力ミスの候補探しに使わない
+
+    def __init__(self, cache_size=SEARCH_CACHE_SIZE):
+        self._postings = {} # {n-gram: {サービス名, ...}}
+        self._keys = {} # {サービス名: (casefoldしたサービス名, casefoldしたアカウントID)}
+        # 前方一致と略語の検索用に (casefoldしたサービス名, サービス名) をソートして保持する。最初の検索時に作る
+        self._prefix_keys = None
+        self._folded_names = None # _prefix_keysと同じ順のcasefoldしたサービス名だけのリスト
+        self._cache = OrderedDict() # {(検索語, 件数): [(一致度, サービス名), ...]}
+        self._cache_size = cache_size
+
+    def __len__(self):
+        return len(self._keys)
+
+    def add(self, service_name, account_id):
+        """サービス名とアカウントIDをインデックスに追加する。"""
+        if service_name in self._keys:
+            self.remove(service_name)
+        folded = (service_name.casefold(), account_id.casefold())
+        self._keys[service_name] = folded
+        for gram in self._grams_of(folded):
+            self._postings.setdefault(gram, set()).add(service_name)
+        if self._prefix_keys is not None:
+            index = bisect_left(self._prefix_keys, (folded[0], service_name))
+            self._prefix_keys.insert(index, (folded[0], service_name))
+            self._folded_names.insert(index, folded[0])
+        if self._cache:
+            self._cache.clear()
+
+    def remove(self, service_name):
+        """サービス名をインデックスから削除する。"""
+        folded = self._keys.pop(service_name, None)
+        if folded is None:
+            return
+        for gram in self._grams_of(folded):
+            names = self._postings.get(gram)
+            if names is None:
+                continue
+            names.discard(service_name)
+            if not names:
+                del self._postings[gram]
+        if self._prefix_keys is not None:
+            index = bisect_left(self._prefix_keys, (folded[0], service_name))
+            del self._prefix_keys[index]
+            del self._folded_names[index]
+        if self._cache:
+            self._cache.clear()
+
+    def search(self, search_term):
+        """検索語を部分文字列として含むサービス名の集合を返す。"""
+        term = search_term.casefold()
+        if not term:
+            return set(self._keys)
+
+        if len(term) <= self.GRAM_SIZE:
+            # 短い検索語はそれ自体がn-gramとして登録されているので、候補がそのまま結果になる
+            return set(self._postings.get(term, ()))
+
+        grams = {term[i:i + self.GRAM_SIZE] for i in range(len(term) - self.GRAM_SIZE + 1)}
+        postings = []
+        for gram in grams:
+            names = self._postings.get(gram)
+            if not names:
+                return set()
+            postings.append(names)
+        # 小さい集合から順に積集合を取り、候補をできるだけ早く絞り込む
+        postings.sort(key=len)
+        candidates = set(postings[0])
+        for names in postings[1:]:
+            candidates &= names
+            if not candidates:
+                return candidates
+
+        return {name for name in candidates
+                if term in self._keys[name][0] or term in self._keys[name][1]}
+
+    def search_ranked(self, search_term, limit):
+        """
+        検索語に近い順に最大limit件の (一致度, サービス名) のリストを返す。
+        完全一致・前方一致・単語の先頭・部分一致・アカウントIDの部分一致の順に優先し、
+        それだけでlimit件に満たない場合は、略語と入力ミスとして近いサービス名も加える。
+        """
+        term = search_term.casefold()
+        cache_key = (term, limit)
+        results = self._cache.get(cache_key)
+        if results is not None:
+            self._cache.move_to_end(cache_key)
+            return results
+
+        results = self._rank(term, limit)
+        self._cache[cache_key] = results
+        if len(self._cache) > self._cache_size:
+            self._cache.popitem(last=False)
+        return results
+
+    def _rank(self, term, limit):
+        if limit <= 0:
+            return []
+        if not term:
+            return [(0, name) for _, name in self._prefix_keys_sorted()[:limit]]
+
+        # 一致の種類ごとに一致度の高い順に調べ、limit件に達したらそれより低い種類は調べない
+        # 前方一致はソート順に並んでいるため、先頭からlimit件を取れば一致度の高い順の上位になる
+        results = [(SCORE_EXACT if folded_name == term else SCORE_PREFIX, name)
+                   for folded_name, name in self._prefix_matches(term, limit)]
+        if len(results) < limit:
+            self._add_substring_matches(term, limit, results)
+        if len(results) < limit:
+            self._add_fuzzy_matches(term, limit, results)
+        return results
+
+    def _prefix_keys_sorted(self):
+        if self._prefix_keys is None:
+            self._prefix_keys = sorted((folded[0], name) for name, folded in self._keys.items())
+            self._folded_names = [folded_name for folded_name, _ in self._prefix_keys]
+        return self._prefix_keys
+
+    def _prefix_matches(self, prefix, limit):
+        """casefoldしたサービス名がprefixで始まるものを、ソート順に最大limit件返す。"""
+        prefix_keys = self._prefix_keys_sorted()
+        index = bisect_left(prefix_keys, (prefix,))
+        matches = []
+        while index < len(prefix_keys) and len(matches) < limit:
+            key = prefix_keys[index]
+            if not key[0].startswith(prefix):
+                break
+            matches.append(key)
+            index += 1
+        return matches
+
+    def _add_substring_matches(self, term, limit, results):
+        """
+        前方一致以外の部分一致を、単語の先頭・サービス名の途中・アカウントIDの順にresultsに加える。
+        候補が多い場合に備え、照合は1件ずつのPythonの処理を通さずにまとめて行う。
+        """
+        names = self.search(term)
+        names.difference_update(name for _, name in results)
+        if not names:
+            return
+        folded_names = list(map(operator.itemgetter(0), map(self._keys.__getitem__, names)))
+        pairs = list(zip(folded_names, names))
+        # 英数字以外の文字（または先頭）の直後から始まる一致を単語の先頭とする
+        at_word = list(map(bool, map(re.compile(r"(?<![^\W_])" + re.escape(term)).search, folded_names)))
+        in_service = list(map(str.__contains__, folded_names, repeat(term)))
+        tiers = (
+            (SCORE_WORD, compress(pairs, at_word)),
+            (SCORE_SUBSTRING, compress(pairs, map(operator.gt, in_service, at_word))),
+            (SCORE_ACCOUNT, compress(pairs, map(operator.not_, in_service))),
+        )
+        for score, matches in tiers:
+            for _, name in heapq.nsmallest(limit - len(results), matches):
+                results.append((score, name))
+            if len(results) >= limit:
+                return
+
+    def _add_fuzzy_matches(self, term, limit, results):
+        """
+        部分一致で足りない分を、略語（文字の間に空白を挟まないもの）、1文字違い、
+        略語（それ以外）、2文字違いの順にresultsに加える。
+        """
+        found = {name for _, name in results}
+        need = limit - len(results)
+        compact, spread = self._subsequence_matches(term, need, found)
+        found.update(compact)
+        typos = self._typo_matches(term, need - len(compact), found) if len(compact) < need else []
+        tiers = (
+            (SCORE_SUBSEQUENCE, compact),
+            (SCORE_TYPO, [name for distance, name in typos if distance == 1]),
+            (SCORE_SUBSEQUENCE - 10, spread),
+            (SCORE_TYPO - 10, [name for distance, name in typos if distance == 2]),
+        )
+        for score, names in tiers:
+            for name in names:
+                if len(results) >= limit:
+                    return
+                if score < SCORE_SUBSEQUENCE and name in found:
+                    continue # 1文字違いと略語（空白を挟むもの）の両方に一致した場合
+                found.add(name)
+                results.append((score, name))
+
+    def _subsequence_matches(self, term, need, found):
+        """
+        検索語の文字を順に含むサービス名（例: "gml" → "gmail"）を、文字の間に空白を挟まないものと
+        それ以外に分けて、それぞれソート順に最大need件ずつ返す。
+        候補は先頭の文字が同じサービス名に限り、前方一致の索引のその範囲だけを調べる。
+        """
+        if len(term) < 2:
+            return [], []
+        prefix_keys = self._prefix_keys_sorted()
+        start = bisect_left(prefix_keys, (term[0],))
+        stop = bisect_left(prefix_keys, (chr(ord(term[0]) + 1),))
+        # 次の文字の最初の出現までを読み飛ばす形にして、一致しない場合の後戻りを抑える
+        pattern = re.compile(re.escape(term[0]) + "".join(f"[^{re.escape(char)}]*{re.escape(char)}" for char in term[1:]))
+        spaces = term.count(" ")
+        compact = []
+        spread = []
+        # 全件の照合はPythonのループを通さずに行い、一致したものだけを1件ずつ処理する
+        for index in compress(range(start, stop), map(pattern.match, self._folded_names[start:stop])):
+            folded_name, name = prefix_keys[index]
+            if name in found:
+                continue
+            if pattern.match(folded_name).group().count(" ") == spaces:
+                compact.append(name)
+                if len(compact) >= need:
+                    break
+            elif len(spread) < need:
+                spread.append(name)
+        return compact, spread
+
+    def _typo_matches(self, term, need, found):
+        """
+        編集距離が小さい部分を含むサービス名（例: "googel" → "google"）を、距離が小さい順・ソート順に
+        最大need件の (距離, サービス名) のリストで返す。
+        4文字以上で1文字、8文字以上で2文字までの違いを許す。候補は共通のn-gramが多いものに絞る。
+        """
+        max_distance = 2 if len(term) >= 8 else 1 if len(term) >= 4 else 0
+        if not max_distance:
+            return []
+        grams = {term[i:i + self.GRAM_SIZE] for i in range(len(term) - self.GRAM_SIZE + 1)}
+        # 1文字の違いで失われるn-gramはGRAM_SIZE個までなので、距離max_distance以内のサービス名は
+        # 含まれるサービス名の少ない方から (max_distance * GRAM_SIZE + 1) 個のn-gramのどれかを必ず含む
+        postings = sorted((self._postings.get(gram, ()) for gram in grams), key=len)
+        counts = Counter()
+        for names in postings[:max_distance * self.GRAM_SIZE + 1]:
+            if counts and len(names) > len(self._keys) // self.COMMON_GRAM_RATIO:
+                break # ほとんどのサービス名に含まれるn-gramは、候補の絞り込みに役立たないため数えない
+            counts.update(names)
+
+        matches = []
+        for name, _ in counts.most_common(self.FUZZY_CANDIDATE_LIMIT):
+            if name in found:
+                continue
+            folded_name = self._keys[name][0]
+            distance = _substring_distance(term, folded_name, max_distance)
+            if distance is not None:
+                matches.append((distance, folded_name, name))
+        return [(distance, name) for distance, _, name in heapq.nsmallest(need, matches)]
+
+    def _grams_of(self, folded):
+        """casefoldした文字列の組から長さ1〜GRAM_SIZEの全てのn-gramを取り出す。"""
+        grams = set()
+        for text in folded:
+            for size in range(1, self.GRAM_SIZE + 1):
+                for i in range(len(text) - size + 1):
+                    grams.add(text[i:i + size])
+        return grams
+
+def _substring_distance(term, text, max_distance):
+    """
+    termとtextの部分文字列との編集距離の最小値を返す（Sellersのアルゴリズム）。
+    隣り合う2文字の入れ替えは1文字の違いとして数える。max_distanceを超える場合は、途中で打ち切ってNoneを返す。
+    """
+    before_previous = None
+    previous = [0] * (len(text) + 1) # textのどの位置から始まってもよいため、1行目は全て0
+    for i, term_char in enumerate(term, 1):
+        current = [i]
+        for j, text_char in enumerate(text, 1):
+            distance = min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (term_char != text_char))
+            if (before_previous is not None and j > 1 and term_char == text[j - 2]
+                    and term[i - 2] == text_char and term_char != text_char):
+                distance = min(distance, before_previous[j - 2] + 1)
+            current.append(distance)
+        if min(current) > max_distance:
+            return None
+        before_previous, previous = previous, current
+    distance = min(previous)
+    return distance if distance <= max_distance else None
@@ -0,0 +1,51 @@
+from bisect import bisect_left, insort
+
+class SortedKeys:
+    """
+    サービス名を常に昇順で保持するリスト。
+    追加・削除は二分探索で位置を求めて行うため、一覧表示や番号での選択のたびに全件をソートし直す必要がない。
+    """
+    def __init__(self, keys=()):
+        self._keys = sorted(keys)
+
+    def __len__(self):
+        return len(self._keys)
+
+    def __iter__(self):
+        return iter(self._keys)
+
+    def __contains__(self, key):
+        index = bisect_left(self._keys, key)
+        return index < len(self._keys) and self._keys[index] == key
+
+    def __getitem__(self, index):
+        """順位（0始まり）またはスライスでサービス名を取得する。"""
+        return self._keys[index]
+
+    def add(self, key):
+        """サービス名を順序を保ったまま追加する。"""
+        insort(self._keys, key)
+
+    def add_many(self, keys):
+        """複数のサービス名をまとめて追加する。1件ずつ挿入するより速い。"""
+        self._keys.extend(keys)
+        self._keys.sort()
+
+    def remove(self, key):
+        """サービス名を削除する。"""
+        index = self.rank(key)
+        if index is None:
+            raise KeyError(key)
+        del self._keys[index]
+
+    def rename(self, old_key, new_key):
+        """サービス名を変更し、新しい位置に移動する。"""
+        self.remove(old_key)
+        self.add(new_key)
+
+    def rank(self, key):
+        """サービス名の順位（0始まり）を返す。存在しない場合はNoneを返す。"""
+        index = bisect_left(self._keys, key)
+        if index < len(self._keys) and self._keys[index] == key:
+            return index
+        return None
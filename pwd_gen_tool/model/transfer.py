@@ -0,0 +1,129 @@
+import csv
+import json
+import os
+from urllib.parse import urlparse
+
+# 一括インポート・エクスポートで扱うファイル形式（拡張子から判定する）
+FORMAT_CSV = "csv"
+FORMAT_JSONL = "jsonl"
+_FORMAT_BY_EXTENSION = {".csv": FORMAT_CSV, ".jsonl": FORMAT_JSONL, ".ndjson": FORMAT_JSONL}
+
+# 重複したサービス名の扱い
+DUPLICATE_SKIP = "skip" # 既存のパスワードを残し、インポートしない
+DUPLICATE_OVERWRITE = "overwrite" # 既存のパスワードを上書きする
+DUPLICATE_RENAME = "rename" # 「サービス名 (2)」のように別名でインポートする
+DUPLICATE_POLICIES = (DUPLICATE_SKIP, DUPLICATE_OVERWRITE, DUPLICATE_RENAME)
+
+# 各列の候補となる見出し。ブラウザやパスワード管理ソフトのエクスポート形式に対応する
+# （Chrome: name,url,username,password / Firefox: url,username,password,... / Bitwarden: name,login_uri,login_username,login_password,...）
+_SERVICE_COLUMNS = ("service_name", "service", "name", "title")
+_URL_COLUMNS = ("url", "login_uri", "origin", "hostname")
+_ACCOUNT_COLUMNS = ("account_id", "username", "login_username", "login", "email", "user")
+_PASSWORD_COLUMNS = ("password", "login_password")
+
+class ImportRecordError(ValueError):
+    """インポートするデータの1件が不正な場合の例外。"""
+    def __init__(self, line_number, message):
+        super().__init__(f"{line_number}行目: {message}")
+        self.line_number = line_number
+
+def detect_format(file_path):
+    """ファイルの拡張子からファイル形式を判定する。"""
+    extension = os.path.splitext(file_path)[1].lower()
+    if extension not in _FORMAT_BY_EXTENSION:
+        raise ValueError("対応していないファイル形式です。.csv または .jsonl のファイルを指定してください。")
+    return _FORMAT_BY_EXTENSION[extension]
+
+def read_records(file_path, file_format):
+    """
+    ファイルを1件ずつ読み込み、(行番号, 列名をキーとする辞書) を順に返すジェネレーター。
+    ファイル全体をメモリに読み込まないため、大きなファイルでも扱える。
+    """
+    try:
+        # utf-8-sig: Excelなどが付けるBOMを取り除く
+        with open(file_path, 'r', encoding='utf-8-sig', newline='') as f:
+            if file_format == FORMAT_CSV:
+                reader = csv.DictReader(f)
+                for row in reader:
+                    yield reader.line_num, row
+            else:
+                for line_number, line in enumerate(f, start=1):
+                    if not line.strip():
+                        continue
+                    try:
+                        row = json.loads(line)
+                    except ValueError as e:
+                        yield line_number, ImportRecordError(line_number, f"JSONとして読み込めません: {e}")
+                        continue
+                    yield line_number, row
+    except OSError as e:
+        raise OSError(f"インポートするファイルの読み込みに失敗しました: {e}")
+
+def normalize_records(records):
+    """
+    read_recordsの各行を (サービス名, アカウントID, パスワード) に変換するジェネレーター。
+    不正な行はImportRecordErrorとして返し、処理は止めない。
+    """
+    for line_number, row in records:
+        if isinstance(row, Exception):
+            yield row
+            continue
+        if not isinstance(row, dict):
+            yield ImportRecordError(line_number, "1行に1件のオブジェクトを記述してください。")
+            continue
+
+        fields = {str(key).strip().lower(): value for key, value in row.items() if key is not None}
+        service_name = _first_value(fields, _SERVICE_COLUMNS) or _host_of(_first_value(fields, _URL_COLUMNS))
+        account_id = _first_value(fields, _ACCOUNT_COLUMNS)
+        password = _first_value(fields, _PASSWORD_COLUMNS, strip=False)
+
+        if not service_name:
+            yield ImportRecordError(line_number, "サービス名がありません。")
+        elif not account_id:
+            yield ImportRecordError(line_number, "アカウントIDがありません。")
+        elif not password:
+            yield ImportRecordError(line_number, "パスワードがありません。")
+        else:
+            yield service_name, account_id, password
+
+def write_records(file_path, file_format, items):
+    """
+    (サービス名, アカウントID, パスワード) を1件ずつファイルに書き込む。
+
+    Returns:
+        int: 書き込んだ件数。
+    """
+    count = 0
+    try:
+        # パスワードが平文で書き込まれるため、所有者だけが読み書きできるファイルとして作成する
+        fd = os.open(file_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with open(fd, 'w', encoding='utf-8', newline='') as f:
+            if file_format == FORMAT_CSV:
+                writer = csv.writer(f)
+                writer.writerow(["service_name", "account_id", "password"])
+                for service_name, account_id, password in items:
+                    writer.writerow([service_name, account_id, password])
+                    count += 1
+            else:
+                for service_name, account_id, password in items:
+                    record = {"service_name": service_name, "account_id": account_id, "password": password}
+                    f.write(json.dumps(record, ensure_ascii=False) + "\n")
+                    count += 1
+    except OSError as e:
+        raise OSError(f"エクスポートファイルの書き込みに失敗しました: {e}")
+    return count
+
+def _first_value(fields, candidates, strip=True):
+    """候補の列名のうち、最初に値が入っている列の値を返す。パスワードは前後の空白も含めてそのまま返す。"""
+    for column in candidates:
+        value = fields.get(column)
+        if isinstance(value, str) and value.strip():
+            return value.strip() if strip else value
+    return None
+
+def _host_of(url):
+    """URLからホスト名を取り出す。サービス名の列が無いエクスポート形式で使う。"""
+    if not url:
+        return None
+    parsed = urlparse(url if "://" in url else f"//{url}")
+    return parsed.hostname or url
@@ -0,0 +1,75 @@
+import struct
+from collections import namedtuple
+
+from pwd_gen_tool.model.kdf import LEGACY_PARAMS, PARAMS_SIZE, pack_params, unpack_params
+
+# パスワードファイル（v2以降）の先頭に置く識別子とフォーマットのバージョン
+VAULT_MAGIC = b"PWDGVLT\x00"
+VAULT_VERSION = 3
+
+# キースロットの設定。マスターパスワードの変更時は使われていない側のスロットに書き込み、
+# 書き込みが完了してから古いスロットを消去することで、途中で失敗しても復旧できるようにする
+SLOT_COUNT = 2
+SLOT_SIZE = 256
+_SLOT_STRUCT = struct.Struct(">QH16s") # 世代番号、ラップされたキーの長さ、ソルト
+# v3以降は、ソルトの後ろにキー派生関数（KDF）の設定を記録する
+_SLOT_BODY_OFFSET = _SLOT_STRUCT.size + PARAMS_SIZE
+
+_PREFIX_SIZE = len(VAULT_MAGIC) + 1
+HEADER_SIZE = _PREFIX_SIZE + SLOT_COUNT * SLOT_SIZE
+
+# generation: スロットの世代番号（大きいほど新しい）
+# salt: マスターパスワードからキーを派生する際のソルト
+# wrapped_key: マスターパスワード由来のキーで暗号化されたデータ暗号化キー
+# kdf_params: マスターパスワードからキーを派生する際のKDFの設定
+KeySlot = namedtuple("KeySlot", ["generation", "salt", "wrapped_key", "kdf_params"])
+
+def is_vault_header(data: bytes) -> bool:
+    """データがv2以降のパスワードファイルのヘッダーで始まっているかを判定する。"""
+    return len(data) >= HEADER_SIZE and data.startswith(VAULT_MAGIC)
+
+def read_version(header: bytes) -> int:
+    """ヘッダーからフォーマットのバージョンを取得する。"""
+    return header[len(VAULT_MAGIC)]
+
+def pack_prefix(version: int = VAULT_VERSION) -> bytes:
+    """識別子とバージョンからなるヘッダー先頭部分を作る。"""
+    return VAULT_MAGIC + bytes([version])
+
+def slot_offset(index: int) -> int:
+    """ファイル先頭からのキースロットの位置を返す。"""
+    return _PREFIX_SIZE + index * SLOT_SIZE
+
+def pack_slot(slot) -> bytes:
+    """キースロットを固定長のバイト列に変換する。Noneの場合は空きスロットになる。"""
+    if slot is None:
+        return bytes(SLOT_SIZE)
+    body = (_SLOT_STRUCT.pack(slot.generation, len(slot.wrapped_key), slot.salt)
+            + pack_params(slot.kdf_params) + slot.wrapped_key)
+    if len(body) > SLOT_SIZE:
+        raise ValueError("キースロットに収まらないサイズのキーです。")
+    return body.ljust(SLOT_SIZE, b"\x00")
+
+def unpack_slots(header: bytes) -> list:
+    """
+    ヘッダーから全てのキースロットを取り出す。空きスロットはNoneになる。
+    KDFの設定を記録していないv2のスロットは、当時の設定（PBKDF2、480,000回）として扱う。
+    """
+    legacy = read_version(header) < 3
+    body_offset = _SLOT_STRUCT.size if legacy else _SLOT_BODY_OFFSET
+    slots = []
+    for index in range(SLOT_COUNT):
+        start = slot_offset(index)
+        raw = header[start:start + SLOT_SIZE]
+        generation, wrapped_len, salt = _SLOT_STRUCT.unpack_from(raw)
+        if generation == 0 or wrapped_len == 0 or body_offset + wrapped_len > SLOT_SIZE:
+            slots.append(None)
+            continue
+        kdf_params = LEGACY_PARAMS if legacy else unpack_params(raw, _SLOT_STRUCT.size)
+        wrapped_key = raw[body_offset:body_offset + wrapped_len]
+        slots.append(KeySlot(generation, salt, wrapped_key, kdf_params))
+    return slots
+
+def pack_header(slots: list, version: int = VAULT_VERSION) -> bytes:
+    """キースロットのリストからヘッダー全体を作る。"""
+    return pack_prefix(version) + b"".join(pack_slot(slot) for slot in slots)
@@ -0,0 +1,107 @@
+import json
+import os
+import threading
+import time
+from collections import namedtuple
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError: # Windowsではプロセス間のロックは行わず、プロセス内の排他制御だけを行う
+    fcntl = None
+
+from pwd_gen_tool.config import VAULT_LOCK_FILE, VAULT_LOCK_TIMEOUT
+
+# generation: 保管庫に書き込むたびに増える世代番号
+# snapshot_seq: パスワードファイル本体に取り込まれているジャーナルの連番
+# ロックファイルが書き込み途中や破損していて読み取れない場合は、どちらもNoneになる
+VaultState = namedtuple("VaultState", ["generation", "snapshot_seq"])
+
+_LOCK_RETRY_INTERVAL = 0.05 # ロックを取得できなかった場合に再試行する間隔（秒）
+
+# 同じプロセスのスレッド間の排他制御。ファイルのロックはプロセス単位のため、最も外側でだけ取得する
+_thread_lock = threading.RLock()
+_lock_depth = 0
+_lock_fd = None
+
+@contextmanager
+def vault_lock(timeout: float = VAULT_LOCK_TIMEOUT):
+    """
+    保管庫への書き込みの排他ロックを取得する。同じスレッドからは入れ子にして取得できる。
+    他のプロセスがtimeout秒を超えてロックを保持している場合はOSErrorになる。
+    読み込みはロックを取得せずに行える（書き込みは一時ファイルの置き換えで行うため、書き込み途中の状態は見えない）。
+    """
+    global _lock_depth, _lock_fd
+    with _thread_lock:
+        if _lock_depth == 0:
+            _lock_fd = _acquire(timeout)
+        _lock_depth += 1
+        try:
+            yield
+        finally:
+            _lock_depth -= 1
+            if _lock_depth == 0:
+                fd, _lock_fd = _lock_fd, None
+                _release(fd)
+
+def read_vault_state() -> VaultState:
+    """ロックファイルに記録された世代番号を読み込む。ロックは不要。"""
+    try:
+        with open(VAULT_LOCK_FILE, 'rb') as f:
+            data = f.read()
+    except FileNotFoundError:
+        return VaultState(0, 0)
+    except OSError as e:
+        raise OSError(f"ロックファイルの読み込みに失敗しました: {e}")
+    if not data:
+        return VaultState(0, 0)
+    try:
+        state = json.loads(data.decode('utf-8'))
+        return VaultState(int(state["generation"]), int(state["snapshot_seq"]))
+    except (ValueError, KeyError, TypeError):
+        return VaultState(None, None)
+
+def write_vault_state(state: VaultState):
+    """
+    ロックファイルに世代番号を書き込み、ディスクへの書き込みを確定させる。
+    vault_lock()でロックを取得した状態で呼び出すこと。
+    """
+    if _lock_fd is None:
+        raise RuntimeError("保管庫のロックを取得していません。")
+    data = json.dumps({"generation": state.generation, "snapshot_seq": state.snapshot_seq}).encode('utf-8')
+    try:
+        os.lseek(_lock_fd, 0, os.SEEK_SET)
+        os.write(_lock_fd, data)
+        os.ftruncate(_lock_fd, len(data))
+        os.fsync(_lock_fd)
+    except OSError as e:
+        raise OSError(f"ロックファイルの書き込みに失敗しました: {e}")
+
+def _acquire(timeout: float) -> int:
+    try:
+        fd = os.open(VAULT_LOCK_FILE, os.O_RDWR | os.O_CREAT, 0o600)
+    except OSError as e:
+        raise OSError(f"ロックファイルを開けませんでした: {e}")
+    if fcntl is None:
+        return fd
+
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            return fd
+        except BlockingIOError:
+            if time.monotonic() >= deadline:
+                os.close(fd)
+                raise OSError("他のプロセスが保管庫に書き込み中です。しばらくしてからやり直してください。")
+            time.sleep(_LOCK_RETRY_INTERVAL)
+        except OSError as e:
+            os.close(fd)
+            raise OSError(f"保管庫のロックに失敗しました: {e}")
+
+def _release(fd: int):
+    try:
+        if fcntl is not None:
+            fcntl.flock(fd, fcntl.LOCK_UN)
+    finally:
+        os.close(fd)
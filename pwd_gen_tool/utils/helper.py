@@ -22,16 +22,9 @@ def get_valid_number(prompt, min_val, max_val):
         print(f"エラー: 数値は{min_val}～{max_val}の中から入力してください。\n")
     except ValueError:
       print("エラー: 無効な入力です。数値を入力してください。\n")
-  
-def count_fullwidth_chars(text):
+
+def format_backup_timestamp(timestamp):
   """
-  文字列に含まれる全角文字の数をカウントする。
-  全角ひらがな、カタカナ、漢字、全角記号などを対象とする。
+  バックアップのタイムスタンプ（YYYYmmddHHMMSS）を 'YYYY-mm-dd HH:MM:SS' の形式にする。
   """
-  fullwidth_count = 0
-  for char in text:
-      if ('\u3000' <= char <= '\u9FFF' or
-          '\uFF00' <= char <= '\uFF64' or
-          '\uFFA0' <= char <= '\uFFEF'):
-        fullwidth_count += 1
-  return fullwidth_count
\ No newline at end of file
+  return f"{timestamp[:4]}-{timestamp[4:6]}-{timestamp[6:8]} {timestamp[8:10]}:{timestamp[10:12]}:{timestamp[12:14]}"
@@ -0,0 +1,211 @@
+"""
+保存・読み込み・検索などの処理にかかった時間を、名前付きの区間（スパン）ごとに計測する。
+無効の場合は何も記録しないため、計測箇所を残したままでもほとんど遅くならない。
+
+有効にするには、コマンドラインの --profile（JSONで出力する場合は --profile=json）か、
+環境変数 PWD_GEN_TOOL_PROFILE（"1"・"text" または "json"）を指定する。
+プロセスの終了時に、スパンごとの回数・合計・パーセンタイルを標準エラー出力に表示する。
+"""
+import atexit
+import os
+import sys
+import threading
+import time
+from array import array
+from functools import wraps
+
+from pwd_gen_tool.config import PROFILE_ENV
+
+OUTPUT_FORMATS = ("text", "json")
+PROFILE_OPTION = "--profile"
+
+_enabled = False
+_output_format = "text"
+_started_at = 0.0
+_durations = {} # {スパン名: 所要時間（秒）の配列}
+_lock = threading.Lock()
+_atexit_registered = False
+
+class _NullSpan:
+    """無効時に返す、何もしないスパン。"""
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return False
+
+_NULL_SPAN = _NullSpan()
+
+class _Span:
+    __slots__ = ("name", "start")
+
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        record(self.name, time.perf_counter() - self.start)
+        return False
+
+def span(name):
+    """
+    with文で囲んだ区間の所要時間をnameのスパンとして記録する。
+
+    例:
+        with profiling.span("storage.read_payload"):
+            ...
+    """
+    if not _enabled:
+        return _NULL_SPAN
+    return _Span(name)
+
+def profiled(name):
+    """関数の呼び出しごとの所要時間をnameのスパンとして記録するデコレーター。"""
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            if not _enabled:
+                return func(*args, **kwargs)
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                record(name, time.perf_counter() - start)
+        return wrapper
+    return decorator
+
+def record(name, seconds):
+    """スパンの所要時間を1回分記録する。"""
+    with _lock:
+        durations = _durations.get(name)
+        if durations is None:
+            durations = _durations[name] = array("d")
+        durations.append(seconds)
+
+def is_enabled():
+    return _enabled
+
+def enable(output_format="text", report_at_exit=True):
+    """
+    計測を有効にする。report_at_exitがTrueの場合は、プロセスの終了時に結果を標準エラー出力に表示する。
+
+    Args:
+        output_format (str): "text"（表形式）または "json"。
+    """
+    global _enabled, _output_format, _started_at, _atexit_registered
+    if output_format not in OUTPUT_FORMATS:
+        raise ValueError(f"不明な出力形式です: {output_format}")
+    _output_format = output_format
+    if not _enabled:
+        _started_at = time.perf_counter()
+    _enabled = True
+    if report_at_exit and not _atexit_registered:
+        atexit.register(_report_at_exit)
+        _atexit_registered = True
+
+def disable():
+    global _enabled
+    _enabled = False
+
+def reset():
+    """記録した結果を破棄する。"""
+    global _started_at
+    with _lock:
+        _durations.clear()
+    _started_at = time.perf_counter()
+
+def enable_from_args(argv):
+    """
+    コマンドライン引数の --profile（--profile=text・--profile=json）と環境変数から計測を有効にし、
+    --profileを取り除いた引数を返す。
+    """
+    output_format = None
+    remaining = []
+    for arg in argv:
+        if arg == PROFILE_OPTION:
+            output_format = "text"
+        elif arg.startswith(PROFILE_OPTION + "="):
+            output_format = arg[len(PROFILE_OPTION) + 1:]
+        else:
+            remaining.append(arg)
+
+    if output_format is None:
+        env_value = os.environ.get(PROFILE_ENV, "").strip().lower()
+        if env_value in ("", "0", "false", "off"):
+            return remaining
+        output_format = "json" if env_value == "json" else "text"
+    enable(output_format)
+    return remaining
+
+def summary():
+    """
+    スパンごとの集計結果を返す。時間の単位はミリ秒。
+
+    Returns:
+        dict: {"wall_ms": 計測を有効にしてからの経過時間, "spans": {スパン名: {"count", "total_ms", "mean_ms",
+            "p50_ms", "p90_ms", "p99_ms", "max_ms"}}}
+    """
+    with _lock:
+        snapshot = {name: sorted(durations) for name, durations in _durations.items()}
+    spans = {}
+    for name, durations in snapshot.items():
+        total = sum(durations)
+        spans[name] = {
+            "count": len(durations),
+            "total_ms": total * 1000,
+            "mean_ms": total / len(durations) * 1000,
+            "p50_ms": _percentile(durations, 50) * 1000,
+            "p90_ms": _percentile(durations, 90) * 1000,
+            "p99_ms": _percentile(durations, 99) * 1000,
+            "max_ms": durations[-1] * 1000,
+        }
+    return {"wall_ms": (time.perf_counter() - _started_at) * 1000, "spans": spans}
+
+def format_report(result):
+    """
+    summary()の結果を、合計時間の長い順の表にする。
+    スパンは入れ子になるため、%wallを足し合わせると100%を超えることがある。
+    """
+    header = f"{'span':<32} {'count':>7} {'total ms':>10} {'%wall':>6} {'mean':>9} {'p50':>9} {'p90':>9} {'p99':>9} {'max':>9}"
+    lines = [f"---------- プロファイル（経過時間 {result['wall_ms']:.1f} ms）----------", header]
+    wall_ms = result["wall_ms"] or 1
+    spans = sorted(result["spans"].items(), key=lambda item: item[1]["total_ms"], reverse=True)
+    for name, stats in spans:
+        lines.append(
+            f"{name:<32} {stats['count']:>7} {stats['total_ms']:>10.2f} {stats['total_ms'] / wall_ms * 100:>5.1f}%"
+            f" {stats['mean_ms']:>9.3f} {stats['p50_ms']:>9.3f} {stats['p90_ms']:>9.3f}"
+            f" {stats['p99_ms']:>9.3f} {stats['max_ms']:>9.3f}"
+        )
+    if not spans:
+        lines.append("（記録されたスパンはありません）")
+    return "\n".join(lines)
+
+def report(stream=None, output_format=None):
+    """集計結果を表またはJSONでstream（省略時は標準エラー出力）に書き出す。"""
+    stream = stream or sys.stderr
+    result = summary()
+    if (output_format or _output_format) == "json":
+        import json # 起動時間を短くするため、JSONで出力する場合だけ読み込む
+
+        stream.write(json.dumps(result, ensure_ascii=False, indent=2) + "\n")
+    else:
+        stream.write(format_report(result) + "\n")
+
+def _report_at_exit():
+    if _enabled:
+        try:
+            report()
+        except (OSError, ValueError):
+            pass # 標準エラー出力が閉じられている場合などは表示しない
+
+def _percentile(sorted_values, percent):
+    """ソート済みの値からパーセンタイルを求める（最近傍順位法）。"""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, -(-len(sorted_values) * percent // 100))
+    return sorted_values[int(rank) - 1]
@@ -1,5 +1,15 @@
-from pwd_gen_tool.utils.helper import get_valid_number, ask_yes_no, count_fullwidth_chars
-from pwd_gen_tool.config import PASSWORD_LIST_DISPLAY_GAP
+import shutil
+import sys
+
+from pwd_gen_tool.utils.helper import get_valid_number, ask_yes_no, format_backup_timestamp
+from pwd_gen_tool.config import SEARCH_RESULT_LIMIT, TABLE_PAGE_SIZE, TABLE_WRITE_ROWS, TABLE_MASK_PASSWORDS
+from pwd_gen_tool.view.table_renderer import Column, TableRenderer
+
+# 一覧表示の列
+_PASSWORD_COLUMNS = [Column("サービス名"), Column("アカウントID"), Column("パスワード", secret=True)]
+_SEARCH_RESULT_COLUMNS = [Column("一致度", ">")] + _PASSWORD_COLUMNS
+_BREACH_COLUMNS = [Column("サービス名"), Column("アカウントID"), Column("漏洩件数", ">")]
+_AUDIT_COLUMNS = [Column("サービス名"), Column("アカウントID"), Column("文字数", ">"), Column("強さ", ">"), Column("弱点")]
 
 class ConsoleView:
     """
@@ -70,39 +80,93 @@ class ConsoleView:
         """パスワードを取得する。"""
         return self.get_input("パスワードを入力してください: ")
 
-    def display_passwords(self, passwords_items):
-        """保存されているパスワードの一覧を表示する。"""
-        if not passwords_items:
+    def display_passwords(self, accounts, fetch_passwords):
+        """
+        保存されているパスワードの一覧を表示する。
+        accountsはソート順の (サービス名, アカウントID) のリスト。パスワードは伏せ字で表示し、
+        表示を切り替えたページの分だけfetch_passwords(start, stop)（パスワードのリストを返す関数）で取得する。
+        """
+        if not accounts:
             print("\n現在保存されているパスワードはありません。")
             return
 
-        print("\n------- 保存されているパスワード -------")
-        # サービス名とパスワード間の余白調整
-        for service_name, account_id, password in passwords_items:
-            fullwidth_chars_service = count_fullwidth_chars(service_name)
-            adjusted_width_service = PASSWORD_LIST_DISPLAY_GAP - fullwidth_chars_service
-            fullwidth_chars_account = count_fullwidth_chars(account_id)
-            adjusted_width_account = PASSWORD_LIST_DISPLAY_GAP - fullwidth_chars_account
-            print(f"サービス名: {service_name:<{adjusted_width_service}} アカウントID: {account_id:<{adjusted_width_account}} パスワード: {password}")
+        self._display_table("------- 保存されているパスワード -------", _PASSWORD_COLUMNS, accounts,
+                            secrets=lambda start, stop: [(password,) for password in fetch_passwords(start, stop)])
+
+    def _display_table(self, title, columns, rows, footer=None, secrets=None):
+        """
+        表を表示する。各ページは1つの文字列に組み立ててから1回で書き出す。
+        端末に表示する場合は1ページ分ずつ表示し、ページの移動とパスワードの表示の切り替えを受け付ける。
+        端末以外（パイプやファイル）に出力する場合は、TABLE_WRITE_ROWS行ずつまとめて全ての行を書き出す。
+        パスワードの列は、TABLE_MASK_PASSWORDSがTrueの場合は伏せ字で表示する。
+        rowsとsecretsはTableRendererと同じ。
+        """
+        renderer = TableRenderer(columns, rows, secrets)
+        reveal = not TABLE_MASK_PASSWORDS
+        stream = sys.stdout
+        heading = f"\n{title}\n{renderer.header()}"
+        if not (stream.isatty() and sys.stdin.isatty()):
+            stream.write(heading + "\n")
+            for start in range(0, len(rows), TABLE_WRITE_ROWS):
+                stream.write(renderer.render(start, start + TABLE_WRITE_ROWS, reveal) + "\n")
+            if footer:
+                stream.write(footer + "\n")
+            stream.flush()
+            return
+
+        # 見出し・区切り線・ページの位置・操作の案内の分を除いた行数を1ページとする
+        page_size = TABLE_PAGE_SIZE or max(5, shutil.get_terminal_size().lines - 7)
+        has_secret = any(column.secret for column in columns)
+        start = 0
+        while True:
+            stop = min(start + page_size, len(rows))
+            page = [heading, renderer.render(start, stop, reveal), f"（{start + 1}〜{stop}件目 / 全{len(rows)}件）"]
+            if footer and stop == len(rows):
+                page.append(footer)
+            stream.write("\n".join(page) + "\n")
+            stream.flush()
+            if stop == len(rows) and start == 0 and not has_secret:
+                return # 1ページに収まり、切り替える表示も無い
+
+            commands = ["Enter: 次のページ" if stop < len(rows) else "Enter: 終了"]
+            if start > 0:
+                commands.append("b: 前のページ")
+            if has_secret:
+                commands.append("p: パスワードを隠す" if reveal else "p: パスワードを表示")
+            commands.append("q: 終了")
+            command = self.get_input(" / ".join(commands) + ": ").lower()
+            if command == "":
+                if stop == len(rows):
+                    return
+                start = stop
+            elif command == "b":
+                start = max(0, start - page_size)
+            elif command == "p" and has_secret:
+                reveal = not reveal
+            elif command == "q":
+                return
 
     def get_search_term(self):
         """検索するサービス名またはアカウントIDを取得する。"""
         return self.get_input("\n検索するサービス名またはアカウントID（または一部）を入力してください: ")
 
-    def display_search_results(self, search_term, found_passwords):
-        """検索結果を表示する。"""
+    def display_search_results(self, search_term, found_passwords, fetch_passwords, limit=SEARCH_RESULT_LIMIT):
+        """
+        検索結果を一致度の高い順に、最大limit件まで表示する。
+        found_passwordsは (サービス名, アカウントID, 一致度) のリスト。
+        パスワードは伏せ字で表示し、表示を切り替えたページの分だけfetch_passwords(サービス名のリスト)で取得する。
+        """
         if not found_passwords:
             print(f"'{search_term}' に一致するサービスまたはアカウントIDは見つかりませんでした。")
         else:
-            print(f"\n---------- '{search_term}' の検索結果 ----------")
-            for service_name, data in found_passwords:
-                account_id = data.get("account_id", "N/A")
-                password = data.get("password", "N/A")
-                fullwidth_chars_service = count_fullwidth_chars(service_name)
-                adjusted_width_service = PASSWORD_LIST_DISPLAY_GAP - fullwidth_chars_service
-                fullwidth_chars_account = count_fullwidth_chars(account_id)
-                adjusted_width_account = PASSWORD_LIST_DISPLAY_GAP - fullwidth_chars_account
-                print(f"サービス名: {service_name:<{adjusted_width_service}} アカウントID: {account_id:<{adjusted_width_account}} パスワード: {password}")
+            found_passwords = found_passwords[:limit]
+            rows = [(score, service_name, account_id) for service_name, account_id, score in found_passwords]
+            footer = None
+            if len(found_passwords) >= limit:
+                footer = f"一致度の高い上位{limit}件を表示しています。検索キーワードを詳しくすると絞り込めます。"
+            self._display_table(f"---------- '{search_term}' の検索結果 ----------", _SEARCH_RESULT_COLUMNS, rows, footer,
+                                secrets=lambda start, stop: [(password,) for password in fetch_passwords(
+                                    [item[0] for item in found_passwords[start:stop]])])
 
     def select_password_to_edit_delete(self, service_names):
         """編集または削除するパスワードをリストから選択させる。"""
@@ -140,6 +204,140 @@ class ConsoleView:
         """削除確認のY/Nを尋ねる。"""
         return ask_yes_no("本当に削除してよろしいですか？（y/n）: ")
 
+    def get_import_file_path(self):
+        """インポートするファイルのパスを取得する。"""
+        return self.get_input("\nインポートするファイル（.csv または .jsonl）のパスを入力してください（キャンセルはEnterキー）: ")
+
+    def get_export_file_path(self):
+        """エクスポート先のファイルのパスを取得する。"""
+        return self.get_input("\nエクスポート先のファイル（.csv または .jsonl）のパスを入力してください（キャンセルはEnterキー）: ")
+
+    def get_duplicate_policy(self):
+        """既に存在するサービス名をインポートする場合の扱いを尋ねる。"""
+        print("\n既に存在するサービス名の扱いを選択してください:")
+        print("1. スキップする（既存のパスワードを残す）")
+        print("2. 上書きする")
+        print("3. 別名で追加する（例: サービス名 (2)）")
+        choice = get_valid_number("選択肢を入力してください（1〜3）: ", 1, 3)
+        return ("skip", "overwrite", "rename")[choice - 1]
+
+    def display_import_progress(self, processed_count):
+        """インポートの進捗を表示する。"""
+        print(f"{processed_count}件を処理しました...")
+
+    def display_import_result(self, result):
+        """インポートの結果を表示する。"""
+        print("\n------------ インポート結果 ------------")
+        print(f"追加: {result['added']}件")
+        print(f"上書き: {result['overwritten']}件")
+        print(f"別名で追加: {result['renamed']}件")
+        print(f"スキップ: {result['skipped']}件")
+        print(f"エラー: {len(result['errors'])}件")
+        for message in result["errors"]:
+            self.display_error(message)
+        print("----------------------------------------")
+
+    def display_breach_warning(self, breach_count):
+        """追加・編集するパスワードが漏洩したパスワードの一覧にあった場合の警告を表示する。"""
+        print(f"警告: このパスワードは過去の漏洩データに{breach_count:,}回含まれています。別のパスワードに変更してください。")
+
+    def display_breached_passwords(self, breached_passwords, checked_count):
+        """
+        保管庫全体の漏洩チェックの結果を表示する。
+        breached_passwordsは (サービス名, アカウントID, 漏洩件数) のリスト。
+        """
+        title = "---------- 漏洩したパスワードの確認 ----------"
+        if not breached_passwords:
+            print(f"\n{title}")
+            print(f"{checked_count}件のパスワードを確認しました。漏洩データに含まれるパスワードはありませんでした。")
+            return
+        rows = [(service_name, account_id, f"{breach_count:,}") for service_name, account_id, breach_count in breached_passwords]
+        self._display_table(title, _BREACH_COLUMNS, rows,
+                            f"{checked_count}件中{len(breached_passwords)}件のパスワードが漏洩データに含まれています。変更をお勧めします。")
+        print("----------------------------------------")
+
+    def get_audit_sort_key(self):
+        """診断結果の並べ替えの順序を尋ねる。"""
+        print("\n診断結果の並べ替えの順序を選択してください:")
+        print("1. 弱い順")
+        print("2. サービス名順")
+        print("3. 使い回しの多い順")
+        print("4. 短い順")
+        choice = get_valid_number("選択肢を入力してください（1〜4）: ", 1, 4)
+        return ("strength", "service", "reuse", "length")[choice - 1]
+
+    def display_audit_results(self, audit_results):
+        """
+        パスワードの診断結果を表示する。
+        audit_resultsはAuditResult（サービス名, アカウントID, 文字数, 推定の強さ, 弱点, 使い回しの数）のリスト。
+        """
+        if not audit_results:
+            print("\n現在保存されているパスワードはありません。")
+            return
+
+        rows = [(service_name, account_id, length, f"{bits:.1f}ビット", "、".join(issues) or "問題なし")
+                for service_name, account_id, length, bits, issues, _ in audit_results]
+        problem_count = sum(1 for result in audit_results if result.issues)
+        reused_count = sum(1 for result in audit_results if result.reuse_count)
+        self._display_table("------------ パスワードの診断 ------------", _AUDIT_COLUMNS, rows,
+                            f"{len(audit_results)}件中{problem_count}件に問題があります（使い回し: {reused_count}件）。")
+        print("----------------------------------------")
+
+    def get_master_password_candidates(self):
+        """バックアップ時点のマスターパスワードの候補を、空行が入力されるまで1行に1つずつ入力させる。"""
+        print("\n以前のマスターパスワードで作成されたバックアップがある場合は、その候補を1行に1つずつ入力してください。")
+        candidates = []
+        while True:
+            candidate = self.get_input(f"候補{len(candidates) + 1}（終了は空行）: ", strip=False)
+            if not candidate:
+                return candidates
+            candidates.append(candidate)
+
+    def display_backup_checks(self, backup_checks, backup_diffs):
+        """
+        バックアップの検証結果を新しい順に表示する。
+        backup_diffsはbackup_checksと同じ順のBackupDiff（現在の保管庫と比べられない場合はNone）のリスト。
+        """
+        print("\n------------ バックアップの検証 ------------")
+        for check, diff in zip(backup_checks, backup_diffs):
+            timestamp = format_backup_timestamp(check.timestamp)
+            if check.error is not None:
+                print(f"{timestamp}  NG  {check.error}")
+                continue
+            line = f"{timestamp}  OK  {check.entry_count}件"
+            if check.password_index:
+                line += f"（マスターパスワードの候補{check.password_index}で復号）"
+            if diff is not None:
+                line += (f"  現在との差分: バックアップのみ{len(diff.only_in_backup)}件、"
+                         f"現在のみ{len(diff.only_in_vault)}件、内容の違い{len(diff.changed)}件")
+            print(line)
+        failed_count = sum(1 for check in backup_checks if check.error is not None)
+        print(f"{len(backup_checks)}件中{failed_count}件のバックアップを復号できませんでした。")
+        print("----------------------------------------")
+
+    def select_backup(self, backups):
+        """復元するバックアップを一覧から選択させる。"""
+        if not backups:
+            self.display_message("\nバックアップはありません。")
+            return 0 # キャンセルとして扱う
+
+        print("\n------- 復元するバックアップの選択 -------")
+        for i, backup in enumerate(backups):
+            print(f"{i + 1}. {format_backup_timestamp(backup['timestamp'])}")
+        print("----------------------------------------")
+        return get_valid_number("番号を入力してください（キャンセルは0）: ", 0, len(backups))
+
+    def confirm_restore(self, timestamp):
+        """復元の確認のY/Nを尋ねる。"""
+        print(f"\n保管庫の内容を {format_backup_timestamp(timestamp)} のバックアップの内容に置き換えます。")
+        print("現在の内容は復元の前にバックアップされます。マスターパスワードはバックアップ時点のものになります。")
+        return ask_yes_no("復元してよろしいですか？（y/n）: ")
+
+    def confirm_export(self):
+        """平文でのエクスポートの確認のY/Nを尋ねる。"""
+        print("\nエクスポートしたファイルにはパスワードが暗号化されずに保存されます。取り扱いに注意してください。")
+        return ask_yes_no("エクスポートしてよろしいですか？（y/n）: ")
+
     def display_error(self, message):
         """エラーメッセージを表示する。"""
         print(f"エラー: {message}")
@@ -0,0 +1,150 @@
+"""
+一覧表示の表を組み立てる。
+列の幅は全ての行を1回だけ走査して求め、ページ単位で1つの文字列にまとめてから書き出せるようにする。
+文字の表示幅はunicodedata.east_asian_widthで判定し、全角文字や絵文字の幅を2として数える。
+"""
+import unicodedata
+from collections import namedtuple
+from functools import lru_cache
+from operator import itemgetter, methodcaller
+
+from pwd_gen_tool.config import TABLE_MAX_COLUMN_WIDTH, TABLE_COLUMN_GAP, TABLE_WIDTH_CACHE_SIZE, PASSWORD_MASK
+
+# label: 見出し
+# align: "<"（左寄せ）または ">"（右寄せ）
+# secret: Trueの場合は伏せ字で表示し、表示を切り替えたときだけ値を取得する列（省略せずに表示する）
+Column = namedtuple("Column", ["label", "align", "secret"], defaults=("<", False))
+
+ELLIPSIS = "…"
+_ZERO_WIDTH_CATEGORIES = ("Mn", "Me", "Cf") # 結合文字・書式制御文字
+_ZWJ = "\u200d" # 絵文字を結合するゼロ幅接合子
+_EMOJI_PRESENTATION = "\ufe0f" # 直前の文字を絵文字（全角の幅）で表示させる異体字セレクタ
+
+def display_width(text: str) -> int:
+    """端末に表示したときの幅（半角の文字数）を返す。"""
+    if text.isascii():
+        return len(text)
+    return _wide_text_width(text)
+
+@lru_cache(maxsize=TABLE_WIDTH_CACHE_SIZE)
+def _wide_text_width(text: str) -> int:
+    """ASCII以外の文字を含む文字列の表示幅。同じアカウントIDなどは何度も表示されるため、結果を保持しておく。"""
+    width = 0
+    last_width = 0
+    joined = False
+    for char in text:
+        if char == _ZWJ:
+            joined = True
+            continue
+        if joined:
+            joined = False # ゼロ幅接合子で結合された文字は、直前の絵文字と合わせて1文字として表示される
+            continue
+        if char == _EMOJI_PRESENTATION:
+            if last_width == 1:
+                width += 1
+                last_width = 2
+            continue
+        if unicodedata.category(char) in _ZERO_WIDTH_CATEGORIES:
+            continue
+        last_width = 2 if unicodedata.east_asian_width(char) in ("W", "F") else 1
+        width += last_width
+    return width
+
+def truncate(text: str, width: int) -> str:
+    """表示幅がwidthを超える場合は、末尾を「…」にしてwidthに収める。"""
+    if display_width(text) <= width:
+        return text
+    limit = width - display_width(ELLIPSIS)
+    used = 0
+    for index, char in enumerate(text):
+        used += display_width(char)
+        if used > limit:
+            return text[:index] + ELLIPSIS
+    return text
+
+class TableRenderer:
+    """
+    行のリストを、列をそろえた表の文字列に組み立てる。
+    rowsの各行はsecret以外の列の値のタプルで、値はstrに変換して表示する。
+    secretの列は伏せ字で表示し、reveal=Trueで組み立てた場合だけ、その範囲の値をsecrets(start, stop)
+    （secretの列の値のタプルのリストを返す関数）で取得して表示する。伏せ字の間はパスワードを取得・復号しない。
+    secretの列の幅は伏せ字の幅で固定し、値の長さが分からないようにする（表示した値が長い場合は行末にはみ出す）。
+    """
+    def __init__(self, columns, rows, secrets=None, max_column_width=TABLE_MAX_COLUMN_WIDTH, gap=TABLE_COLUMN_GAP):
+        self.columns = columns
+        self.rows = rows
+        self.secrets = secrets
+        self.max_column_width = max_column_width
+        self.gap = " " * gap
+        # 各列の値を取り出す位置（secret以外の列はrowsの、secretの列はsecrets()の各行での位置）
+        self._positions = []
+        counts = {False: 0, True: 0}
+        for column in columns:
+            self._positions.append(counts[column.secret])
+            counts[column.secret] += 1
+        self.widths = self._measure()
+
+    def __len__(self):
+        return len(self.rows)
+
+    def _measure(self) -> list:
+        """
+        各列の幅（見出しを含む最大の表示幅、上限まで）を、列ごとに全ての行を1回だけ走査して求める。
+        上限を超える値がある列は、表示時に省略する列として記録する。secretの列は伏せ字の幅にする。
+        """
+        widths = []
+        self._overflows = []
+        for column, position in zip(self.columns, self._positions):
+            width = display_width(column.label)
+            if column.secret:
+                widths.append(max(width, display_width(PASSWORD_MASK)))
+                self._overflows.append(False)
+                continue
+            if self.rows:
+                width = max(width, max(map(display_width, map(str, map(itemgetter(position), self.rows)))))
+            overflow = width > self.max_column_width
+            widths.append(min(width, self.max_column_width) if overflow else width)
+            self._overflows.append(overflow)
+        return widths
+
+    def header(self) -> str:
+        """見出しと区切り線の2行を返す。"""
+        labels = [column.label for column in self.columns if not column.secret]
+        secret_labels = [column.label for column in self.columns if column.secret]
+        line = self._render_rows([labels], [secret_labels])
+        return line + "\n" + "-" * display_width(line)
+
+    def render(self, start: int = 0, stop: int = None, reveal: bool = False) -> str:
+        """start〜stop行目を、1行ずつ改行で区切った1つの文字列にする。"""
+        rows = self.rows[start:stop]
+        secret_rows = None
+        if reveal and self.secrets is not None:
+            secret_rows = self.secrets(start, start + len(rows))
+        return self._render_rows(rows, secret_rows)
+
+    def _render_rows(self, rows, secret_rows) -> str:
+        # 行ごとではなく列ごとにまとめて整形し、ASCIIだけの列はstrのメソッドでそろえる
+        cells = []
+        for index, (column, position) in enumerate(zip(self.columns, self._positions)):
+            if not column.secret:
+                texts = list(map(str, map(itemgetter(position), rows)))
+                if self._overflows[index]:
+                    texts = [truncate(text, self.widths[index]) for text in texts]
+            elif secret_rows is None:
+                texts = [PASSWORD_MASK] * len(rows)
+            else:
+                texts = list(map(str, map(itemgetter(position), secret_rows)))
+            cells.append(self._align(index, texts))
+        return "\n".join(map(self.gap.join, zip(*cells)))
+
+    def _align(self, index: int, texts: list) -> list:
+        width = self.widths[index]
+        right = self.columns[index].align == ">"
+        if not right and index == len(self.columns) - 1:
+            return texts # 行末には余白を付けない
+        if "".join(texts).isascii():
+            return list(map(methodcaller("rjust" if right else "ljust", width), texts))
+        # 全角文字などを含む場合は、表示幅と文字数の差の分だけ余白を減らす
+        if right:
+            return [text.rjust(width - display_width(text) + len(text)) for text in texts]
+        return [text.ljust(width - display_width(text) + len(text)) for text in texts]
@@ -0,0 +1,72 @@
+"""
+generateコマンドの起動時間を計測し、上限を超えた場合は終了コード1で終了する。
+あわせて、generateコマンドで暗号化ライブラリが読み込まれていないことも確認する。
+
+使い方: python scripts/check_startup_time.py [--runs N] [--budget-ms MS]
+"""
+import argparse
+import os
+import subprocess
+import sys
+import time
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT_DIR)
+
+from pwd_gen_tool.config import CLI_STARTUP_BUDGET_MS
+
+# generateコマンドを実行した後、読み込まれたモジュールに暗号化ライブラリが含まれていないかを確認するコード
+_IMPORT_CHECK = (
+    "import sys, io, contextlib\n"
+    "from pwd_gen_tool.controller.cli_controller import run_cli\n"
+    "with contextlib.redirect_stdout(io.StringIO()):\n"
+    "    run_cli(['generate'])\n"
+    "heavy = sorted(name for name in sys.modules if name.split('.')[0] == 'cryptography'"
+    " or name in ('pwd_gen_tool.model.data_storage', 'pwd_gen_tool.model.manager_model'))\n"
+    "print(','.join(heavy))\n"
+)
+
+def measure_cold_start(runs):
+    """main.py generate を別プロセスで実行し、各回の経過時間（ミリ秒）を返す。"""
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, os.path.join(ROOT_DIR, "main.py"), "generate"],
+                       check=True, stdout=subprocess.DEVNULL, cwd=ROOT_DIR)
+        timings.append((time.perf_counter() - start) * 1000)
+    return timings
+
+def find_heavy_imports():
+    """generateコマンドで読み込まれた重いモジュールの一覧を返す。"""
+    result = subprocess.run([sys.executable, "-c", _IMPORT_CHECK],
+                            check=True, capture_output=True, text=True, cwd=ROOT_DIR)
+    output = result.stdout.strip()
+    return output.split(",") if output else []
+
+def main():
+    parser = argparse.ArgumentParser(description="generateコマンドの起動時間を確認します。")
+    parser.add_argument("--runs", type=int, default=5, help="計測する回数（既定: 5）")
+    parser.add_argument("--budget-ms", type=float, default=CLI_STARTUP_BUDGET_MS,
+                        help=f"起動時間の上限（ミリ秒、既定: {CLI_STARTUP_BUDGET_MS}）")
+    args = parser.parse_args()
+
+    failed = False
+    heavy_imports = find_heavy_imports()
+    if heavy_imports:
+        print(f"NG: generateコマンドで不要なモジュールが読み込まれています: {', '.join(heavy_imports)}")
+        failed = True
+
+    timings = measure_cold_start(args.runs)
+    # 最も速い回を使い、ディスクキャッシュなど環境の揺らぎの影響を減らす
+    best = min(timings)
+    print(f"generateコマンドの起動時間: 最小 {best:.1f}ms / 最大 {max(timings):.1f}ms（上限 {args.budget_ms:.0f}ms）")
+    if best > args.budget_ms:
+        print("NG: 起動時間が上限を超えています。")
+        failed = True
+
+    if failed:
+        sys.exit(1)
+    print("OK")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,378 @@
+"""
+合成した保管庫（既定では1千・1万・10万・100万件）を使い、保存・読み込み・検索・一覧表示と
+パスワード生成の処理時間（スループットとパーセンタイル）とピークのメモリ使用量を計測する。
+結果はJSONで出力し、基準の計測結果と比べて閾値を超えて遅く・大きくなった項目があれば終了コード1で終了する。
+
+計測は一時ディレクトリで行い、実際の保管庫や設定には触れない。キー派生の繰り返し回数は、
+一時ディレクトリに置いたKDFの設定ファイル（calibrateコマンドの結果と同じ形式）で計測用に小さくする。
+
+各項目は準備の1回の実行の後に複数回（--passes）計測し、処理時間は最も速かった回、メモリ使用量は中央値を使う。
+
+使い方: python scripts/run_benchmarks.py [--sizes 1000,10000] [--passes N] [--output FILE]
+                                         [--baseline FILE] [--update-baseline]
+                                         [--time-threshold RATIO] [--memory-threshold RATIO]
+"""
+import argparse
+import contextlib
+import gc
+import itertools
+import json
+import os
+import platform
+import random
+import shutil
+import statistics
+import string
+import sys
+import tempfile
+import time
+import tracemalloc
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT_DIR)
+
+from pwd_gen_tool.config import (
+    BENCHMARK_SIZES, BENCHMARK_KDF_ITERATIONS, BENCHMARK_BASELINE_FILE,
+    BENCHMARK_TIME_THRESHOLD, BENCHMARK_MEMORY_THRESHOLD, BENCHMARK_PASSES,
+    BENCHMARK_MIN_TIME_DIFF_MS, BENCHMARK_MIN_TIME_DIFF_MS_PER_ITEM,
+    BENCHMARK_MIN_MEMORY_DIFF_KIB, BENCHMARK_MIN_MEMORY_DIFF_KIB_PER_ITEM, KDF_PROFILE_FILE,
+    PAYLOAD_CODEC, PAYLOAD_COMPRESSION, VAULT_SHARD_COUNT, VAULT_LAZY_SECRETS
+)
+from pwd_gen_tool.model import kdf
+from pwd_gen_tool.model.data_storage import load_passwords, save_passwords
+from pwd_gen_tool.model.generator_model import PasswordGeneratorModel
+from pwd_gen_tool.model.manager_model import PasswordManagerModel
+from pwd_gen_tool.model.password_entry import PasswordEntry, wipe_entries
+from pwd_gen_tool.utils import profiling
+from pwd_gen_tool.view.console_view import ConsoleView
+
+RESULT_VERSION = 2
+MASTER_PASSWORD = "benchmark-master-password"
+GENERATE_ITERATIONS = 10000
+
+_SERVICE_WORDS = ("mail", "bank", "shop", "cloud", "news", "game", "photo", "music", "travel", "work",
+                  "メール", "銀行", "通販", "写真")
+_DOMAINS = ("example.com", "example.jp", "example.org")
+_PASSWORD_CHARS = string.ascii_letters + string.digits + string.punctuation
+
+def make_passwords(size, rng) -> dict:
+    """size件の合成したパスワードを作る。アカウントIDは10サービスに1つの割合で使い回す。"""
+    accounts = [f"user{i}@{_DOMAINS[i % len(_DOMAINS)]}" for i in range(max(1, size // 10))]
+    passwords = {}
+    for i in range(size):
+        password = "".join(rng.choices(_PASSWORD_CHARS, k=rng.randint(12, 24)))
+        passwords[f"{rng.choice(_SERVICE_WORDS)}-{i:07d}"] = PasswordEntry.from_password(rng.choice(accounts), password)
+    return passwords
+
+def make_queries(service_names, count, rng) -> list:
+    """
+    重複の無い検索語をcount個作る。検索結果のキャッシュに当たらないよう、同じ検索語は使わない。
+    部分一致・略語（1文字おき）・入力ミス（隣り合う2文字の入れ替え）を順に混ぜる。
+    """
+    queries = []
+    seen = set()
+    while len(queries) < count:
+        name = rng.choice(service_names)
+        kind = len(queries) % 3
+        if kind == 0:
+            start = rng.randrange(len(name) - 4)
+            query = name[start:start + 5]
+        elif kind == 1:
+            query = name[::2]
+        else:
+            index = rng.randrange(len(name) - 1)
+            query = name[:index] + name[index + 1] + name[index] + name[index + 2:]
+        if query not in seen:
+            seen.add(query)
+            queries.append(query)
+    return queries
+
+def repeats_for(size, budget) -> int:
+    """件数に比例して時間のかかる処理の実行回数。合計の処理件数がおよそbudgetになるよう3〜20回の間で決める。"""
+    return max(3, min(20, budget // size))
+
+def calls_for(repeats, passes) -> int:
+    """measure()がfunc(i)を呼び出す回数（準備の1回、計測のrepeats回×passes回、メモリ使用量の計測のpasses回）。"""
+    return 1 + repeats * passes + passes
+
+def measure(results, name, size, func, repeats, items=1, cleanup=None, memory=True, passes=BENCHMARK_PASSES):
+    """
+    func(i)をrepeats回実行して処理時間を計測することをpasses回繰り返し、resultsに "名前[件数]" のキーで記録する。
+    計測の前に1回実行してキャッシュの作成などを済ませ、最も速かった回（中央値が最小の回）の結果を使う。
+    処理時間にはprofilingのスパンを使い、func内で記録された内訳のスパンもあわせて記録する。
+    memoryがTrueの場合は、tracemallocを有効にしてpasses回実行し、ピークのメモリ使用量の中央値を求める。
+    iは呼び出しごとに異なる0からの連番で、全部でcalls_for(repeats, passes)回呼び出す。
+
+    Args:
+        items (int): 1回の実行で処理する件数（スループットの計算と、揺らぎとして無視する差の大きさに使う）。
+        cleanup: func(i)の戻り値を受け取り、計測の対象外で後始末をする関数。
+    """
+    index = itertools.count()
+
+    def run():
+        value = func(next(index))
+        if cleanup is not None:
+            cleanup(value)
+
+    run() # 準備の実行は計測しない
+    best = None
+    for _ in range(passes):
+        gc.collect()
+        profiling.reset()
+        for _ in range(repeats):
+            i = next(index)
+            with profiling.span(name):
+                value = func(i)
+            if cleanup is not None:
+                cleanup(value)
+        spans = profiling.summary()["spans"]
+        stats = spans.pop(name)
+        if best is None or stats["p50_ms"] < best[0]["p50_ms"]:
+            best = (stats, spans)
+    stats, spans = best
+    result = {
+        "operation": name,
+        "size": size,
+        "items": items,
+        "iterations": repeats,
+        "passes": passes,
+        "throughput_per_sec": items * repeats / (stats["total_ms"] / 1000) if stats["total_ms"] else None,
+        "mean_ms": stats["mean_ms"],
+        "p50_ms": stats["p50_ms"],
+        "p90_ms": stats["p90_ms"],
+        "p99_ms": stats["p99_ms"],
+        "max_ms": stats["max_ms"],
+        "spans": {span_name: {"count": span["count"], "total_ms": span["total_ms"]}
+                  for span_name, span in sorted(spans.items())},
+    }
+    if memory:
+        samples = [_peak_memory(lambda: func(next(index)), cleanup) for _ in range(passes)]
+        result["peak_memory_kib"] = round(statistics.median(samples))
+    results[f"{name}[{size}]"] = result
+    return result
+
+def _peak_memory(func, cleanup=None) -> int:
+    """funcの実行中に増えたメモリ使用量のピーク（KiB、Pythonのオブジェクトの分）を返す。"""
+    gc.collect()
+    tracemalloc.start()
+    try:
+        start = tracemalloc.get_traced_memory()[0]
+        value = func()
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    if cleanup is not None:
+        cleanup(value)
+    return round((peak - start) / 1024)
+
+def run_vault_benchmarks(results, size, seed, memory, passes):
+    """件数sizeの保管庫で、保存・読み込み・検索・一覧表示を計測する。"""
+    rng = random.Random(seed + size)
+    passwords = make_passwords(size, rng)
+    service_names = sorted(passwords)
+    repeats = repeats_for(size, 200000)
+
+    save_passwords(passwords, MASTER_PASSWORD) # 初回の保存（ヘッダーとキースロットの作成）は計測しない
+    measure(results, "storage.save_passwords", size, lambda i: save_passwords(passwords, MASTER_PASSWORD),
+            repeats, items=size, memory=memory, passes=passes)
+    wipe_entries(passwords.values())
+    measure(results, "storage.load_passwords", size, lambda i: load_passwords(MASTER_PASSWORD),
+            repeats, items=size, cleanup=lambda loaded: wipe_entries(loaded.values(), close=True), memory=memory,
+            passes=passes)
+
+    model = PasswordManagerModel(MASTER_PASSWORD)
+    try:
+        query_count = max(20, min(200, 20000000 // size))
+        queries = make_queries(service_names, calls_for(query_count, passes), rng)
+        measure(results, "model.search_passwords", size, lambda i: model.search_passwords(queries[i]),
+                query_count, memory=memory, passes=passes)
+        measure(results, "model.get_all_passwords", size, lambda i: model.get_all_passwords(),
+                repeats, items=size, memory=memory, passes=passes)
+
+        accounts = model.get_accounts(0, size)
+        fetch_passwords = lambda start, stop: [item[2] for item in model.get_passwords(start, stop)]
+        view = ConsoleView()
+        with open(os.devnull, 'w', encoding='utf-8') as sink, contextlib.redirect_stdout(sink):
+            measure(results, "view.display_passwords", size, lambda i: view.display_passwords(accounts, fetch_passwords),
+                    repeats, items=size, memory=memory, passes=passes)
+    finally:
+        model.close(compact=False)
+
+def run_generator_benchmarks(results, memory, passes):
+    """パスワード生成を計測する。保管庫の件数には依存しないため、件数は0として記録する。"""
+    generator = PasswordGeneratorModel()
+    measure(results, "generator.generate_password", 0,
+            lambda i: generator.generate_password(16, True, True, True, True),
+            GENERATE_ITERATIONS, memory=memory, passes=passes)
+
+def run_benchmarks(sizes, seed, kdf_iterations, memory=True, passes=BENCHMARK_PASSES) -> dict:
+    """一時ディレクトリで全ての計測を行い、JSONに出力する結果を返す。"""
+    params = kdf.KdfParams("pbkdf2", kdf_iterations, 0, 0)
+    results = {}
+    original_dir = os.getcwd()
+    work_dir = tempfile.mkdtemp(prefix="pwd_gen_tool_bench_")
+    profiling.enable(report_at_exit=False)
+    try:
+        os.chdir(work_dir)
+        run_generator_benchmarks(results, memory, passes)
+        for size in sizes:
+            # 件数ごとに空のディレクトリから始め、前の保管庫のファイルが残らないようにする
+            size_dir = os.path.join(work_dir, str(size))
+            os.mkdir(size_dir)
+            os.chdir(size_dir)
+            with open(KDF_PROFILE_FILE, 'w', encoding='utf-8') as f:
+                json.dump(params._asdict(), f)
+            started = time.perf_counter()
+            run_vault_benchmarks(results, size, seed, memory, passes)
+            print(f"{size}件の計測が完了しました（{time.perf_counter() - started:.1f}秒）", file=sys.stderr)
+            os.chdir(work_dir)
+            shutil.rmtree(size_dir, ignore_errors=True)
+    finally:
+        profiling.disable()
+        os.chdir(original_dir)
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    return {
+        "version": RESULT_VERSION,
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "environment": {
+            "python": platform.python_version(),
+            "implementation": platform.python_implementation(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+        },
+        # 設定が異なる結果どうしを比べても意味が無いため、比較時に確認する
+        "sizes": list(sizes),
+        "settings": {
+            "seed": seed,
+            "passes": passes,
+            "kdf": params._asdict(),
+            "payload_codec": PAYLOAD_CODEC,
+            "payload_compression": PAYLOAD_COMPRESSION,
+            "vault_shard_count": VAULT_SHARD_COUNT,
+            "vault_lazy_secrets": VAULT_LAZY_SECRETS,
+        },
+        "results": results,
+    }
+
+def compare_results(current: dict, baseline: dict, time_threshold: float, memory_threshold: float) -> list:
+    """
+    基準の計測結果と比べ、閾値を超えて増えた指標を返す。
+    1回で処理する件数に応じた大きさ以下の増加は、揺らぎとして閾値を超えても性能の低下としない。
+
+    Returns:
+        list: (項目のキー, 指標名, 基準の値, 今回の値, 増加の割合) のリスト。
+    """
+    regressions = []
+    metrics = (("p50_ms", time_threshold, BENCHMARK_MIN_TIME_DIFF_MS, BENCHMARK_MIN_TIME_DIFF_MS_PER_ITEM),
+               ("peak_memory_kib", memory_threshold, BENCHMARK_MIN_MEMORY_DIFF_KIB,
+                BENCHMARK_MIN_MEMORY_DIFF_KIB_PER_ITEM))
+    for key, result in current["results"].items():
+        previous = baseline.get("results", {}).get(key)
+        if previous is None:
+            continue
+        for metric, threshold, min_diff, min_diff_per_item in metrics:
+            before, after = previous.get(metric), result.get(metric)
+            min_diff = max(min_diff, min_diff_per_item * result.get("items", 1))
+            if before is None or after is None or after - before <= min_diff:
+                continue
+            ratio = after / before - 1 if before else float("inf")
+            if ratio > threshold:
+                regressions.append((key, metric, before, after, ratio))
+    return regressions
+
+def format_results(current: dict, baseline: dict = None) -> str:
+    """計測結果を表にする。基準の結果がある場合は中央値の変化の割合も表示する。"""
+    header = f"{'benchmark':<40} {'iter':>6} {'items/s':>12} {'p50 ms':>10} {'p90 ms':>10} {'p99 ms':>10} {'peak KiB':>10}"
+    if baseline is not None:
+        header += f" {'p50 vs base':>12}"
+    lines = [header]
+    for key, result in current["results"].items():
+        throughput = result["throughput_per_sec"]
+        line = (f"{key:<40} {result['iterations']:>6} {throughput if throughput is not None else 0:>12.0f}"
+                f" {result['p50_ms']:>10.3f} {result['p90_ms']:>10.3f} {result['p99_ms']:>10.3f}"
+                f" {result.get('peak_memory_kib', '-'):>10}")
+        if baseline is not None:
+            previous = baseline.get("results", {}).get(key)
+            if previous is None or not previous.get("p50_ms"):
+                line += f" {'-':>12}"
+            else:
+                line += f" {(result['p50_ms'] / previous['p50_ms'] - 1) * 100:>+11.1f}%"
+        lines.append(line)
+    return "\n".join(lines)
+
+def _parse_sizes(value):
+    try:
+        sizes = [int(size) for size in value.split(",") if size.strip()]
+    except ValueError:
+        raise argparse.ArgumentTypeError("件数はカンマ区切りの整数で指定してください。")
+    if not sizes or min(sizes) < 10:
+        raise argparse.ArgumentTypeError("件数は10以上で指定してください。")
+    return sizes
+
+def main():
+    parser = argparse.ArgumentParser(description="保存・読み込み・検索・一覧表示・生成の性能を計測します。")
+    parser.add_argument("--sizes", type=_parse_sizes, default=list(BENCHMARK_SIZES),
+                        help=f"合成する保管庫の件数（カンマ区切り、既定: {','.join(map(str, BENCHMARK_SIZES))}）")
+    parser.add_argument("--seed", type=int, default=0, help="合成するデータの乱数のシード（既定: 0）")
+    parser.add_argument("--kdf-iterations", type=int, default=BENCHMARK_KDF_ITERATIONS,
+                        help=f"計測用の保管庫のPBKDF2の繰り返し回数（既定: {BENCHMARK_KDF_ITERATIONS}）")
+    parser.add_argument("--passes", type=int, default=BENCHMARK_PASSES,
+                        help=f"各項目を計測する回数。多いほど揺らぎが小さくなる（既定: {BENCHMARK_PASSES}）")
+    parser.add_argument("--no-memory", action="store_true", help="メモリ使用量を計測しない（計測時間が短くなる）")
+    parser.add_argument("--output", help="計測結果のJSONを書き出すファイル（省略時は標準出力）")
+    parser.add_argument("--baseline", default=os.path.join(ROOT_DIR, BENCHMARK_BASELINE_FILE),
+                        help=f"比較の基準にする計測結果のファイル（既定: {BENCHMARK_BASELINE_FILE}）")
+    parser.add_argument("--update-baseline", action="store_true", help="比較せずに、今回の結果を基準として保存する")
+    parser.add_argument("--time-threshold", type=float, default=BENCHMARK_TIME_THRESHOLD,
+                        help=f"処理時間の中央値の増加の許容割合（既定: {BENCHMARK_TIME_THRESHOLD}）")
+    parser.add_argument("--memory-threshold", type=float, default=BENCHMARK_MEMORY_THRESHOLD,
+                        help=f"メモリ使用量の増加の許容割合（既定: {BENCHMARK_MEMORY_THRESHOLD}）")
+    args = parser.parse_args()
+    # 一時ディレクトリに移動してから計測するため、相対パスは先に解決しておく
+    output = os.path.abspath(args.output) if args.output else None
+    baseline_path = os.path.abspath(args.baseline)
+
+    if args.passes < 1:
+        parser.error("--passesは1以上で指定してください。")
+    current = run_benchmarks(args.sizes, args.seed, args.kdf_iterations, memory=not args.no_memory,
+                             passes=args.passes)
+    document = json.dumps(current, ensure_ascii=False, indent=2)
+    if output:
+        with open(output, 'w', encoding='utf-8') as f:
+            f.write(document + "\n")
+    else:
+        print(document)
+
+    if args.update_baseline:
+        with open(baseline_path, 'w', encoding='utf-8') as f:
+            f.write(document + "\n")
+        print(format_results(current), file=sys.stderr)
+        print(f"基準の計測結果を保存しました: {baseline_path}", file=sys.stderr)
+        return
+
+    try:
+        with open(baseline_path, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+    except FileNotFoundError:
+        print(format_results(current), file=sys.stderr)
+        print(f"基準の計測結果 '{baseline_path}' が無いため、比較は行いません（--update-baselineで作成できます）。",
+              file=sys.stderr)
+        return
+    except (OSError, ValueError) as e:
+        print(f"NG: 基準の計測結果を読み込めませんでした: {e}", file=sys.stderr)
+        sys.exit(1)
+
+    print(format_results(current, baseline), file=sys.stderr)
+    if baseline.get("settings") != current["settings"] or baseline.get("environment") != current["environment"]:
+        print("注意: 基準の計測結果とは設定または実行環境が異なります。", file=sys.stderr)
+    regressions = compare_results(current, baseline, args.time_threshold, args.memory_threshold)
+    for key, metric, before, after, ratio in regressions:
+        print(f"NG: {key} の {metric} が {before:.3f} から {after:.3f} に増えました（{ratio * 100:+.1f}%）",
+              file=sys.stderr)
+    if regressions:
+        sys.exit(1)
+    print("OK", file=sys.stderr)
+
+if __name__ == "__main__":
+    main()
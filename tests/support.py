@@ -0,0 +1,62 @@
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+from cryptography.fernet import Fernet
+
+from pwd_gen_tool.config import KDF_PROFILE_FILE, PASSWORD_FILE
+from pwd_gen_tool.model import kdf
+from pwd_gen_tool.model.key_cache import session_key_cache
+from pwd_gen_tool.model.password_entry import PasswordEntry
+
+MASTER_PASSWORD = "test-master-password"
+# テスト用の保管庫でだけ使うPBKDF2の繰り返し回数（実際の保管庫の設定には影響しない）
+TEST_KDF_PARAMS = kdf.KdfParams("pbkdf2", 1000, 0, 0)
+
+class VaultTestCase(unittest.TestCase):
+    """
+    一時ディレクトリに移動してから各テストを実行する。
+    保管庫のファイルはカレントディレクトリに作られるため、実際の保管庫には触れない。
+    キー派生の繰り返し回数は、KDFの設定ファイル（calibrateコマンドの結果と同じ形式）で小さくする。
+    """
+    def setUp(self):
+        self.work_dir = tempfile.mkdtemp(prefix="pwd_gen_tool_test_")
+        # 後から登録したクリーンアップ（保管庫を閉じる処理など）が先に実行されるよう、元に戻す処理は最初に登録する
+        self.addCleanup(shutil.rmtree, self.work_dir, True)
+        self.addCleanup(os.chdir, os.getcwd())
+        self.addCleanup(session_key_cache.clear)
+        os.chdir(self.work_dir)
+        with open(KDF_PROFILE_FILE, 'w', encoding='utf-8') as f:
+            json.dump(TEST_KDF_PARAMS._asdict(), f)
+        session_key_cache.clear()
+
+    def read_vault_bytes(self) -> bytes:
+        with open(PASSWORD_FILE, 'rb') as f:
+            return f.read()
+
+    def write_vault_bytes(self, data: bytes):
+        with open(PASSWORD_FILE, 'wb') as f:
+            f.write(data)
+
+def make_passwords(count: int, prefix: str = "service") -> dict:
+    """count件のパスワードの辞書を作る。日本語のサービス名も混ぜる。"""
+    passwords = {}
+    for i in range(count):
+        service_name = f"{prefix}-{i:04d}" if i % 5 else f"サービス{i:04d}"
+        passwords[service_name] = PasswordEntry.from_password(f"user{i % 7}@example.com", f"pw-{i}-秘密")
+    return passwords
+
+def plain_passwords(passwords: dict) -> dict:
+    """比較しやすいよう {サービス名: (アカウントID, パスワード)} に変換する。"""
+    return {service_name: (entry.account_id, entry.password) for service_name, entry in passwords.items()}
+
+def write_legacy_vault(passwords: dict, master_password: str = MASTER_PASSWORD):
+    """v1形式（ソルト16バイト + Fernetトークン）のパスワードファイルを作る。"""
+    salt = os.urandom(16)
+    key = kdf.derive_key(master_password, salt, kdf.LEGACY_PARAMS)
+    data = json.dumps({service_name: {"account_id": account_id, "password": password}
+                       for service_name, (account_id, password) in passwords.items()}).encode('utf-8')
+    with open(PASSWORD_FILE, 'wb') as f:
+        f.write(salt + Fernet(key).encrypt(data))
@@ -0,0 +1,86 @@
+import io
+import os
+import socket
+import threading
+import unittest
+
+from pwd_gen_tool.agent.protocol import MAX_MESSAGE_SIZE, decode_message, encode_message, read_message
+from pwd_gen_tool.agent.server import AgentServer
+from pwd_gen_tool.model.data_storage import load_passwords
+from pwd_gen_tool.model.journal import VaultJournal
+from pwd_gen_tool.model.manager_model import PasswordManagerModel
+from tests.support import MASTER_PASSWORD, VaultTestCase
+
+class ProtocolTest(unittest.TestCase):
+    def test_round_trip(self):
+        message = {"op": "get", "service_name": "銀行"}
+        encoded = encode_message(message)
+        self.assertTrue(encoded.endswith(b"\n"))
+        self.assertEqual(read_message(io.BytesIO(encoded)), message)
+
+    def test_closed_stream(self):
+        self.assertIsNone(read_message(io.BytesIO(b"")))
+
+    def test_invalid_messages_are_rejected(self):
+        with self.assertRaises(ValueError):
+            decode_message(b"[1, 2]\n")
+        with self.assertRaises(ValueError):
+            read_message(io.BytesIO(b'{"op": "ping"}')) # 改行の無い途中で切れたメッセージ
+        with self.assertRaises(ValueError):
+            read_message(io.BytesIO(b"x" * (MAX_MESSAGE_SIZE + 2) + b"\n"))
+
+class AgentServerTest(VaultTestCase):
+    def setUp(self):
+        super().setUp()
+        self.model = PasswordManagerModel(MASTER_PASSWORD)
+        self.addCleanup(self.model.close)
+        self.model.add_password("mail", "user", "secret")
+        self.server = AgentServer(self.model, os.path.join(self.work_dir, "agent.sock"))
+
+    def test_dispatch(self):
+        self.assertEqual(self.server._dispatch({"op": "ping"}), {"ok": True, "result": "pong"})
+        self.assertEqual(self.server._dispatch({"op": "get", "service_name": "mail"}),
+                         {"ok": True, "result": ["mail", "user", "secret"]})
+        self.assertFalse(self.server._dispatch({"op": "get", "service_name": "missing"})["ok"])
+        self.assertFalse(self.server._dispatch({"op": "get"})["ok"]) # 必要な項目が無い
+        self.assertFalse(self.server._dispatch({"op": "unknown"})["ok"])
+
+    def test_search_returns_passwords_only_when_requested(self):
+        response = self.server._dispatch({"op": "search", "search_term": "mail"})
+        self.assertEqual(response["result"][0][:2], ["mail", "user"])
+        self.assertEqual(len(response["result"][0]), 3)
+        response = self.server._dispatch({"op": "search", "search_term": "mail", "passwords": True})
+        self.assertEqual(response["result"][0][-1], "secret")
+
+    def test_changes_are_saved(self):
+        self.server._dispatch({"op": "add", "service_name": "bank", "account_id": "taro", "password": "money"})
+        self.server._dispatch({"op": "delete", "service_name": "mail"})
+        self.assertEqual(self.server._dispatch({"op": "list"})["result"], ["bank"])
+        loaded = load_passwords(MASTER_PASSWORD, VaultJournal())
+        self.assertEqual(list(loaded), ["bank"])
+
+    def test_reads_see_changes_from_other_sessions(self):
+        other = PasswordManagerModel(MASTER_PASSWORD)
+        self.addCleanup(other.close)
+        other.update_password("mail", "mail", "user", "changed")
+        self.assertEqual(self.server._dispatch({"op": "get", "service_name": "mail"})["result"][2], "changed")
+
+    def test_serves_requests_over_socket(self):
+        self.server.bind()
+        thread = threading.Thread(target=self.server.serve_forever)
+        thread.start()
+        try:
+            with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as client:
+                client.connect(self.server.socket_path)
+                with client.makefile('rb') as reader:
+                    client.sendall(encode_message({"op": "get", "service_name": "mail"}))
+                    self.assertEqual(read_message(reader)["result"], ["mail", "user", "secret"])
+                    client.sendall(encode_message({"op": "stop"}))
+                    self.assertTrue(read_message(reader)["ok"])
+        finally:
+            thread.join(timeout=10)
+        self.assertFalse(thread.is_alive())
+        self.assertFalse(os.path.exists(self.server.socket_path))
+
+if __name__ == "__main__":
+    unittest.main()
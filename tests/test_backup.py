@@ -0,0 +1,96 @@
+import os
+import unittest
+from datetime import datetime, timedelta
+
+from pwd_gen_tool.config import MAX_BACKUP_FILES, PASSWORD_FILE
+from pwd_gen_tool.model.backup_store import BackupStore
+from pwd_gen_tool.model.backup_verifier import diff_digests, entry_digests, find_master_password, verify_backups
+from pwd_gen_tool.model.data_storage import save_passwords
+from pwd_gen_tool.model.password_entry import PasswordEntry
+from tests.support import MASTER_PASSWORD, VaultTestCase, make_passwords
+
+DIGEST_KEY = b"k" * 32
+
+class BackupStoreTest(VaultTestCase):
+    def setUp(self):
+        super().setUp()
+        self.store = BackupStore()
+        self.now = datetime(2026, 1, 5, 12, 0, 0)
+
+    def write_vault(self, content: bytes):
+        self.write_vault_bytes(content)
+        # 内容を変えても更新時刻とサイズが前回と同じにならないよう、更新時刻をずらす
+        self.now += timedelta(hours=1)
+        os.utime(PASSWORD_FILE, ns=(int(self.now.timestamp() * 1e9),) * 2)
+
+    def backup(self):
+        return self.store.backup(PASSWORD_FILE, now=self.now)
+
+    def test_unchanged_file_is_not_backed_up_again(self):
+        self.write_vault(b"first")
+        self.assertTrue(self.backup())
+        self.assertFalse(self.backup())
+        # 更新時刻だけが変わった場合も、内容が同じならバックアップしない
+        self.write_vault(b"first")
+        self.assertFalse(self.backup())
+        self.assertEqual(len(self.store.list_backups()), 1)
+
+    def test_same_content_is_stored_once(self):
+        for content in (b"first", b"second", b"first"):
+            self.write_vault(content)
+            self.assertTrue(self.backup())
+        backups = self.store.list_backups()
+        self.assertEqual(len(backups), 3)
+        self.assertEqual(backups[0]["hash"], backups[2]["hash"])
+        self.assertEqual(len(os.listdir(self.store.objects_dir)), 2)
+        with open(backups[1]["path"], 'rb') as f:
+            self.assertEqual(f.read(), b"second")
+
+    def test_old_backups_are_pruned(self):
+        for i in range(40):
+            self.write_vault(b"content %d" % i)
+            self.backup()
+        backups = self.store.list_backups()
+        self.assertLess(len(backups), 40)
+        self.assertGreaterEqual(len(backups), MAX_BACKUP_FILES)
+        # 削除したバックアップの内容のファイルも残さない
+        self.assertEqual(sorted(os.listdir(self.store.objects_dir)),
+                         sorted(os.path.basename(backup["path"]) for backup in backups))
+        with open(backups[0]["path"], 'rb') as f:
+            self.assertEqual(f.read(), b"content 39")
+
+class BackupVerifierTest(VaultTestCase):
+    def test_verify_reports_differences(self):
+        save_passwords(make_passwords(5), MASTER_PASSWORD)
+        BackupStore().backup(PASSWORD_FILE)
+        backups = BackupStore().list_backups()
+
+        checks = verify_backups(backups, ["wrong-password", MASTER_PASSWORD], DIGEST_KEY, max_workers=1)
+        self.assertEqual(len(checks), 1)
+        self.assertIsNone(checks[0].error)
+        self.assertEqual(checks[0].entry_count, 5)
+        self.assertEqual(checks[0].password_index, 1)
+
+        current = make_passwords(5)
+        del current["service-0001"]
+        current["service-0002"] = PasswordEntry.from_password("user2@example.com", "changed")
+        current["new"] = PasswordEntry.from_password("user", "secret")
+        diff = diff_digests(checks[0].digests, entry_digests(current, DIGEST_KEY))
+        self.assertEqual(diff.only_in_backup, ["service-0001"])
+        self.assertEqual(diff.only_in_vault, ["new"])
+        self.assertEqual(diff.changed, ["service-0002"])
+
+    def test_verify_reports_wrong_password(self):
+        save_passwords(make_passwords(2), MASTER_PASSWORD)
+        BackupStore().backup(PASSWORD_FILE)
+        checks = verify_backups(BackupStore().list_backups(), ["wrong-password"], DIGEST_KEY, max_workers=1)
+        self.assertIsNotNone(checks[0].error)
+        self.assertIsNone(checks[0].password_index)
+
+    def test_find_master_password(self):
+        save_passwords(make_passwords(2), MASTER_PASSWORD)
+        self.assertEqual(find_master_password(PASSWORD_FILE, ["a", MASTER_PASSWORD, "b"], max_workers=2), 1)
+        self.assertIsNone(find_master_password(PASSWORD_FILE, ["a", "b"], max_workers=2))
+
+if __name__ == "__main__":
+    unittest.main()
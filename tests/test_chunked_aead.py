@@ -0,0 +1,80 @@
+import base64
+import io
+import os
+import unittest
+
+from pwd_gen_tool.model.chunked_aead import ChunkedReader, ChunkedWriter, is_container
+
+CHUNK_SIZE = 64
+
+def make_key() -> bytes:
+    return base64.urlsafe_b64encode(os.urandom(32))
+
+def encrypt(data: bytes, key: bytes, chunk_size: int = CHUNK_SIZE) -> bytes:
+    f = io.BytesIO()
+    with ChunkedWriter(f, key, chunk_size) as writer:
+        writer.write(data)
+    return f.getvalue()
+
+def decrypt(data: bytes, key: bytes) -> bytes:
+    return ChunkedReader(io.BytesIO(data), key).read()
+
+class ChunkedAeadTest(unittest.TestCase):
+    def setUp(self):
+        self.key = make_key()
+
+    def test_round_trip(self):
+        # セグメントの境界ちょうど・前後のサイズも含めて確かめる
+        for size in (0, 1, CHUNK_SIZE - 1, CHUNK_SIZE, CHUNK_SIZE + 1, CHUNK_SIZE * 5, 1000):
+            with self.subTest(size=size):
+                data = os.urandom(size)
+                encrypted = encrypt(data, self.key)
+                self.assertTrue(is_container(encrypted))
+                self.assertEqual(decrypt(encrypted, self.key), data)
+
+    def test_partial_reads(self):
+        data = os.urandom(CHUNK_SIZE * 3 + 10)
+        reader = ChunkedReader(io.BytesIO(encrypt(data, self.key)), self.key)
+        self.assertEqual(reader.peek(5), data[:5])
+        self.assertEqual(reader.read(100), data[:100])
+        self.assertEqual(reader.read(), data[100:])
+        self.assertEqual(reader.read(), b"")
+
+    def test_wrong_key_is_rejected(self):
+        encrypted = encrypt(b"secret", self.key)
+        with self.assertRaises(ValueError):
+            decrypt(encrypted, make_key())
+
+    def test_truncated_data_is_rejected(self):
+        encrypted = encrypt(os.urandom(CHUNK_SIZE * 3), self.key)
+        segment_size = CHUNK_SIZE + 16
+        header_size = len(encrypted) - 3 * segment_size
+        # セグメントの途中で途切れた場合と、セグメントの境界で途切れた場合（最後の印が無い）
+        for length in (len(encrypted) - 1, header_size + segment_size, header_size + 2 * segment_size, 10):
+            with self.subTest(length=length), self.assertRaises(ValueError):
+                decrypt(encrypted[:length], self.key)
+
+    def test_modified_data_is_rejected(self):
+        encrypted = encrypt(os.urandom(CHUNK_SIZE * 3), self.key)
+        for position in (30, len(encrypted) // 2, len(encrypted) - 1):
+            with self.subTest(position=position):
+                tampered = bytearray(encrypted)
+                tampered[position] ^= 0x01
+                with self.assertRaises(ValueError):
+                    decrypt(bytes(tampered), self.key)
+
+    def test_reordered_segments_are_rejected(self):
+        encrypted = encrypt(os.urandom(CHUNK_SIZE * 3), self.key)
+        segment_size = CHUNK_SIZE + 16
+        header_size = len(encrypted) - 3 * segment_size
+        header, body = encrypted[:header_size], encrypted[header_size:]
+        segments = [body[i:i + segment_size] for i in range(0, len(body), segment_size)]
+        with self.assertRaises(ValueError):
+            decrypt(header + segments[1] + segments[0] + segments[2], self.key)
+
+    def test_trailing_data_is_rejected(self):
+        with self.assertRaises(ValueError):
+            decrypt(encrypt(b"secret", self.key) + b"extra", self.key)
+
+if __name__ == "__main__":
+    unittest.main()
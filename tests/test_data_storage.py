@@ -0,0 +1,218 @@
+import os
+import unittest
+from unittest import mock
+
+from pwd_gen_tool.config import JOURNAL_FILE
+from pwd_gen_tool.model import data_storage, payload_codec
+from pwd_gen_tool.model.backup_store import BackupStore
+from pwd_gen_tool.model.journal import VaultJournal
+from pwd_gen_tool.model.password_entry import PasswordEntry, wipe_entries
+from pwd_gen_tool.model.vault_header import HEADER_SIZE, is_vault_header
+from pwd_gen_tool.model.vault_lock import read_vault_state
+from tests.support import MASTER_PASSWORD, VaultTestCase, make_passwords, plain_passwords, write_legacy_vault
+
+# 保管庫の保存形式ごとの設定（data_storageのモジュール変数を差し替える）
+LAYOUTS = {
+    "json": {"VAULT_SHARD_COUNT": 0, "VAULT_LAZY_SECRETS": False, "codec": payload_codec.JsonCodec},
+    "records": {"VAULT_SHARD_COUNT": 0, "VAULT_LAZY_SECRETS": False, "codec": payload_codec.RecordCodec},
+    "indexed": {"VAULT_SHARD_COUNT": 0, "VAULT_LAZY_SECRETS": True, "codec": payload_codec.RecordCodec},
+    "sharded": {"VAULT_SHARD_COUNT": 4, "VAULT_LAZY_SECRETS": False, "codec": payload_codec.RecordCodec},
+}
+
+def use_layout(name):
+    """保存形式を切り替えるコンテキストマネージャーを返す。"""
+    layout = LAYOUTS[name]
+    patcher = mock.patch.multiple(data_storage, VAULT_SHARD_COUNT=layout["VAULT_SHARD_COUNT"],
+                                  VAULT_LAZY_SECRETS=layout["VAULT_LAZY_SECRETS"])
+    codec_patcher = mock.patch.object(payload_codec, "get_codec", lambda name=None: layout["codec"]())
+
+    class _Layout:
+        def __enter__(self):
+            patcher.start()
+            codec_patcher.start()
+
+        def __exit__(self, *exc_info):
+            codec_patcher.stop()
+            patcher.stop()
+    return _Layout()
+
+class RoundTripTest(VaultTestCase):
+    def test_each_layout_round_trips(self):
+        expected = plain_passwords(make_passwords(50))
+        for name in LAYOUTS:
+            with self.subTest(layout=name), use_layout(name):
+                data_storage.save_passwords(make_passwords(50), MASTER_PASSWORD)
+                loaded = data_storage.load_passwords(MASTER_PASSWORD)
+                self.assertEqual(plain_passwords(loaded), expected)
+                wipe_entries(loaded.values(), close=True)
+
+    def test_layout_can_be_changed_between_saves(self):
+        # 以前の形式で保存した保管庫も、現在の設定の形式で読み込み・保存し直せる
+        expected = plain_passwords(make_passwords(20))
+        previous = None
+        for name in ("json", "sharded", "indexed", "records"):
+            with self.subTest(previous=previous, layout=name), use_layout(name):
+                passwords = data_storage.load_passwords(MASTER_PASSWORD) if previous else make_passwords(20)
+                data_storage.save_passwords(passwords, MASTER_PASSWORD)
+                wipe_entries(passwords.values(), close=True)
+                loaded = data_storage.load_passwords(MASTER_PASSWORD)
+                self.assertEqual(plain_passwords(loaded), expected)
+                wipe_entries(loaded.values(), close=True)
+            previous = name
+        self.assertEqual(data_storage.shard_paths(), [])
+
+    def test_indexed_layout_survives_rewrite_while_mapped(self):
+        with use_layout("indexed"):
+            data_storage.save_passwords(make_passwords(30), MASTER_PASSWORD)
+            loaded = data_storage.load_passwords(MASTER_PASSWORD)
+            self.assertTrue(loaded["service-0001"].is_lazy())
+            loaded["renamed"] = loaded.pop("service-0002")
+            del loaded["service-0003"]
+            data_storage.save_passwords(loaded, MASTER_PASSWORD)
+            # 書き直した後も、メモリマップを開き直したレコードから復号できる
+            self.assertEqual(loaded["service-0001"].password, "pw-1-秘密")
+            self.assertEqual(loaded["renamed"].password, "pw-2-秘密")
+            reloaded = data_storage.load_passwords(MASTER_PASSWORD)
+            self.assertEqual(plain_passwords(reloaded), plain_passwords(loaded))
+            wipe_entries(reloaded.values(), close=True)
+            wipe_entries(loaded.values(), close=True)
+
+    def test_missing_vault_loads_empty(self):
+        self.assertEqual(data_storage.load_passwords(MASTER_PASSWORD), {})
+
+class WrongPasswordTest(VaultTestCase):
+    def test_wrong_password_is_rejected(self):
+        data_storage.save_passwords(make_passwords(3), MASTER_PASSWORD)
+        with self.assertRaises(ValueError):
+            data_storage.load_passwords("wrong-password")
+
+    def test_wrong_password_is_rejected_for_legacy_vault(self):
+        write_legacy_vault({"mail": ("user", "secret")})
+        with self.assertRaises(ValueError):
+            data_storage.load_passwords("wrong-password")
+        # 開けなかった場合は移行しない
+        self.assertFalse(is_vault_header(self.read_vault_bytes()[:HEADER_SIZE]))
+
+    def test_master_password_change_rewraps_key(self):
+        data_storage.save_passwords(make_passwords(5), MASTER_PASSWORD)
+        self.assertTrue(data_storage.rewrap_data_key(MASTER_PASSWORD, "new-master-password"))
+        with self.assertRaises(ValueError):
+            data_storage.load_passwords(MASTER_PASSWORD)
+        loaded = data_storage.load_passwords("new-master-password")
+        self.assertEqual(plain_passwords(loaded), plain_passwords(make_passwords(5)))
+
+class TamperTest(VaultTestCase):
+    def test_truncated_vault_is_rejected(self):
+        data_storage.save_passwords(make_passwords(20), MASTER_PASSWORD)
+        self.write_vault_bytes(self.read_vault_bytes()[:-10])
+        with self.assertRaises(ValueError):
+            data_storage.load_passwords(MASTER_PASSWORD)
+
+    def test_modified_vault_is_rejected(self):
+        data_storage.save_passwords(make_passwords(20), MASTER_PASSWORD)
+        data = bytearray(self.read_vault_bytes())
+        data[-40] ^= 0x01
+        self.write_vault_bytes(bytes(data))
+        with self.assertRaises(ValueError):
+            data_storage.load_passwords(MASTER_PASSWORD)
+
+class LegacyMigrationTest(VaultTestCase):
+    def test_legacy_vault_is_migrated_on_load(self):
+        write_legacy_vault({"mail": ("user", "secret"), "銀行": ("taro", "パスワード")})
+        loaded = data_storage.load_passwords(MASTER_PASSWORD)
+        self.assertEqual(plain_passwords(loaded), {"mail": ("user", "secret"), "銀行": ("taro", "パスワード")})
+        self.assertTrue(is_vault_header(self.read_vault_bytes()[:HEADER_SIZE]))
+        # 移行は通常の書き込みとして世代番号を進め、移行前のファイルはバックアップに残す
+        self.assertEqual(read_vault_state().generation, 1)
+        self.assertEqual(len(BackupStore().list_backups()), 1)
+
+    def test_migrated_vault_is_not_migrated_again(self):
+        write_legacy_vault({"mail": ("user", "secret")})
+        data_storage.load_passwords(MASTER_PASSWORD)
+        migrated = self.read_vault_bytes()
+        data_storage.load_passwords(MASTER_PASSWORD)
+        self.assertEqual(self.read_vault_bytes(), migrated)
+        self.assertEqual(read_vault_state().generation, 1)
+
+    def test_migration_does_not_overwrite_a_vault_migrated_meanwhile(self):
+        # 読み込みを始めた後、ロックを取得するまでに他のプロセスが移行して書き込んだ場合
+        write_legacy_vault({"mail": ("user", "old")})
+        original_lock = data_storage.vault_lock
+
+        def migrate_first(*args, **kwargs):
+            data_storage.vault_lock = original_lock
+            passwords = {"mail": PasswordEntry.from_password("user", "new")}
+            data_storage.save_passwords(passwords, MASTER_PASSWORD)
+            return original_lock(*args, **kwargs)
+
+        with mock.patch.object(data_storage, "vault_lock", migrate_first):
+            loaded = data_storage.load_passwords(MASTER_PASSWORD)
+        self.assertEqual(plain_passwords(loaded), {"mail": ("user", "new")})
+
+class JournalTest(VaultTestCase):
+    def test_journal_records_are_replayed_and_compacted(self):
+        journal = VaultJournal()
+        passwords = data_storage.load_passwords(MASTER_PASSWORD, journal)
+        data_storage.save_passwords(passwords, MASTER_PASSWORD, journal)
+        data_storage.append_journal(journal, MASTER_PASSWORD, "put", "mail",
+                                    PasswordEntry.from_password("user", "secret"))
+        data_storage.append_journal(journal, MASTER_PASSWORD, "put", "bank",
+                                    PasswordEntry.from_password("user", "money"))
+        data_storage.append_journal(journal, MASTER_PASSWORD, "delete", "bank")
+        self.assertTrue(os.path.exists(JOURNAL_FILE))
+
+        # パスワードファイルには書き込まず、読み込み時にジャーナルから再適用される
+        reader = VaultJournal()
+        loaded = data_storage.load_passwords(MASTER_PASSWORD, reader)
+        self.assertEqual(plain_passwords(loaded), {"mail": ("user", "secret")})
+        self.assertEqual(reader.record_count, 3)
+
+        data_storage.save_passwords(loaded, MASTER_PASSWORD, reader)
+        self.assertFalse(os.path.exists(JOURNAL_FILE))
+        self.assertEqual(plain_passwords(data_storage.load_passwords(MASTER_PASSWORD)), {"mail": ("user", "secret")})
+
+    def test_torn_journal_tail_is_ignored(self):
+        journal = VaultJournal()
+        data_storage.save_passwords(data_storage.load_passwords(MASTER_PASSWORD, journal), MASTER_PASSWORD, journal)
+        data_storage.append_journal(journal, MASTER_PASSWORD, "put", "mail",
+                                    PasswordEntry.from_password("user", "secret"))
+        with open(JOURNAL_FILE, 'ab') as f:
+            f.write(b"\x00\x00\x01\x00partial") # 書き込み途中で途切れたレコード
+        loaded = data_storage.load_passwords(MASTER_PASSWORD, VaultJournal())
+        self.assertEqual(plain_passwords(loaded), {"mail": ("user", "secret")})
+
+class RestoreTest(VaultTestCase):
+    def test_restore_replaces_vault_and_keeps_current_state_in_backup(self):
+        data_storage.save_passwords(make_passwords(3), MASTER_PASSWORD)
+        data_storage.create_backups()
+        backup = BackupStore().list_backups()[0]
+
+        # ジャーナルにだけ記録された変更も、復元前のバックアップに取り込まれる
+        journal = VaultJournal()
+        data_storage.load_passwords(MASTER_PASSWORD, journal)
+        data_storage.append_journal(journal, MASTER_PASSWORD, "put", "journal-only",
+                                    PasswordEntry.from_password("user", "latest"))
+
+        count = data_storage.restore_vault(backup["path"], MASTER_PASSWORD, MASTER_PASSWORD)
+        self.assertEqual(count, 3)
+        self.assertFalse(os.path.exists(JOURNAL_FILE))
+        self.assertEqual(plain_passwords(data_storage.load_passwords(MASTER_PASSWORD)),
+                         plain_passwords(make_passwords(3)))
+
+        backups = BackupStore().list_backups()
+        self.assertEqual(len(backups), 2)
+        before_restore = data_storage.read_vault_file(backups[0]["path"], MASTER_PASSWORD)
+        self.assertEqual(before_restore["journal-only"].password, "latest")
+
+    def test_restore_with_wrong_password_leaves_vault_untouched(self):
+        data_storage.save_passwords(make_passwords(3), MASTER_PASSWORD)
+        data_storage.create_backups()
+        backup = BackupStore().list_backups()[0]
+        data_storage.save_passwords(make_passwords(5), MASTER_PASSWORD)
+        current = self.read_vault_bytes()
+        with self.assertRaises(ValueError):
+            data_storage.restore_vault(backup["path"], "wrong-password", MASTER_PASSWORD)
+        self.assertEqual(self.read_vault_bytes(), current)
+
+if __name__ == "__main__":
+    unittest.main()
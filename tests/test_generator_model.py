@@ -0,0 +1,45 @@
+import string
+import unittest
+
+from pwd_gen_tool.model.generator_model import PasswordGeneratorModel
+
+class PasswordGeneratorModelTest(unittest.TestCase):
+    def setUp(self):
+        self.model = PasswordGeneratorModel()
+
+    def test_length_and_character_classes(self):
+        classes = [string.ascii_uppercase, string.ascii_lowercase, string.digits, string.punctuation]
+        for flags in [(True, True, True, True), (True, False, False, False), (False, True, True, False),
+                      (False, False, False, True)]:
+            with self.subTest(flags=flags):
+                selected = [chars for chars, used in zip(classes, flags) if used]
+                for length in (len(selected), 8, 64):
+                    password = self.model.generate_password(length, *flags)
+                    self.assertEqual(len(password), length)
+                    self.assertTrue(set(password) <= set("".join(selected)))
+                    # 選択した文字種は必ず1文字以上含まれる
+                    self.assertTrue(all(set(password) & set(chars) for chars in selected))
+
+    def test_generate_many(self):
+        passwords = self.model.generate_many(500, 16, True, True, True, False)
+        self.assertEqual(len(passwords), 500)
+        self.assertEqual(len(set(passwords)), 500)
+        self.assertTrue(all(len(password) == 16 for password in passwords))
+
+    def test_distribution_is_not_biased(self):
+        # 剰余による偏りがあれば、文字ごとの出現回数に大きな差が出る
+        counts = {}
+        for password in self.model.generate_many(200, 100, False, False, True, False):
+            for char in password:
+                counts[char] = counts.get(char, 0) + 1
+        self.assertEqual(set(counts), set(string.digits))
+        self.assertLess(max(counts.values()) / min(counts.values()), 1.2)
+
+    def test_invalid_options_are_rejected(self):
+        with self.assertRaises(ValueError):
+            self.model.generate_password(12, False, False, False, False)
+        with self.assertRaises(ValueError):
+            self.model.generate_password(3, True, True, True, True)
+
+if __name__ == "__main__":
+    unittest.main()
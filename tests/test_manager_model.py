@@ -0,0 +1,128 @@
+import unittest
+
+from pwd_gen_tool.model.data_storage import load_passwords, save_passwords
+from pwd_gen_tool.model.journal import VaultJournal
+from pwd_gen_tool.model.manager_model import PasswordManagerModel
+from tests.support import MASTER_PASSWORD, VaultTestCase, make_passwords, plain_passwords
+
+class PasswordManagerModelTest(VaultTestCase):
+    def open_model(self, **kwargs):
+        model = PasswordManagerModel(MASTER_PASSWORD, **kwargs)
+        self.addCleanup(model.close)
+        return model
+
+    def test_changes_are_saved(self):
+        model = self.open_model()
+        model.add_password("mail", "user", "secret")
+        model.add_password("bank", "taro", "money")
+        model.update_password("mail", "webmail", "user2", "new-secret")
+        model.delete_password("bank")
+        self.assertEqual(model.get_password("webmail"), ("webmail", "user2", "new-secret"))
+        self.assertEqual(model.get_password("mail"), (None, None, None))
+        loaded = load_passwords(MASTER_PASSWORD, VaultJournal())
+        self.assertEqual(plain_passwords(loaded), {"webmail": ("user2", "new-secret")})
+
+    def test_duplicate_and_missing_names_are_rejected(self):
+        model = self.open_model()
+        model.add_password("mail", "user", "secret")
+        with self.assertRaises(ValueError):
+            model.add_password("mail", "user", "other")
+        with self.assertRaises(ValueError):
+            model.update_password("missing", "missing", "user", "secret")
+        with self.assertRaises(ValueError):
+            model.delete_password("missing")
+
+    def test_search_does_not_return_passwords(self):
+        save_passwords(make_passwords(30), MASTER_PASSWORD)
+        model = self.open_model()
+        results = model.search_passwords("service-0012")
+        self.assertEqual(results[0][:2], ("service-0012", "user5@example.com"))
+        self.assertTrue(all(len(result) == 3 for result in results))
+
+    def test_sorted_listing(self):
+        save_passwords(make_passwords(10), MASTER_PASSWORD)
+        model = self.open_model()
+        names = model.get_all_service_names()
+        self.assertEqual(names, sorted(names))
+        self.assertEqual(model.get_password_by_index(0)[0], names[0])
+        self.assertEqual(model.get_password_count(), 10)
+
+    def test_lock_wipes_passwords(self):
+        model = self.open_model()
+        model.add_password("mail", "user", "secret")
+        entry = model.passwords["mail"]
+        model.lock()
+        self.assertEqual(model.get_password_count(), 0)
+        with self.assertRaises(ValueError):
+            entry.secret()
+
+class ConcurrentSessionTest(VaultTestCase):
+    """同じ保管庫を2つのセッション（別のプロセスの代わりに別のインスタンス）で同時に開いた場合。"""
+    def setUp(self):
+        super().setUp()
+        save_passwords(make_passwords(5), MASTER_PASSWORD)
+
+    def open_model(self, **kwargs):
+        model = PasswordManagerModel(MASTER_PASSWORD, **kwargs)
+        self.addCleanup(model.close)
+        return model
+
+    def test_conflicting_update_is_rejected(self):
+        first, second = self.open_model(), self.open_model()
+        first.update_password("service-0001", "service-0001", "user", "first")
+        with self.assertRaises(ValueError):
+            second.update_password("service-0001", "service-0001", "user", "second")
+        # 競合した変更は保存されず、他のセッションの変更を取り込んだ内容になる
+        self.assertEqual(second.get_password("service-0001")[2], "first")
+        self.assertEqual(load_passwords(MASTER_PASSWORD, VaultJournal())["service-0001"].password, "first")
+
+    def test_independent_changes_are_merged(self):
+        first, second = self.open_model(), self.open_model()
+        first.add_password("mail", "user", "secret")
+        second.update_password("service-0002", "service-0002", "user", "changed")
+        second.delete_password("service-0003")
+        self.assertEqual(second.get_password("mail")[2], "secret")
+        first.refresh()
+        self.assertEqual(first.get_password("service-0002")[2], "changed")
+        self.assertEqual(first.get_password("service-0003"), (None, None, None))
+
+        expected = plain_passwords(make_passwords(5))
+        expected["mail"] = ("user", "secret")
+        expected["service-0002"] = ("user", "changed")
+        del expected["service-0003"]
+        self.assertEqual(plain_passwords(load_passwords(MASTER_PASSWORD, VaultJournal())), expected)
+
+    def test_refresh_picks_up_a_rewritten_vault(self):
+        model = self.open_model()
+        # 他のセッションがパスワードファイル全体を書き直した場合
+        journal = VaultJournal()
+        passwords = load_passwords(MASTER_PASSWORD, journal)
+        passwords["service-0004"].set_password("rewritten")
+        save_passwords(passwords, MASTER_PASSWORD, journal)
+        model.refresh()
+        self.assertEqual(model.get_password("service-0004")[2], "rewritten")
+
+    def test_conflicting_background_save_is_reported(self):
+        first = self.open_model()
+        second = self.open_model(background_save=True)
+        second.update_password("service-0001", "service-0001", "user", "second")
+        first.update_password("service-0001", "service-0001", "user", "first")
+        second.flush()
+        errors = second.take_save_errors()
+        self.assertEqual(len(errors), 1)
+        self.assertIn("service-0001", errors[0])
+        self.assertEqual(second.get_password("service-0001")[2], "first")
+        self.assertEqual(load_passwords(MASTER_PASSWORD, VaultJournal())["service-0001"].password, "first")
+
+    def test_background_save_writes_changes(self):
+        model = self.open_model(background_save=True)
+        for i in range(20):
+            model.add_password(f"bulk-{i}", "user", f"secret-{i}")
+        model.flush()
+        self.assertEqual(model.take_save_errors(), [])
+        loaded = load_passwords(MASTER_PASSWORD, VaultJournal())
+        self.assertEqual(loaded["bulk-19"].password, "secret-19")
+        self.assertEqual(len(loaded), 25)
+
+if __name__ == "__main__":
+    unittest.main()
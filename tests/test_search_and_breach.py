@@ -0,0 +1,96 @@
+import hashlib
+import os
+import shutil
+import tempfile
+import unittest
+
+from pwd_gen_tool.model.breach_checker import BreachChecker, password_hash
+from pwd_gen_tool.model.search_index import (
+    SCORE_ACCOUNT, SCORE_EXACT, SCORE_PREFIX, SCORE_SUBSEQUENCE, SCORE_SUBSTRING, SCORE_TYPO, SCORE_WORD,
+    SearchIndex,
+)
+
+class SearchIndexTest(unittest.TestCase):
+    def setUp(self):
+        self.index = SearchIndex()
+        for service_name, account_id in [
+            ("github", "octocat"), ("gitlab", "dev"), ("my github enterprise", "corp"),
+            ("amazon", "shopper@example.com"), ("Amazon Web Services", "admin"), ("銀行", "taro"),
+        ]:
+            self.index.add(service_name, account_id)
+
+    def test_ranking_order(self):
+        results = self.index.search_ranked("github", 10)
+        self.assertEqual(results[:2], [(SCORE_EXACT, "github"), (SCORE_WORD, "my github enterprise")])
+
+        results = self.index.search_ranked("git", 10)
+        self.assertEqual(results[:2], [(SCORE_PREFIX, "github"), (SCORE_PREFIX, "gitlab")])
+
+        results = dict((name, score) for score, name in self.index.search_ranked("web", 10))
+        self.assertEqual(results["Amazon Web Services"], SCORE_WORD)
+        self.assertEqual(dict((name, score) for score, name in self.index.search_ranked("example", 10)),
+                         {"amazon": SCORE_ACCOUNT})
+        self.assertIn((SCORE_SUBSTRING, "gitlab"), self.index.search_ranked("tla", 10))
+
+    def test_case_insensitive_and_japanese(self):
+        self.assertEqual(self.index.search_ranked("AMAZON", 1), [(SCORE_EXACT, "amazon")])
+        self.assertEqual(self.index.search_ranked("銀", 1), [(SCORE_PREFIX, "銀行")])
+
+    def test_typos_and_abbreviations(self):
+        self.assertEqual(self.index.search_ranked("gitlub", 10), [(SCORE_TYPO, "gitlab")])
+        self.assertEqual(self.index.search_ranked("ginhub", 1), [(SCORE_TYPO, "github")])
+        self.assertEqual(self.index.search_ranked("githb", 1), [(SCORE_SUBSEQUENCE, "github")])
+        # 単語の先頭の文字を並べた略語は、空白を挟むため一致度が下がる
+        self.assertEqual(self.index.search_ranked("aws", 10), [(SCORE_SUBSEQUENCE - 10, "Amazon Web Services")])
+
+    def test_limit_and_updates(self):
+        self.assertEqual(len(self.index.search_ranked("a", 2)), 2)
+        self.assertEqual(self.index.search_ranked("gitlab", 1), [(SCORE_EXACT, "gitlab")])
+        self.index.remove("gitlab")
+        self.assertNotIn("gitlab", [name for _, name in self.index.search_ranked("gitlab", 10)])
+        self.index.add("gitlab", "dev")
+        self.assertEqual(self.index.search_ranked("gitlab", 1), [(SCORE_EXACT, "gitlab")])
+        self.assertEqual(self.index.search("hub"), {"github", "my github enterprise"})
+
+class BreachCheckerTest(unittest.TestCase):
+    PASSWORDS = {"password": 100, "123456": 200, "パスワード": 3}
+
+    def setUp(self):
+        self.work_dir = tempfile.mkdtemp(prefix="pwd_gen_tool_test_")
+        self.addCleanup(shutil.rmtree, self.work_dir, True)
+        self.path = os.path.join(self.work_dir, "pwned.txt")
+        # 照合対象以外の行も含め、ハッシュ値の順に並べた一覧を作る
+        lines = {password_hash(password).decode('ascii'): count for password, count in self.PASSWORDS.items()}
+        for i in range(2000):
+            lines[hashlib.sha1(b"filler %d" % i).hexdigest().upper()] = i + 1
+        with open(self.path, 'w', newline='\r\n') as f:
+            f.writelines(f"{digest}:{count}\n" for digest, count in sorted(lines.items()))
+
+    def test_count(self):
+        with BreachChecker(self.path) as checker:
+            for password, count in self.PASSWORDS.items():
+                with self.subTest(password=password):
+                    self.assertEqual(checker.count(password), count)
+            self.assertEqual(checker.count("not-breached-password"), 0)
+            self.assertEqual(checker.count("パスワード".encode('utf-8')), 3)
+
+    def test_count_hashes(self):
+        digests = [password_hash(password) for password in ("123456", "unknown", "password")]
+        with BreachChecker(self.path) as checker:
+            self.assertEqual(checker.count_hashes(digests), [200, 0, 100])
+
+    def test_invalid_files_are_rejected(self):
+        empty = os.path.join(self.work_dir, "empty.txt")
+        open(empty, 'w').close()
+        with self.assertRaises(ValueError):
+            BreachChecker(empty)
+        other = os.path.join(self.work_dir, "other.txt")
+        with open(other, 'w') as f:
+            f.write("not a hash list\n")
+        with self.assertRaises(ValueError):
+            BreachChecker(other)
+        with self.assertRaises(FileNotFoundError):
+            BreachChecker(os.path.join(self.work_dir, "missing.txt"))
+
+if __name__ == "__main__":
+    unittest.main()